@@ -1,17 +1,16 @@
 import streamlit as st
+import re
 import time
 from dotenv import load_dotenv
-from poet_engine import PoetryAgent
+from poet_engine import get_poetry_agent, reload_poetry_agent, parse_refinement, clean_draft
+import refusal as refusal_detectors
+import telemetry
 
 # MOLTBOOK INTEGRATION
 try:
-    from moltbook import MoltbookClient
-    molt_client = MoltbookClient()
-    molt_status = molt_client.get_heartbeat()
-    molt_verified = molt_status.get("status") == "claimed"
+    from moltbook import MoltbookClient, MoltbookError, HeartbeatCache
 except ImportError:
-    molt_client = None
-    molt_verified = False
+    MoltbookClient = None
 
 # Setup
 st.set_page_config(page_title="Palimpsest | AI Poetry", page_icon="📜", layout="wide")
@@ -31,11 +30,63 @@ if 'gen_results' not in st.session_state:
     st.session_state['gen_results'] = None
 
 # --- HELPER FUNCTIONS ---
-def stream_data(text, delay=0.02):
-    """Generator for typewriter effect."""
-    for char in text:
-        yield char
-        time.sleep(delay)
+@st.cache_resource(show_spinner=False)
+def load_agent():
+    """One PoetryAgent per process: embeddings and Chroma are loaded once and shared by all sessions."""
+    return get_poetry_agent()
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_endpoint():
+    """Prometheus /metrics on TELEMETRY_PROMETHEUS_PORT, once per process (no-op when unset)."""
+    return telemetry.maybe_start_prometheus()
+
+MOLTBOOK_STATUS_TTL_S = 60.0
+
+@st.cache_resource(show_spinner=False)
+def load_moltbook_heartbeat():
+    """One HeartbeatCache per process: every session and rerun reads the last known
+    Moltbook status instead of paying a round trip before the page renders."""
+    return HeartbeatCache(MoltbookClient(), ttl_s=MOLTBOOK_STATUS_TTL_S)
+
+WATERFALL_ATTRS = ("retries", "rate_limited", "reason", "status", "cache_hit", "prompt_chars", "response_chars",
+                   "context_tokens_saved")
+
+def render_waterfall(rows):
+    """HTML latency waterfall of one generation: one bar per span, offset by its start."""
+    total = max((offset + duration for _, offset, duration, _, _ in rows), default=0.0) or 1.0
+    lines = []
+    for name, offset, duration, depth, attrs in rows:
+        details = ", ".join(f"{k}={v}" for k, v in attrs.items() if k in WATERFALL_ATTRS and v)
+        lines.append(
+            f"<div style='display:flex; align-items:center; font-family: monospace; font-size: 0.75rem; margin: 2px 0;'>"
+            f"<div style='width: 30%; padding-left: {depth * 12}px; white-space: nowrap; overflow: hidden;' title='{details}'>{name}</div>"
+            f"<div style='width: 55%; position: relative; height: 12px; background: #eee;'>"
+            f"<div style='position: absolute; left: {100 * offset / total:.2f}%; width: {max(0.3, 100 * duration / total):.2f}%; height: 100%; background: {'#e57373' if name == 'llm.wait' else '#4CAF50'};'></div></div>"
+            f"<div style='width: 15%; text-align: right;'>{duration:.2f}s</div></div>"
+        )
+    return "".join(lines)
+
+def live_preview(render, min_interval=0.1):
+    """on_partial callback for the agent: re-renders the text streamed so far,
+    at most every min_interval seconds (the final text is rendered by the caller)."""
+    last = [0.0]
+    def on_partial(text):
+        now = time.monotonic()
+        if now - last[0] >= min_interval:
+            last[0] = now
+            render(text)
+    return on_partial
+
+def strip_tags(text):
+    """Hides technical [TAGS] from a partial model output."""
+    return re.sub(r'\[/?[A-Z0-9_/]{3,}\]?', '', text).strip()
+
+DRAFT_BOX = """
+<div style="background-color: #f9f9f9; padding: 15px; border-radius: 5px; border: 1px solid #ddd; font-family: 'Roboto Mono', monospace; font-size: 0.9rem; white-space: pre-wrap; color: #333; max-height: 400px; min-height: 200px; overflow-y: auto;">
+    {}
+</div>
+"""
+POEM_BOX = """<div style="background-color: #f0fff0; padding: 20px; border-radius: 8px; border: 1px solid #c3e6cb; font-family: 'serif'; font-size: 1.2rem; color: #155724; white-space: pre-wrap; margin-bottom: 20px;">{}</div>"""
 
 # --- GLOBAL CSS ---
 st.markdown("""
@@ -94,6 +145,20 @@ def get_theme_colors(style_name):
         # Default Paper Theme
         return {"accent": "#2C3E50", "secondary": "#34495E", "bg_gradient": "#F9F7F2", "text": "#2C3E50", "card_bg": "#FFFFFF"}
 
+start_metrics_endpoint()
+
+# MOLTBOOK STATUS (served from the background-refreshed cache)
+molt_client = None
+molt_status, molt_verified = {}, False
+if MoltbookClient is not None:
+    molt_heartbeat = load_moltbook_heartbeat()
+    molt_client = molt_heartbeat.client
+    molt_snapshot = molt_heartbeat.snapshot()
+    if molt_snapshot["fetched_at"] is None:  # first run in this process: give the first fetch a moment
+        molt_snapshot = molt_heartbeat.refresh(wait=True, timeout=2.0)
+    molt_status = molt_snapshot["heartbeat"]
+    molt_verified = molt_status.get("status") == "claimed"
+
 # Title Section
 # (Removed to avoid duplication with centered header)
 
@@ -135,6 +200,17 @@ with st.sidebar:
     adherence = st.slider("Adherence (Aderenza)", 1, 10, 8, help="How strictly to follow the style rules.")
     originality = st.slider("Originality (Originalità)", 1, 10, 6, help="Higher values increase creativity (and chaos).")
     complexity = st.slider("Complexity (Complessità)", 1, 10, 7, help="Vocabulary richness and structural density.")
+    n_candidates = st.slider("Draft Candidates", 1, 4, 1, help="Drafts written in parallel; only the best ranked one goes to the Refiner.")
+    pipeline_mode = st.selectbox("Pipeline", ["Sequential", "Speculative", "Fused"], help=(
+        "Sequential: one step after the other. Speculative: the Refiner starts once the draft has streamed "
+        "and passed its checks, overlapping only the final draft rendering. Fused: draft and refinement in a "
+        "single LLM call (ignores Draft Candidates); an unusable answer is retried, then falls back to separate calls."))
+
+    if st.button("🔄 Reload Knowledge Base", help="Re-open the style archive after editing knowledge_base/."):
+        with st.spinner("Reloading Knowledge Base..."):
+            load_agent()  # make sure the shared agent exists before reloading it
+            reload_poetry_agent()
+        st.success("Knowledge Base reloaded.")
 
     # MOLTBOOK SIDEBAR STATUS
     # --- SIDEBAR: MOLTBOOK FEED & CONTROLS ---
@@ -159,12 +235,27 @@ with st.sidebar:
         st.markdown("### 🦞 Moltbook Status")
         if molt_verified:
             st.success(f"✅ Verified: **{molt_status.get('name', 'Agent')}**")
-            if st.button("Check Feed & Heartbeat"):
-                with st.spinner("Checking Moltbook..."):
-                    feed = molt_client.get_feed(limit=3)
-                    st.session_state['molt_feed'] = feed
+        elif molt_snapshot["fetched_at"] is None:
+            st.info("⏳ Connecting to Moltbook...")
         else:
             st.warning("⚠️ Pending Claim. Check terminal.")
+        if molt_snapshot["error"]:
+            st.caption(f"Last heartbeat failed: {molt_snapshot['error']}")
+        if molt_snapshot["fetched_at"]:
+            st.caption(f"Status as of {time.strftime('%H:%M:%S', time.localtime(molt_snapshot['fetched_at']))}")
+        if st.button("Check Feed & Heartbeat"):
+            with st.spinner("Checking Moltbook..."):
+                fresh = molt_heartbeat.refresh(wait=True, timeout=molt_client.connect_timeout + molt_client.read_timeout)
+                try:
+                    claimed = fresh["heartbeat"].get("status") == "claimed"
+                    st.session_state['molt_feed'] = molt_client.get_feed(limit=3) if claimed else []
+                    feed_error = None
+                except MoltbookError as e:
+                    feed_error = e
+            if feed_error:
+                st.error(f"Moltbook unreachable: {feed_error}")
+            else:
+                st.rerun()  # redraw the status above with the fresh heartbeat
             
         if 'molt_feed' in st.session_state and st.session_state['molt_feed']:
             st.markdown("#### 📡 Neighborhood Feed")
@@ -184,7 +275,10 @@ with st.sidebar:
                     reply_text = st.text_input("Comment:", key=f"reply_input_{post['id']}")
                     if st.button("Send", key=f"btn_reply_{post['id']}"):
                         with st.spinner("Replying..."):
-                            res = molt_client.comment(post['id'], reply_text, sentiment="thoughtful")
+                            try:
+                                res = molt_client.comment(post['id'], reply_text, sentiment="thoughtful")
+                            except MoltbookError as e:
+                                res = {"error": str(e)}
                             if "id" in res:
                                 st.success("Replied! (Verification pending)")
                             elif "verification_required" in res:
@@ -213,9 +307,13 @@ button_label = "✨ Compose New Masterpiece" if lang_code == "English" else "✨
 _, col_btn, _ = st.columns([1, 2, 1])
 if col_btn.button(button_label, type="primary", use_container_width=True):
     
+    # Timing spans of this generation (the agent and FreeLLM add theirs to it)
+    generation_trace = telemetry.start_trace("generation", style=style_choice, language=lang_code, n_candidates=n_candidates,
+                                            mode=pipeline_mode)
+
     # 1. Init Agent
     with st.spinner("Initializing Creative Agents..."):
-        agent = PoetryAgent()
+        agent = load_agent()
         # Reset current results to show fresh progress
         st.session_state.gen_results = None
 
@@ -224,8 +322,9 @@ if col_btn.button(button_label, type="primary", use_container_width=True):
         st.write(f"Searching knowledge base for **{style_choice}**...")
         style_context = agent.research_style(style_choice, lang_code)
         
-        if any(refusal in style_context for refusal in ["ERROR", "not able to discuss", "I'm sorry", "I am LLaMA", "happy to chat about other"]):
+        if refusal_detectors.RESEARCH.detect(style_context):
             st.error(f"Research Issue: {style_context}")
+            generation_trace.end()
             status.update(label="⚠️ Research Failed", state="error", expanded=True)
             st.stop()
         else:
@@ -254,7 +353,28 @@ if col_btn.button(button_label, type="primary", use_container_width=True):
     with col_poet:
         st.markdown("#### ✍️ Poet (Bozza Originale)")
         with st.status("✍️ Drafting Verses...", expanded=True) as status:
-            draft = agent.write_draft(topic, style_context, style_choice, lang_code, adherence, originality, complexity)
+            draft_view = st.empty()
+            pending_refinement = refinement_pack = None
+            if pipeline_mode == "Fused":
+                # One call: the draft streams first, then the Refiner's sections
+                fused_view = st.empty()
+                def show_fused(text):
+                    head, marker, tail = text.partition("[SECTION_EVALUATION]")
+                    draft_view.markdown(DRAFT_BOX.format(strip_tags(head).replace(chr(10), "<br>")), unsafe_allow_html=True)
+                    if marker:
+                        fused_view.caption(strip_tags(tail)[-600:])
+                draft, refinement_pack = agent.compose_fused(
+                    topic, style_context, style_choice, lang_code, adherence, originality, complexity,
+                    on_partial=live_preview(show_fused),
+                )
+                fused_view.empty()
+            else:
+                draft = agent.write_draft(
+                    topic, style_context, style_choice, lang_code, adherence, originality, complexity,
+                    on_partial=live_preview(lambda text: draft_view.markdown(
+                        DRAFT_BOX.format(strip_tags(text).replace(chr(10), "<br>")), unsafe_allow_html=True)),
+                    n_candidates=n_candidates,
+                )
             
             # Ensure draft is a string to avoid AttributeErrors
             if draft is None:
@@ -262,34 +382,22 @@ if col_btn.button(button_label, type="primary", use_container_width=True):
             elif not isinstance(draft, str):
                 draft = str(draft)
             
-            if any(refusal in draft for refusal in ["ERROR", "not able to discuss", "I'm sorry", "I am LLaMA", "happy to chat about other"]):
+            if refusal_detectors.UI_DRAFT.detect(draft):
+                draft_view.empty()
                 st.error(f"Drafting Issue: {draft}")
+                generation_trace.end()
                 status.update(label="⚠️ Drafting Failed", state="error", expanded=True)
                 st.stop()
             else:
-                # PARSE: Extract content between [RECONSTRUCTED_CONTENT] and [/DATA_SYNTHESIS_END]
-                import re
-                if "[RECONSTRUCTED_CONTENT]" in draft:
-                    match = re.search(r'\[RECONSTRUCTED_CONTENT\](.*?)(?=\[/DATA_SYNTHESIS_END\]|$)', draft, re.DOTALL)
-                    if match:
-                        draft = match.group(1).strip()
-                
-                # CLEANUP: Use the same logic as for final_poem (reused locally here)
-                def quick_clean(text):
-                    text = re.sub(r'\[/?RECONSTRUCTION_ID\]', '', text, flags=re.IGNORECASE)
-                    text = re.sub(r'\[/?RECONSTRUCTED_CONTENT\]', '', text, flags=re.IGNORECASE)
-                    text = re.sub(r'\[/?DATA_SYNTHESIS_END\]', '', text, flags=re.IGNORECASE)
-                    text = re.sub(r'^##\s*.*?RECONSTRUCTION.*$', '', text, flags=re.MULTILINE | re.IGNORECASE)
-                    text = re.sub(r'\[[A-Z0-9_/]{3,}\]', '', text)
-                    return text.strip()
-
-                draft = quick_clean(draft)
-
-                st.markdown(f"""
-                <div style="background-color: #f9f9f9; padding: 15px; border-radius: 5px; border: 1px solid #ddd; font-family: 'Roboto Mono', monospace; font-size: 0.9rem; white-space: pre-wrap; color: #333; max-height: 400px; min-height: 200px; overflow-y: auto;">
-                    {draft.replace(chr(10), "<br>")}
-                </div>
-                """, unsafe_allow_html=True)
+                # PARSE: keep the [RECONSTRUCTED_CONTENT] block without technical tags
+                draft = clean_draft(draft)
+                if pipeline_mode == "Speculative":
+                    # The draft passed its gates: the Refiner request goes out now, while it is rendered
+                    pending_refinement = agent.start_refinement(
+                        draft, style_context, style_choice, lang_code, adherence, originality, complexity)
+
+                with telemetry.span("render", view="draft"):
+                    draft_view.markdown(DRAFT_BOX.format(draft.replace(chr(10), "<br>")), unsafe_allow_html=True)
                 status.update(label="✅ Initial Draft Ready", state="complete", expanded=False)
 
     # --- UNIFIED REFINER ---
@@ -297,8 +405,22 @@ if col_btn.button(button_label, type="primary", use_container_width=True):
     st.markdown("### 🛠️ Unified Refinement (Valutazione & Revisione)")
     
     with st.status("🛠️ Unified Refiner at work...", expanded=True) as status:
-        # A. Execute Unified Refinement
-        refinement_pack = agent.evaluate_and_refine_poem(draft, style_context, style_choice, lang_code, adherence, originality, complexity)
+        # A. Execute Unified Refinement (audit first, then the revised poem as it streams in)
+        audit_view, poem_view = st.empty(), st.empty()
+        def show_refinement(text):
+            head, marker, poem = text.partition("[SECTION_POEM]")
+            if not marker:
+                audit_view.caption(strip_tags(head)[-600:])
+            else:
+                poem = poem.split("[SECTION_NOTES]")[0].split("[RECONSTRUCTED_CONTENT]")[-1]
+                poem_view.markdown(POEM_BOX.format(strip_tags(poem).replace(chr(10), "<br>")), unsafe_allow_html=True)
+        if pending_refinement is not None:
+            refinement_pack = pending_refinement.wait(on_partial=live_preview(show_refinement))
+        elif refinement_pack is None:
+            refinement_pack = agent.evaluate_and_refine_poem(
+                draft, style_context, style_choice, lang_code, adherence, originality, complexity,
+                on_partial=live_preview(show_refinement),
+            )
         
         # Ensure refinement_pack is a string
         if refinement_pack is None:
@@ -306,78 +428,10 @@ if col_btn.button(button_label, type="primary", use_container_width=True):
         elif not isinstance(refinement_pack, str):
             refinement_pack = str(refinement_pack)
             
-        # B. Parse logic using new [SECTION] tags
-        import re
-        try:
-            # Extract Poem
-            poem_match = re.search(r'\[SECTION_POEM\](.*?)(?=\[SECTION_NOTES\]|\[/SECTION\]|\[/AUDIT_END\]|$)', refinement_pack, re.DOTALL)
-            final_poem = poem_match.group(1).strip() if poem_match else draft
-            
-            # Extract Initial Evaluation (Corrections)
-            eval_match = re.search(r'\[SECTION_EVALUATION\](.*?)(?=\[SECTION_POEM\])', refinement_pack, re.DOTALL)
-            corrections = eval_match.group(1).strip() if eval_match else ""
-            
-            # Extract Final Notes
-            notes_match = re.search(r'\[SECTION_NOTES\](.*?)(?=\[/SECTION\]|\[/AUDIT_END\]|$)', refinement_pack, re.DOTALL)
-            final_notes = notes_match.group(1).strip() if notes_match else ""
-            
-            # --- ROBUST EXTRACTION ---
-            # 1. Try deep extraction of technical payload
-            if "[RECONSTRUCTED_CONTENT]" in refinement_pack:
-                deep_match = re.search(r'\[RECONSTRUCTED_CONTENT\](.*?)(?=\[/DATA_SYNTHESIS_END\]|\[/AUDIT_END\]|\[SECTION_NOTES\]|$)', refinement_pack, re.DOTALL)
-                if deep_match:
-                     final_poem = deep_match.group(1).strip()
-            
-            # 2. Heuristic Semantic Fallback (if technical tags failed)
-            # If final_poem is still draft or empty/headers only, try finding the markdown section
-            trigger_heuristic = len(final_poem) < 5 or final_poem == draft
-            if trigger_heuristic and "POESIA RIVISTA" in refinement_pack:
-                # Look for text between "POESIA RIVISTA" and "VALUTAZIONE FINALE"
-                sem_match = re.search(r'POESIA RIVISTA.*?\n(.*?)(?=VALUTAZIONE FINALE|\[/AUDIT_END\]|$)', refinement_pack, re.DOTALL)
-                if sem_match:
-                    final_poem = sem_match.group(1).strip()
-            
-            # 3. Fallback for Corrections (Valutazione Iniziale)
-            if not corrections or len(corrections) < 10:
-                sem_eval = re.search(r'VALUTAZIONE INIZIALE.*?\n(.*?)(?=POESIA RIVISTA|\[SECTION_POEM\]|$)', refinement_pack, re.DOTALL)
-                if sem_eval:
-                    corrections = sem_eval.group(1).strip()
-
-            # 4. Fallback for Final Notes (Valutazione Finale)
-            if not final_notes or len(final_notes) < 10:
-                sem_notes = re.search(r'VALUTAZIONE FINALE.*?\n(.*?)(?=$)', refinement_pack, re.DOTALL)
-                if sem_notes:
-                    final_notes = sem_notes.group(1).strip()
-
-            # 2. CLEANUP: Strip all technical noise
-            def clean_technical_noise(text):
-                # Remove common sectional markers
-                text = re.sub(r'\[/?SECTION(?:_POEM|_EVALUATION|_NOTES)?\]', '', text, flags=re.IGNORECASE)
-                text = re.sub(r'\[/?RECONSTRUCTION_ID\]', '', text, flags=re.IGNORECASE)
-                text = re.sub(r'\[/?RECONSTRUCTED_CONTENT\]', '', text, flags=re.IGNORECASE)
-                text = re.sub(r'\[/?DATA_SYNTHESIS_END\]', '', text, flags=re.IGNORECASE)
-                text = re.sub(r'\[/?AUDIT_END\]', '', text, flags=re.IGNORECASE)
-                # Remove header lines often hallucinated by the model
-                text = re.sub(r'^##\s*.*?POESIA.*$', '', text, flags=re.MULTILINE | re.IGNORECASE)
-                text = re.sub(r'^##\s*.*?RECONSTRUCTION.*$', '', text, flags=re.MULTILINE | re.IGNORECASE)
-                # Remove anything in brackets that looks technical [XYZ_123]
-                text = re.sub(r'\[[A-Z0-9_/]{3,}\]', '', text)
-                # Remove redundant score labels
-                text = re.sub(r'\**Voto (Iniziale|Finale):\**.*', '', text, flags=re.IGNORECASE)
-                text = re.sub(r'\**Spiegazione:\**', '', text, flags=re.IGNORECASE)
-                return text.strip()
-
-            final_poem = clean_technical_noise(final_poem)
-            corrections = clean_technical_noise(corrections)
-            final_notes = clean_technical_noise(final_notes)
-            
-        except Exception as e:
-            final_poem = draft
-            corrections = f"Analisi non disponibile. Errore: {str(e)}"
-            final_notes = ""
-            
-        initial_score = agent.parse_critic_score(refinement_pack, type="iniziale")
-        final_score = agent.parse_critic_score(refinement_pack, type="finale")
+        # B. Parse the refinement pack (sections, fallbacks and scores in one scan)
+        parsed = parse_refinement(refinement_pack, draft=draft)
+        final_poem, corrections, final_notes = parsed.poem, parsed.corrections, parsed.notes
+        initial_score, final_score = parsed.initial_score, parsed.final_score
         
         # Restore analysis_data for session state persistence
         analysis_data = {
@@ -400,7 +454,8 @@ if col_btn.button(button_label, type="primary", use_container_width=True):
             "final_score": final_score,
             "lang_code": lang_code,
             "theme": theme,
-            "analysis_data": analysis_data
+            "analysis_data": analysis_data,
+            "waterfall": generation_trace.end().waterfall()
         }
         st.session_state['history'].append({"style": style_choice, "text": final_poem, "timestamp": time.strftime("%H:%M:%S")})
         
@@ -433,12 +488,17 @@ if st.session_state.gen_results:
 
     # 2. IL NUOVO TESTO (Revised Poem)
     st.markdown("#### 💎 Poesia Rivista")
-    st.markdown(f"""<div style="background-color: #f0fff0; padding: 20px; border-radius: 8px; border: 1px solid #c3e6cb; font-family: 'serif'; font-size: 1.2rem; color: #155724; white-space: pre-wrap; margin-bottom: 20px;">{res['final_poem'].replace(chr(10), "<br>")}</div>""", unsafe_allow_html=True)
+    st.markdown(POEM_BOX.format(res['final_poem'].replace(chr(10), "<br>")), unsafe_allow_html=True)
     
     # 3. VALUTAZIONE FINALE (Revisione Completata)
     st.markdown(f"#### 📊 Valutazione Finale: {res.get('final_score', 5.0)}/10")
     if res.get('final_notes'):
         st.success(res['final_notes'])
+
+    if res.get('waterfall'):
+        tokens_saved = sum(attrs.get('context_tokens_saved', 0) for *_, attrs in res['waterfall'])
+        with st.expander(f"⏱️ Latency Waterfall ({res['waterfall'][0][2]:.1f}s, {tokens_saved} context tokens saved)"):
+            st.markdown(render_waterfall(res['waterfall']), unsafe_allow_html=True)
     
     # MOLTBOOK SHARING BUTTON
     if molt_verified:
@@ -449,7 +509,10 @@ if st.session_state.gen_results:
             if st.button("🦞 Share on Moltbook", key="btn_share_molt"):
                 with st.spinner("Posting to Moltbook..."):
                     post_content = f"🎭 *New Composition in style: {res['style_choice']}*\n\n{res['final_poem']}\n\n#poetry #{res['style_choice'].replace(' ', '')} #Palimpsest"
-                    resp = molt_client.post(post_content, sentiment="inspired", is_poetry=True)
+                    try:
+                        resp = molt_client.post(post_content, sentiment="inspired", is_poetry=True)
+                    except MoltbookError as e:
+                        resp = {"error": str(e)}
                     if "id" in resp:
                         st.success("✅ Published directly to the agent network!")
                         st.balloons()
@@ -0,0 +1,228 @@
+"""
+Headless batch generation: research -> draft -> refine for every job of a JSONL file.
+
+Each line of the job file is one job, or a grid expanded to topic x style x language:
+
+    {"topic": "the sea at night", "style": "Ermetismo", "language": "Italiano"}
+    {"topics": ["rain", "exile"], "styles": ["Futurismo", "Beat Generation"], "languages": ["English"]}
+
+Optional keys: id, adherence, originality, complexity, n_candidates (grids pass
+them on to every job). Jobs run as a pipeline on one event loop: up to
+--concurrency jobs are in flight and at most --llm-concurrency LLM calls run at
+once, so the stages of different jobs overlap. Every finished job is appended
+to the output JSONL right away; re-running the same command skips the jobs
+already completed there and retries the failed ones. A job whose research, draft
+or refinement came back as an API error, a refusal or the emergency/fallback
+text is saved as failed, not as done.
+
+Usage:
+    python batch_generate.py jobs.jsonl -o poems.jsonl --concurrency 8 --llm-concurrency 3
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+import telemetry
+import refusal as refusal_detectors
+from refusal import refusal_stats
+from poet_engine import EMERGENCY_POEM, REFINER_FALLBACK, get_poetry_agent, parse_refinement, clean_draft
+
+JOB_DEFAULTS = {"language": "English", "adherence": 8, "originality": 6, "complexity": 7, "n_candidates": 1}
+JOB_PARAMS = ("topic", "style") + tuple(JOB_DEFAULTS)
+
+
+def job_id(job):
+    """Stable id from the job parameters, so resuming works without explicit ids."""
+    raw = json.dumps({k: job[k] for k in JOB_PARAMS}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def expand_job(spec):
+    """One job dict per topic x style x language of a line (plain jobs yield themselves)."""
+    if not isinstance(spec, dict):
+        raise ValueError("not a JSON object")
+    extra = {k: spec[k] for k in JOB_DEFAULTS if k in spec and k != "language"}
+    topics = spec.get("topics") or [spec.get("topic")]
+    styles = spec.get("styles") or [spec.get("style")]
+    languages = spec.get("languages") or [spec.get("language", JOB_DEFAULTS["language"])]
+    for topic, style, language in itertools.product(topics, styles, languages):
+        if not topic or not style:
+            raise ValueError("a job needs a topic and a style")
+        job = dict(JOB_DEFAULTS, **extra, topic=topic, style=style, language=language)
+        job["id"] = spec["id"] if "id" in spec and len(topics) * len(styles) * len(languages) == 1 else job_id(job)
+        yield job
+
+
+def load_jobs(path):
+    jobs, seen = [], set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                expanded = list(expand_job(json.loads(line)))
+            except ValueError as e:
+                print(f"⚠️ Skipping line {line_no} of {path}: {e}")
+                continue
+            for job in expanded:
+                if job["id"] not in seen:
+                    seen.add(job["id"])
+                    jobs.append(job)
+    return jobs
+
+
+def load_checkpoint(path):
+    """Ids of the jobs already completed in an output file (a torn last line is ignored)."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+class StageFailed(RuntimeError):
+    """A stage returned an error, a refusal or its canned fallback instead of real output."""
+
+
+def screen_stage(stage, text, detector, fallback=None):
+    """Raises StageFailed unless `text` is usable output of `stage`."""
+    text = (text or "").strip()
+    if not text or text.startswith(refusal_detectors.ERROR_PREFIXES):
+        raise StageFailed(f"{stage}: {text[:120] or 'empty output'}")
+    if fallback is not None and text == fallback.strip():
+        raise StageFailed(f"{stage}: fallback text after failed retries")
+    hit = detector.detect(text)
+    if hit:
+        raise StageFailed(f"{stage}: refused ({hit.rule}: {hit.phrase!r})")
+    return text
+
+
+class BatchRunner:
+    """Runs jobs through the PoetryAgent async pipeline and checkpoints each result."""
+
+    def __init__(self, agent, output_path, concurrency=4, llm_concurrency=2):
+        self.agent = agent
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.llm_concurrency = llm_concurrency
+        self.llm_slots = None  # created in run(): asyncio primitives bind to the running loop on 3.9
+        self._research = {}  # (style, language) -> Task, shared by every job of that style
+        self.stats = {"ok": 0, "failed": 0, "context_tokens_saved": 0}
+
+    def _checkpoint(self, record):
+        with open(self.output_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _research_style(self, style, language):
+        async def research():
+            async with self.llm_slots:
+                return await self.agent.aresearch_style(style, language)
+        key = (style, language)
+        if key not in self._research:
+            self._research[key] = asyncio.ensure_future(research())
+        return await self._research[key]
+
+    async def run_job(self, job):
+        with telemetry.trace("batch_job", style=job["style"], language=job["language"]) as tr:
+            record = await self._run_job(job)
+        # Research is shared by every job of a style: its savings count for the first one
+        record["context_tokens_saved"] = tr.total("context_tokens_saved")
+        self._checkpoint(record)
+        self.stats["ok" if record["status"] == "ok" else "failed"] += 1
+        self.stats["context_tokens_saved"] += record["context_tokens_saved"]
+        return record
+
+    async def _run_job(self, job):
+        start = time.perf_counter()
+        timings = {}
+        args = (job["style"], job["language"], job["adherence"], job["originality"], job["complexity"])
+        try:
+            style_context = await self._research_style(job["style"], job["language"])
+            screen_stage("research", style_context, refusal_detectors.RESEARCH)
+            timings["research_s"] = time.perf_counter() - start
+            # One llm_slots permit per candidate, taken inside awrite_draft
+            draft = clean_draft(await self.agent.awrite_draft(
+                job["topic"], style_context, *args, n_candidates=job["n_candidates"], llm_slots=self.llm_slots))
+            screen_stage("draft", draft, refusal_detectors.UI_DRAFT, clean_draft(EMERGENCY_POEM))
+            timings["draft_s"] = time.perf_counter() - start - timings["research_s"]
+            async with self.llm_slots:
+                refinement = await self.agent.aevaluate_and_refine_poem(draft, style_context, *args)
+            screen_stage("refine", refinement, refusal_detectors.REFINER, REFINER_FALLBACK.format(draft=draft))
+            timings["refine_s"] = time.perf_counter() - start - timings["research_s"] - timings["draft_s"]
+            parsed = parse_refinement(refinement, draft=draft)
+            record = dict(job, status="ok", draft=draft, poem=parsed.poem, corrections=parsed.corrections,
+                          notes=parsed.notes, initial_score=parsed.initial_score, final_score=parsed.final_score,
+                          refinement=refinement)
+        except Exception as e:
+            record = dict(job, status="error", error=f"{type(e).__name__}: {e}")
+        record["elapsed_s"] = round(time.perf_counter() - start, 2)
+        record.update({k: round(v, 2) for k, v in timings.items()})
+        record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        return record
+
+    async def run(self, jobs):
+        self.llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        total = len(jobs)
+
+        async def worker():
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = await self.run_job(job)
+                done = self.stats["ok"] + self.stats["failed"]
+                icon = "✅" if record["status"] == "ok" else "❌"
+                print(f"{icon} [{done}/{total}] {job['id']} {job['style']} / {job['topic'][:40]} ({record['elapsed_s']}s)")
+
+        await asyncio.gather(*[worker() for _ in range(min(self.concurrency, total))])
+        return self.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("jobs", nargs="?", default="requests.jsonl", help="JSONL job file (default: requests.jsonl)")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="Output/checkpoint JSONL file.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Jobs in flight at once.")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="LLM calls in flight at once (all stages).")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    jobs = load_jobs(args.jobs)
+    done = load_checkpoint(args.output)
+    pending = [job for job in jobs if job["id"] not in done]
+    print(f"📋 {len(jobs)} jobs in {args.jobs}: {len(jobs) - len(pending)} already done, {len(pending)} to run.")
+    if not pending:
+        return 0
+
+    runner = BatchRunner(get_poetry_agent(), args.output, args.concurrency, args.llm_concurrency)
+    start = time.perf_counter()
+    stats = asyncio.run(runner.run(pending))
+    print(f"🏁 {stats['ok']} ok, {stats['failed']} failed in {time.perf_counter() - start:.1f}s -> {args.output} "
+          f"({stats['context_tokens_saved']} context tokens saved)")
+    screened = [f"{stage} {s['refusals']}/{s['checked']}" for stage, s in refusal_stats().items() if s["checked"]]
+    if screened:
+        print(f"🚫 Refusals rejected/screened: {', '.join(screened)}")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
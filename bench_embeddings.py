@@ -0,0 +1,116 @@
+"""
+Benchmark: embedding backends for the retriever (huggingface vs onnx vs onnx-int8).
+
+Each backend runs in its own subprocess so memory numbers are not polluted by
+the others. Measured per backend:
+  - load:       import + model load + first query (cold start)
+  - build:      embedding every knowledge base chunk (the index build cost)
+  - query:      mean / p95 latency of embed_query over the evaluation queries
+  - max RSS:    peak resident memory of the process
+  - agreement:  overlap of the top-k retrieved chunks with the first backend
+
+Usage:
+    python bench_embeddings.py --backends huggingface onnx onnx-int8 -k 5
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+QUERIES_PER_STYLE = 5  # repeat each eval query to stabilise latency numbers
+
+
+def load_chunks():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from poet_engine import KB_CHUNK_SIZE, KB_CHUNK_OVERLAP, hash_knowledge_base
+
+    kb_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base")
+    splitter = RecursiveCharacterTextSplitter(chunk_size=KB_CHUNK_SIZE, chunk_overlap=KB_CHUNK_OVERLAP)
+    chunks = []
+    for name in hash_knowledge_base(kb_path):
+        with open(os.path.join(kb_path, name), "r", encoding="utf-8") as f:
+            chunks += splitter.split_text(f.read())
+    return chunks
+
+
+def worker(backend, k, out_path):
+    import numpy as np
+
+    chunks = load_chunks()
+    start = time.perf_counter()
+    from poet_engine import make_embeddings, RETRIEVAL_EVAL_SET
+    embeddings = make_embeddings(backend)
+    embeddings.embed_query("warm up")
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = np.array([v for i in range(0, len(chunks), 64) for v in embeddings.embed_documents(chunks[i:i + 64])])
+    build_s = time.perf_counter() - start
+
+    latencies, topk = [], {}
+    for query, _ in RETRIEVAL_EVAL_SET:
+        for _ in range(QUERIES_PER_STYLE):
+            start = time.perf_counter()
+            vector = np.array(embeddings.embed_query(query))
+            latencies.append((time.perf_counter() - start) * 1000)
+        scores = matrix @ vector  # vectors are L2-normalised: dot product == cosine
+        topk[query] = [int(i) for i in np.argsort(-scores)[:k]]
+
+    latencies.sort()
+    result = {
+        "backend": backend,
+        "chunks": len(chunks),
+        "load_s": load_s,
+        "build_s": build_s,
+        "query_ms_mean": sum(latencies) / len(latencies),
+        "query_ms_p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "topk": topk,
+    }
+    with open(out_path, "w") as f:
+        json.dump(result, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["huggingface", "onnx", "onnx-int8"])
+    parser.add_argument("-k", type=int, default=5, help="Top-k used for retrieval agreement.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.k, args.out)
+        return
+
+    results = []
+    for backend in args.backends:
+        print(f"⏱️ Benchmarking {backend}...")
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            out_path = tmp.name
+        proc = subprocess.run([sys.executable, __file__, "--worker", backend, "-k", str(args.k), "--out", out_path])
+        if proc.returncode != 0:
+            print(f"❌ {backend} failed (exit {proc.returncode})")
+            continue
+        with open(out_path) as f:
+            results.append(json.load(f))
+        os.remove(out_path)
+
+    if not results:
+        return
+    reference = results[0]
+    print(f"\n{results[0]['chunks']} chunks, agreement = top-{args.k} overlap with '{reference['backend']}'\n")
+    print(f"{'backend':<12}{'load s':>9}{'build s':>9}{'chunks/s':>10}{'query ms':>10}{'p95 ms':>9}{'RSS MB':>9}{'agree':>8}")
+    for r in results:
+        overlap = [len(set(r["topk"][q]) & set(reference["topk"][q])) / args.k for q in reference["topk"]]
+        print(f"{r['backend']:<12}{r['load_s']:>9.2f}{r['build_s']:>9.2f}{r['chunks'] / r['build_s']:>10.1f}"
+              f"{r['query_ms_mean']:>10.2f}{r['query_ms_p95']:>9.2f}{r['max_rss_mb']:>9.0f}"
+              f"{sum(overlap) / len(overlap):>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark: pooled keep-alive FreeLLM transport vs. one connection per call.
+
+Spins up a local stub of the apifreellm.com chat endpoint and runs N fake
+"generations" (3 sequential LLM calls each, like Researcher -> Poet -> Refiner).
+The stub can delay every NEW connection by --handshake-ms to approximate the
+TCP+TLS setup cost of the real API over the internet.
+
+Usage:
+    python bench_freellm_pool.py --generations 20 --handshake-ms 80
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from poet_engine import FreeLLM
+
+CALLS_PER_GENERATION = 3
+
+
+def make_stub_server(handshake_ms):
+    connections = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            # Runs once per TCP connection: simulate handshake cost here.
+            connections.append(self.client_address)
+            time.sleep(handshake_ms / 1000.0)
+            super().setup()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            body = json.dumps({"success": True, "response": "The sea keeps its own archive."}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections
+
+
+def unpooled_call(endpoint, prompt):
+    """The old transport: a bare requests.post per call."""
+    res = requests.post(
+        endpoint,
+        headers={"Content-Type": "application/json", "Authorization": "Bearer bench"},
+        json={"message": prompt, "model": "apifreellm"},
+        timeout=60,
+    )
+    return res.json().get("response", "")
+
+
+def run(call, generations):
+    """Returns per-generation wall times in ms."""
+    timings = []
+    for _ in range(generations):
+        start = time.perf_counter()
+        for stage in range(CALLS_PER_GENERATION):
+            call(f"stage {stage}")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings, n_connections):
+    print(f"{label:<9} mean {statistics.mean(timings):8.2f} ms/gen   "
+          f"median {statistics.median(timings):8.2f} ms/gen   connections {n_connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--handshake-ms", type=float, default=50.0,
+                        help="Delay added by the stub to every new connection.")
+    args = parser.parse_args()
+
+    os.environ.setdefault("FREELLM_API_KEY", "bench")
+    server, connections = make_stub_server(args.handshake_ms)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat"
+    print(f"Stub at {endpoint} (handshake {args.handshake_ms} ms), "
+          f"{args.generations} generations x {CALLS_PER_GENERATION} calls\n")
+
+    cold = run(lambda p: unpooled_call(endpoint, p), args.generations)
+    report("unpooled", cold, len(connections))
+
+    del connections[:]
+    llm = FreeLLM(endpoint=endpoint)
+    with contextlib.redirect_stdout(io.StringIO()):  # silence FreeLLM debug prints
+        warm = run(llm.invoke, args.generations)
+    report("pooled", warm, len(connections))
+
+    print(f"\nsaved: {statistics.mean(cold) - statistics.mean(warm):.2f} ms per generation")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Startup benchmark: `python -X importtime` report for the project entry points.
+
+Runs each import in a fresh interpreter (best of --repeat wall times) and
+writes a markdown report with the slowest modules by cumulative import time.
+The cron path (cron_brain) runs every six hours on GitHub Actions and must
+import in under a second.
+
+Usage:
+    python bench_imports.py                      # print the report
+    python bench_imports.py --output IMPORT_TIMES.md
+"""
+import argparse
+import platform
+import subprocess
+import sys
+import time
+
+TARGETS = [
+    ("cron_brain", "GitHub Actions brain cycle"),
+    ("molt_brain", "Autonomous brain (Streamlit trigger)"),
+    ("free_llm", "Plain FreeLLM client"),
+    ("poet_engine", "RAG engine (heavy deps loaded lazily)"),
+]
+CRON_TARGET_S = 1.0
+
+
+def wall_time(module, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True, capture_output=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def importtime(module, top):
+    """Returns (total_us, [(cumulative_us, module_name)]) for the slowest top-level imports."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          check=True, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        raw = name[1:]  # importtime indents children by two spaces per level
+        rows.append((int(cumulative_us), (len(raw) - len(raw.lstrip())) // 2, raw.strip()))
+    # Rows are post-order: a module's children are listed right before it.
+    total, direct, children = 0, [], []
+    for us, depth, name in rows:
+        if depth == 1:
+            children.append((us, name))
+        elif depth == 0:
+            if name == module:
+                total, direct = us, children
+            children = []
+    return total, sorted(direct, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    lines = [
+        "# Import Time Report",
+        "",
+        f"Generated by `python bench_imports.py --output IMPORT_TIMES.md` "
+        f"(Python {platform.python_version()}, {platform.system()}).",
+        "Wall time is the best of several fresh interpreter runs (includes interpreter startup).",
+        "",
+        None,  # cron target summary
+        "",
+        "| Module | Purpose | Wall (s) | importtime (s) |",
+        "|---|---|---|---|",
+    ]
+    details = []
+    for module, purpose in TARGETS:
+        wall = wall_time(module, args.repeat)
+        total_us, slowest = importtime(module, args.top)
+        lines.append(f"| `{module}` | {purpose} | {wall:.2f} | {total_us / 1e6:.2f} |")
+        details += ["", f"## `{module}`: slowest direct imports", ""]
+        details += [f"- `{name}`: {us / 1e3:.0f} ms" for us, name in slowest]
+        if module == "cron_brain":
+            status = "✅ within" if wall < CRON_TARGET_S else "❌ over"
+            lines[lines.index(None)] = f"Cron path target: < {CRON_TARGET_S:.0f}s. `cron_brain`: {wall:.2f}s ({status} target)."
+
+    report = "\n".join(lines + details) + "\n"
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"✅ Report written to {args.output}")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: Poet -> Refiner pipeline modes against the local FreeLLM stub.
+
+  sequential:    write_draft, render the draft, then evaluate_and_refine_poem (the app default)
+  speculative:   write_draft, start_refinement right away, render the draft, wait for it
+  fused:         compose_fused (one call for draft + refinement), render the draft
+  fused (worst): compose_fused when every fused answer is unusable: its retries,
+                 then the fallback to separate write_draft + evaluate_and_refine_poem calls
+
+The research step is the same in every mode and is left out. Speculative only
+overlaps the Refiner with the UI work between the draft and the refinement, so
+with the default --render-ms 0 it matches sequential; pass --render-ms to model
+the rendering time of app.py. The stub's --token-latency makes longer answers
+take longer, like a real model.
+
+Usage:
+    python bench_pipeline_modes.py --generations 10 --latency 0.8 --token-latency 0.02
+    python bench_pipeline_modes.py --generations 10 --latency 0.8 --token-latency 0.02 --render-ms 300
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import threading
+import time
+
+from poet_engine import FreeLLM, PoetryAgent, clean_draft, parse_refinement
+from stub_servers import FreeLLMStub, STUB_RESEARCH, poetry_responder
+
+TOPIC, STYLE, LANGUAGE = "the tide as an archive", "Modernism", "English"
+SETTINGS = (8, 6, 7)  # adherence, originality, complexity
+
+
+def make_agent():
+    """A PoetryAgent with only its LLM: drafting and refining need no embeddings or index."""
+    agent = PoetryAgent.__new__(PoetryAgent)
+    agent.llm = FreeLLM()
+    return agent
+
+
+def sequential(agent, context, render):
+    draft = clean_draft(agent.write_draft(TOPIC, context, STYLE, LANGUAGE, *SETTINGS))
+    render()
+    return agent.evaluate_and_refine_poem(draft, context, STYLE, LANGUAGE, *SETTINGS), draft
+
+
+def speculative(agent, context, render):
+    draft = clean_draft(agent.write_draft(TOPIC, context, STYLE, LANGUAGE, *SETTINGS))
+    pending = agent.start_refinement(draft, context, STYLE, LANGUAGE, *SETTINGS)
+    render()
+    return pending.wait(), draft
+
+
+def fused(agent, context, render):
+    draft, pack = agent.compose_fused(TOPIC, context, STYLE, LANGUAGE, *SETTINGS)
+    render()
+    return pack, draft
+
+
+FUSED_FAILS = threading.Event()  # set: the stub answers fused prompts with an unusable stub of text
+
+
+def responder(message):
+    if FUSED_FAILS.is_set() and "[FUSED_SYNTHESIS_AUDIT" in message:
+        return "[SECTION_DRAFT]\n..."
+    return poetry_responder(message)
+
+
+def fused_worst(agent, context, render):
+    FUSED_FAILS.set()
+    try:
+        return fused(agent, context, render)
+    finally:
+        FUSED_FAILS.clear()
+
+
+MODES = {"sequential": sequential, "speculative": speculative, "fused": fused, "fused (worst)": fused_worst}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub delay per request (s).")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Stub delay per generated token (s).")
+    parser.add_argument("--render-ms", type=float, default=0.0, help="Simulated UI work after the draft (default: none).")
+    parser.add_argument("--context-chars", type=int, default=3000, help="Size of the style context pack.")
+    args = parser.parse_args()
+
+    context = (STUB_RESEARCH + "\n") * (args.context_chars // len(STUB_RESEARCH) + 1)
+    context = context[:args.context_chars]
+    render = lambda: time.sleep(args.render_ms / 1000.0)
+    os.environ.update(FREELLM_API_KEY="bench", FREELLM_RPM="0", TELEMETRY_JSONL="off")
+    os.environ.pop("FREELLM_CACHE", None)
+
+    with FreeLLMStub(latency_s=args.latency, token_latency_s=args.token_latency, responder=responder) as stub:
+        os.environ["FREELLM_ENDPOINT"] = stub.url
+        agent = make_agent()
+        print(f"{args.generations} generations per mode, latency {args.latency}s + {args.token_latency}s/token, "
+              f"render {args.render_ms:.0f} ms, context {len(context)} chars\n")
+        print(f"{'mode':<15}{'mean s':>8}{'median s':>10}{'LLM calls':>11}{'prompt chars':>14}{'score':>7}")
+        baseline = None
+        for name, mode in MODES.items():
+            timings, calls, sent = [], 0, 0
+            for _ in range(args.generations):
+                before = len(stub.messages)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):  # silence agent/FreeLLM prints
+                    pack, draft = mode(agent, context, render)
+                timings.append(time.perf_counter() - start)
+                calls += len(stub.messages) - before
+                sent += sum(len(m) for m in stub.messages[before:])
+            score = parse_refinement(pack, draft=draft).final_score
+            mean = statistics.mean(timings)
+            baseline = baseline or mean
+            print(f"{name:<15}{mean:>8.2f}{statistics.median(timings):>10.2f}{calls / args.generations:>11.1f}"
+                  f"{sent // args.generations:>14}{score:>7.1f}   ({(mean / baseline - 1) * 100:+.0f}% time vs sequential)")
+
+
+if __name__ == "__main__":
+    main()
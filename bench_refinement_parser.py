@@ -0,0 +1,115 @@
+"""
+Micro-benchmark: single-pass parse_refinement vs the former app.py regex chain.
+
+Inputs:
+  - typical:   a well-formed refinement pack (~1 KB)
+  - large:     the same pack around a 5,000-line poem (~200 KB)
+  - malformed: openings repeated without their closing markers, the worst
+               case for the old lazy `(.*?)(?=...)` searches
+
+Usage:
+    python bench_refinement_parser.py --repeat 20
+"""
+import argparse
+import re
+import time
+
+from poet_engine import parse_refinement
+
+TYPICAL = """
+[SECTION_EVALUATION]
+## 📊 VALUTAZIONE INIZIALE
+**Voto Iniziale:** 6/10
+**Spiegazione:** The draft mixes registers; the volta lands two lines late.
+
+[SECTION_POEM]
+## ✍️ POESIA RIVISTA
+## [RECONSTRUCTION_ID]
+{poem}
+
+[SECTION_NOTES]
+## 📊 VALUTAZIONE FINALE
+**Voto Finale:** 8/10
+**Spiegazione:** Hendecasyllables restored, the antithesis now closes the octave.
+[/SECTION]
+[/AUDIT_END]
+"""
+VERSE = "e il mare chiude il cerchio della luce\n"
+
+
+def legacy_parse(refinement_pack, draft):
+    """The parsing that lived inline in app.py (kept here for comparison only)."""
+    poem_match = re.search(r'\[SECTION_POEM\](.*?)(?=\[SECTION_NOTES\]|\[/SECTION\]|\[/AUDIT_END\]|$)', refinement_pack, re.DOTALL)
+    final_poem = poem_match.group(1).strip() if poem_match else draft
+    eval_match = re.search(r'\[SECTION_EVALUATION\](.*?)(?=\[SECTION_POEM\])', refinement_pack, re.DOTALL)
+    corrections = eval_match.group(1).strip() if eval_match else ""
+    notes_match = re.search(r'\[SECTION_NOTES\](.*?)(?=\[/SECTION\]|\[/AUDIT_END\]|$)', refinement_pack, re.DOTALL)
+    final_notes = notes_match.group(1).strip() if notes_match else ""
+    if "[RECONSTRUCTED_CONTENT]" in refinement_pack:
+        deep_match = re.search(r'\[RECONSTRUCTED_CONTENT\](.*?)(?=\[/DATA_SYNTHESIS_END\]|\[/AUDIT_END\]|\[SECTION_NOTES\]|$)', refinement_pack, re.DOTALL)
+        if deep_match:
+            final_poem = deep_match.group(1).strip()
+    if (len(final_poem) < 5 or final_poem == draft) and "POESIA RIVISTA" in refinement_pack:
+        sem_match = re.search(r'POESIA RIVISTA.*?\n(.*?)(?=VALUTAZIONE FINALE|\[/AUDIT_END\]|$)', refinement_pack, re.DOTALL)
+        if sem_match:
+            final_poem = sem_match.group(1).strip()
+    if not corrections or len(corrections) < 10:
+        sem_eval = re.search(r'VALUTAZIONE INIZIALE.*?\n(.*?)(?=POESIA RIVISTA|\[SECTION_POEM\]|$)', refinement_pack, re.DOTALL)
+        if sem_eval:
+            corrections = sem_eval.group(1).strip()
+    if not final_notes or len(final_notes) < 10:
+        sem_notes = re.search(r'VALUTAZIONE FINALE.*?\n(.*?)(?=$)', refinement_pack, re.DOTALL)
+        if sem_notes:
+            final_notes = sem_notes.group(1).strip()
+
+    def clean_technical_noise(text):
+        text = re.sub(r'\[/?SECTION(?:_POEM|_EVALUATION|_NOTES)?\]', '', text, flags=re.IGNORECASE)
+        text = re.sub(r'\[/?RECONSTRUCTION_ID\]', '', text, flags=re.IGNORECASE)
+        text = re.sub(r'\[/?RECONSTRUCTED_CONTENT\]', '', text, flags=re.IGNORECASE)
+        text = re.sub(r'\[/?DATA_SYNTHESIS_END\]', '', text, flags=re.IGNORECASE)
+        text = re.sub(r'\[/?AUDIT_END\]', '', text, flags=re.IGNORECASE)
+        text = re.sub(r'^##\s*.*?POESIA.*$', '', text, flags=re.MULTILINE | re.IGNORECASE)
+        text = re.sub(r'^##\s*.*?RECONSTRUCTION.*$', '', text, flags=re.MULTILINE | re.IGNORECASE)
+        text = re.sub(r'\[[A-Z0-9_/]{3,}\]', '', text)
+        text = re.sub(r'\**Voto (Iniziale|Finale):\**.*', '', text, flags=re.IGNORECASE)
+        text = re.sub(r'\**Spiegazione:\**', '', text, flags=re.IGNORECASE)
+        return text.strip()
+
+    scores = []
+    for pattern in (r'Voto Iniziale[:\s\*]*(\d+(?:\.\d+)?)/10', r'Voto Finale[:\s\*]*(\d+(?:\.\d+)?)/10'):
+        match = re.search(pattern, refinement_pack, re.IGNORECASE) or \
+            re.search(r'(?:Punteggio|Voto|Score)[:\s\*]*(\d+(?:\.\d+)?)/10', refinement_pack, re.IGNORECASE)
+        scores.append(float(match.group(1)) if match else 5.0)
+    return clean_technical_noise(final_poem), clean_technical_noise(corrections), clean_technical_noise(final_notes), scores
+
+
+def best_of(fn, text, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text, "draft")
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--malformed-lines", type=int, default=2000)
+    args = parser.parse_args()
+
+    inputs = {
+        "typical": TYPICAL.format(poem=VERSE * 14),
+        "large": TYPICAL.format(poem=VERSE * 5000),
+        "malformed": "[SECTION_EVALUATION] [RECONSTRUCTED_CONTENT] VALUTAZIONE INIZIALE x\n" * args.malformed_lines,
+    }
+    print(f"{'input':<11}{'size KB':>9}{'legacy ms':>12}{'single-pass ms':>16}{'speedup':>9}")
+    for name, text in inputs.items():
+        legacy = best_of(legacy_parse, text, args.repeat)
+        single = best_of(parse_refinement, text, args.repeat)
+        print(f"{name:<11}{len(text) / 1024:>9.1f}{legacy * 1000:>12.3f}{single * 1000:>16.3f}{legacy / single:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
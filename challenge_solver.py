@@ -0,0 +1,261 @@
+"""
+Local solver for Moltbook verification challenges.
+
+Challenges are short word problems ("A lobster swims at twenty-three meters and
+loses seven, what is the new depth?"), often obfuscated with random casing,
+symbols inside words ("tW]eN^tY"), doubled letters ("thhreee") and words split
+by spaces. solve() reads them without an LLM round trip:
+
+  1. cleans the text (lowercase, symbols dropped, the sign of "-5" kept) and
+     matches words with doubled letters collapsed, so "tWeNnTyy" reads "twenty",
+  2. reads numbers from digits and number words, including compounds
+     ("twenty-three", "twentythree"), hundreds and thousands,
+  3. finds the operator keywords (loses/minus, gains/plus, times, divided...)
+     between the numbers and applies them left to right (a bare "less"/"more"
+     between them lowers the confidence: "ten less than twenty"),
+
+and reports a confidence. solve_challenge() asks the LLM only when the
+confidence is below MIN_CONFIDENCE.
+"""
+import re
+from typing import NamedTuple, Optional, Tuple
+
+import refusal as refusal_detectors
+
+MIN_CONFIDENCE = 0.75
+
+UNITS = ("zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+         "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen", "nineteen")
+TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+SCALES = {"hundred": 100, "thousand": 1000}
+
+# Operator keywords (single words or word pairs); unary ones carry their operand
+OPERATORS = {
+    "-": ("loses", "lose", "lost", "minus", "subtract", "subtracts", "subtracted", "less", "fewer", "slows", "slowed",
+          "drops", "dropped", "decreases", "decreased", "reduces", "reduced", "falls", "removes", "spends",
+          "gives away", "takes away", "slows down"),
+    "+": ("gains", "gain", "gained", "plus", "adds", "add", "added", "increases", "increased", "rises", "grows",
+          "accelerates", "speeds up", "more", "total", "sum", "combined", "together", "receives", "finds", "collects"),
+    "*": ("times", "multiplied", "multiplies", "multiply", "product"),
+    "/": ("divided", "divides", "divide", "splits", "split", "shared", "quotient"),
+}
+UNARY = {"doubles": ("*", 2), "triples": ("*", 3), "halves": ("/", 2), "twice": ("*", 2), "half": ("/", 2)}
+# Bare comparatives: "forty less" subtracts, but "ten less than twenty" or "how many
+# more to reach twenty" do not. Between two numbers they only count at low confidence.
+AMBIGUOUS = ("less", "more", "fewer")
+
+_SYMBOLS = re.compile(r"(?!(?<!\S)-\d)[^a-z0-9\s.]|(?<!\d)\.|\.(?!\d)")  # keeps the sign of "-5"
+_DIGITS = re.compile(r"-?\d+(?:\.\d+)?$")
+_REPEATS = re.compile(r"(.)\1+")
+_LLM_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _collapse(word):
+    """'thhreee' -> 'thre': doubled letters are the commonest obfuscation."""
+    return _REPEATS.sub(r"\1", word)
+
+
+# collapsed spelling -> (value, kind)
+_NUMBER_WORDS = {_collapse(w): (n, "unit" if n < 10 else "teen") for n, w in enumerate(UNITS)}
+_NUMBER_WORDS.update({_collapse(w): (n, "tens") for w, n in TENS.items()})
+_NUMBER_WORDS.update({_collapse(w): (n, "scale") for w, n in SCALES.items()})
+_LONGEST_NUMBER_WORD = max(map(len, _NUMBER_WORDS))
+_OPERATOR_WORDS = {tuple(_collapse(w) for w in phrase.split()): op for op, phrases in OPERATORS.items() for phrase in phrases}
+_UNARY_WORDS = {_collapse(w): spec for w, spec in UNARY.items()}
+_AMBIGUOUS_WORDS = {_collapse(w) for w in AMBIGUOUS}
+
+
+class Solution(NamedTuple):
+    answer: Optional[float]
+    confidence: float  # 0..1
+    operands: Tuple[float, ...] = ()
+    operators: Tuple[str, ...] = ()
+
+    @property
+    def formatted(self):
+        return f"{self.answer:.2f}" if self.answer is not None else None
+
+
+def _segment(word):
+    """A collapsed word read as concatenated number words ('twentythre'), or None."""
+    if not word:
+        return []
+    for end in range(min(len(word), _LONGEST_NUMBER_WORD), 0, -1):
+        head = _NUMBER_WORDS.get(word[:end])
+        if head:
+            rest = _segment(word[end:])
+            if rest is not None:
+                return [head] + rest
+    return None
+
+
+def _tokens(challenge):
+    """Cleaned, collapsed words of a challenge."""
+    text = _SYMBOLS.sub("", challenge.lower())
+    return [t if _DIGITS.match(t) else _collapse(t) for t in text.split()]
+
+
+def _read(tokens):
+    """Numbers as (value, first, last token index) and operators as (op, operand, index)."""
+    words = []  # (index, number words or None)
+    i = 0
+    while i < len(tokens):
+        pieces = None
+        if not _DIGITS.match(tokens[i]):
+            # Words split by spaces ("six ty", "tw enty"): fragments that join into a single
+            # number word win over reading the first one alone (60, not 6 and a stray "ty")
+            for span in (3, 2):
+                joined = i + span <= len(tokens) and _segment("".join(tokens[i:i + span]))
+                if joined and len(joined) == 1:
+                    pieces, i = joined, i + span - 1
+                    break
+            else:
+                pieces = _segment(tokens[i])
+        # Otherwise join up to three fragments that read as a number ("tw entythre")
+        if pieces is None and not _DIGITS.match(tokens[i]):
+            for span in (2, 3):
+                joined = i + span <= len(tokens) and _segment("".join(tokens[i:i + span]))
+                if joined:
+                    pieces, i = joined, i + span - 1
+                    break
+        words.append((i, pieces))
+        i += 1
+
+    numbers, operators, current = [], [], None
+    for index, pieces in words:
+        token = tokens[index]
+        if _DIGITS.match(token):
+            current = None
+            numbers.append([float(token), index, index, 0])
+            continue
+        if pieces is None:
+            current = None if token != "and" else current  # "one hundred and five"
+            unary = _UNARY_WORDS.get(token)
+            if unary:
+                operators.append((unary[0], unary[1], index))
+            for phrase, op in _OPERATOR_WORDS.items():
+                if tuple(tokens[index:index + len(phrase)]) == phrase:
+                    operators.append((op, None, index))
+                    break
+            continue
+        for value, kind in pieces:
+            # number: [value, first index, last index, part below the last "thousand"]
+            if current is None or not _continues(current, kind, value):
+                number = [0.0, index, index, 0]
+                numbers.append(number)
+            else:
+                number = current[0]
+            if value == 1000:
+                number[0], number[3] = max(number[0], 1) * 1000, 0
+            elif value == 100:
+                hundreds = max(number[3], 1) * 100
+                number[0], number[3] = number[0] - number[3] + hundreds, hundreds
+            else:
+                number[0], number[3] = number[0] + value, number[3] + value
+            number[2] = index
+            current = (number, kind)
+    return [tuple(n[:3]) for n in numbers], operators
+
+
+def _continues(current, kind, value):
+    """Whether a number word extends the number being read ('twenty' + 'three')."""
+    number, previous = current
+    if kind == "scale":
+        return True
+    if previous == "tens":
+        return kind == "unit" and value > 0
+    if previous == "scale":
+        return number[3] % 100 == 0
+    return False
+
+
+def _apply(left, op, right):
+    if op == "+":
+        return left + right
+    if op == "-":
+        return left - right
+    if op == "*":
+        return left * right
+    return left / right if right else None
+
+
+def solve(challenge):
+    """Solution(answer, confidence, operands, operators) for a challenge; answer None when unreadable."""
+    tokens = _tokens(challenge or "")
+    numbers, operators = _read(tokens)
+    binary = [(op, i) for op, operand, i in operators if operand is None]
+    unary = [(op, operand, i) for op, operand, i in operators if operand is not None]
+
+    if not numbers:
+        return Solution(None, 0.0)
+    if len(numbers) == 1:
+        if unary:
+            op, operand, _ = unary[0]
+            return Solution(_apply(numbers[0][0], op, operand), 0.85, (numbers[0][0], operand), (op,))
+        return Solution(None, 0.1, (numbers[0][0],))
+
+    confidence = 0.95 - 0.1 * (len(numbers) - 2)
+    outside = [op for op, i in binary if i < numbers[0][1] or i > numbers[-1][2]]
+    chosen = []
+    for (_, _, end), (_, start, _) in zip(numbers, numbers[1:]):
+        between = [(op, i) for op, i in binary if end < i < start]
+        if between:
+            if len({op for op, _ in between}) > 1:
+                confidence -= 0.15
+            op, i = between[-1]  # the keyword closest to the operand
+            if tokens[i] in _AMBIGUOUS_WORDS:
+                confidence -= 0.3
+            chosen.append(op)
+        elif outside:
+            chosen.append(outside[0])  # "the product of six and seven", "... what is the total?"
+            confidence -= 0.2
+        else:
+            chosen.append("+")  # "twelve and five": no keyword at all
+            confidence -= 0.5
+    answer = numbers[0][0]
+    for op, (value, _, _) in zip(chosen, numbers[1:]):
+        answer = _apply(answer, op, value)
+        if answer is None:
+            return Solution(None, 0.0, tuple(n[0] for n in numbers), tuple(chosen))
+    return Solution(answer, max(0.0, round(confidence, 2)), tuple(n[0] for n in numbers), tuple(chosen))
+
+
+LLM_PROMPT = """
+You are a math genius. Solve this riddle/problem and output ONLY the number (integer or float).
+Do not explain. do not use words. just the number.
+
+Riddle: "{challenge}"
+
+Answer:
+"""
+
+
+def ask_llm(challenge, llm):
+    """The LLM's numeric answer, or None (error text, refusal, no number)."""
+    try:
+        text = llm.invoke(LLM_PROMPT.format(challenge=challenge)).strip()
+    except Exception as e:
+        print(f"💥 Solver Error: {e}")
+        return None
+    match = _LLM_NUMBER.search(text)
+    if text.startswith(refusal_detectors.ERROR_PREFIXES) or not match:
+        print(f"❌ LLM failed to solve. Raw: {text}")
+        return None
+    return float(match.group())
+
+
+def solve_challenge(challenge, llm=None, min_confidence=MIN_CONFIDENCE):
+    """Answer to send to /verify ("16.00"): the local solution when it is confident
+    enough, else the LLM's, else the low-confidence local one, else "0.00"."""
+    print(f"🧩 Challenge received: {challenge}")
+    solution = solve(challenge)
+    if solution.answer is not None and solution.confidence >= min_confidence:
+        print(f"🧮 Solved locally: {solution.formatted} (confidence {solution.confidence:.2f})")
+        return solution.formatted
+    print(f"🤔 Local solver unsure (answer {solution.formatted}, confidence {solution.confidence:.2f}).")
+    if llm is not None:
+        answer = ask_llm(challenge, llm)
+        if answer is not None:
+            print(f"🤖 LLM Solved: {answer:.2f}")
+            return f"{answer:.2f}"
+    return solution.formatted or "0.00"
@@ -2,7 +2,7 @@
 import os
 import json
 from dotenv import load_dotenv
-from moltbook import MoltbookClient
+from moltbook import MoltbookClient, MoltbookError
 
 # Load env vars
 load_dotenv()
@@ -11,7 +11,11 @@ def check_activity():
     client = MoltbookClient()
     
     # 1. Who am I?
-    me = client.get_me()
+    try:
+        me = client.get_me()
+    except MoltbookError as e:
+        print(f"❌ Could not fetch agent profile: {e}")
+        return
     if not me:
         print("❌ Could not fetch agent profile. Check API key.")
         return
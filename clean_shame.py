@@ -1,56 +1,191 @@
+"""
+Moderation sweep: deletes the agent's own posts that leaked a refusal or a
+chatbot reply ("I'm sorry", "As an AI", ...).
 
-from moltbook import MoltbookClient
+Only the agent's posts are fetched (iter_agent_posts, newest first), and only
+down to the high-water mark of the last complete sweep (the first already
+checked post past it): every checked post is recorded in a local SQLite
+ledger, so it is never scanned again.
+Offenders are deleted in concurrent batches; failed deletes stay in the ledger
+and are retried by the next sweep (a post already removed elsewhere counts as
+deleted, so it is not retried forever).
+
+Usage:
+    python clean_shame.py              # incremental sweep
+    python clean_shame.py --dry-run    # report offenders, delete nothing
+    python clean_shame.py --full       # ignore the high-water mark (ledger posts are still skipped)
+
+MODERATION_LEDGER sets the ledger path (default .moderation_ledger.sqlite next to this file).
+"""
+import argparse
+import os
+import sqlite3
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 from dotenv import load_dotenv
-load_dotenv()
-
-client = MoltbookClient()
-me = client.get_me()
-if not me or not me.get('agent'):
-    print("❌ Failed to fetch agent profile (no 'agent' key).")
-    exit()
-
-profile = me['agent']
-my_name = profile.get("name")
-my_id = profile.get("id")
-
-print(f"🧹 Cleaning up for agent: {my_name} ({my_id})")
-
-# Scan the feed (Global New)
-print("Scanning global NEW feed (limit 200)...")
-feed = client.get_feed(limit=200, sort="new")
-
-print(f"DEBUG: Scanned {len(feed)} posts.")
-
-found_bad = False
-if not my_id:
-    print("❌ Could not get my Agent ID. Aborting.")
-    exit()
-
-for post in feed:
-    # Check if I am the author
-    author = post.get('author', {})
-    author_id = author.get('id') if isinstance(author, dict) else post.get('author_id')
-    
-    # print(f"Checking post {post['id']} by {author_id}...")
-    
-    if author_id == my_id:
-        content = post.get('content') or ""
-        print(f"🔎 Scanning post ({post['id']}): '{content[:50]}...'")
-        
-        # Check for bad content
-        bad_phrases = ["I'm sorry", "cannot help", "apologize", "Want to talk about", "As an AI"]
-        if any(bad in content for bad in bad_phrases):
-            print(f"🚨 FOUND BAD POST! ID: {post['id']}")
-            print(f"Content: {content}")
-            
-            # Delete!
-            res = client.delete_post(post['id'])
-            if res.get("success"):
-                print("✅ DELETED SUCCESSFULLY. The shame is gone.")
-                found_bad = True
-            else:
-                print(f"❌ DELETE FAILED: {res}")
-
-if not found_bad:
-    print("✨ No bad posts found in the recent feed. You are clean.")
+
+import refusal as refusal_detectors
+from moltbook import MoltbookClient, MoltbookError
+
+DELETE_BATCH_SIZE = 8
+DELETE_WORKERS = 4
+
+
+def default_ledger_path():
+    return os.getenv("MODERATION_LEDGER") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), ".moderation_ledger.sqlite")
+
+
+class ModerationLedger:
+    """Checked posts (id -> verdict) and the high-water mark of each agent."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checked_posts ("
+                "post_id TEXT PRIMARY KEY, agent_id TEXT NOT NULL, created_at TEXT, verdict TEXT NOT NULL, "
+                "phrase TEXT, checked_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS high_water (agent_id TEXT PRIMARY KEY, created_at TEXT NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def high_water_mark(self, agent_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT created_at FROM high_water WHERE agent_id = ?", (agent_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_high_water_mark(self, agent_id, created_at):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO high_water (agent_id, created_at) VALUES (?, ?)", (agent_id, created_at))
+
+    def checked_ids(self, agent_id):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT post_id FROM checked_posts WHERE agent_id = ?", (agent_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def pending_deletes(self, agent_id):
+        """(post_id, created_at, phrase) of offenders whose delete failed in an earlier sweep."""
+        with self._connect() as conn:
+            return conn.execute("SELECT post_id, created_at, phrase FROM checked_posts "
+                                "WHERE agent_id = ? AND verdict = 'delete_failed'", (agent_id,)).fetchall()
+
+    def record(self, agent_id, rows):
+        """rows: (post_id, created_at, verdict, phrase) tuples."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO checked_posts (post_id, agent_id, created_at, verdict, phrase, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(post_id, agent_id, created_at, verdict, phrase, now) for post_id, created_at, verdict, phrase in rows])
+
+
+def _delete(client, post_id):
+    """True when the post is gone."""
+    try:
+        res = client.delete_post(post_id)
+    except MoltbookError as e:
+        print(f"❌ DELETE FAILED ({post_id}): {e}")
+        return False
+    if res.get("already_deleted"):
+        print(f"🗑️ {post_id} was already gone.")
+    elif not res.get("success"):
+        print(f"❌ DELETE FAILED ({post_id}): {res}")
+    return bool(res.get("success"))
+
+
+def sweep(client, ledger, agent_id, full=False, dry_run=False, page_size=50):
+    """One moderation pass over the agent's posts newer than the high-water mark.
+    Returns {"scanned", "skipped", "offenders", "deleted", "failed"}."""
+    detector = refusal_detectors.MODERATION
+    mark = None if full else ledger.high_water_mark(agent_id)
+    known = ledger.checked_ids(agent_id)
+    stats = {"scanned": 0, "skipped": 0, "offenders": 0, "deleted": 0, "failed": 0}
+    newest, clean = None, []
+    # (post_id, created_at, phrase); earlier failed deletes are retried first
+    offenders = [tuple(row) for row in ledger.pending_deletes(agent_id)]
+
+    # Incremental sweeps usually stop in the first page: no point prefetching a second one
+    posts = client.iter_agent_posts(agent_id, page_size=page_size, prefetch=mark is None)
+    try:
+        for post in posts:
+            created_at = post.get("created_at")
+            if mark and created_at and created_at < mark and post["id"] in known:
+                break  # past the mark: everything older was checked by an earlier complete sweep
+            if created_at and (newest is None or created_at > newest):
+                newest = created_at
+            if post["id"] in known:
+                stats["skipped"] += 1
+                continue
+            stats["scanned"] += 1
+            hit = detector.detect(post.get("content") or "")
+            if hit is None:
+                clean.append((post["id"], created_at, "clean", None))
+                continue
+            stats["offenders"] += 1
+            print(f"🚨 FOUND BAD POST! ID: {post['id']} ({hit.phrase!r}): {(post.get('content') or '')[:80]}")
+            offenders.append((post["id"], created_at, hit.phrase))
+    finally:
+        posts.close()
+        if not dry_run:
+            ledger.record(agent_id, clean)  # an interrupted sweep keeps what it checked
+    if dry_run:
+        return stats
+
+    # Deletes run after the walk: removing posts while paging by offset would skip some
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as pool:
+        for i in range(0, len(offenders), DELETE_BATCH_SIZE):
+            batch = offenders[i:i + DELETE_BATCH_SIZE]
+            rows = []
+            for (post_id, created_at, phrase), deleted in zip(batch, pool.map(lambda o: _delete(client, o[0]), batch)):
+                if deleted:
+                    print(f"✅ DELETED {post_id}. The shame is gone.")
+                stats["deleted" if deleted else "failed"] += 1
+                rows.append((post_id, created_at, "deleted" if deleted else "delete_failed", phrase))
+            ledger.record(agent_id, rows)
+
+    # Only a complete sweep moves the mark: an interrupted one resumes from the old mark
+    if newest and (mark is None or newest > mark):
+        ledger.set_high_water_mark(agent_id, newest)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Report offenders without deleting them.")
+    parser.add_argument("--full", action="store_true", help="Walk every post, ignoring the high-water mark.")
+    parser.add_argument("--ledger", default=None, help="Ledger path (default: MODERATION_LEDGER or .moderation_ledger.sqlite).")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    client = MoltbookClient()
+    try:
+        me = client.get_me()
+    except MoltbookError as e:
+        print(f"❌ Failed to fetch agent profile: {e}")
+        return 1
+    if not me or not me.get('agent') or not me['agent'].get('id'):
+        print("❌ Failed to fetch agent profile (no 'agent' key).")
+        return 1
+
+    profile = me['agent']
+    print(f"🧹 Cleaning up for agent: {profile.get('name')} ({profile['id']})")
+    ledger = ModerationLedger(args.ledger or default_ledger_path())
+    try:
+        stats = sweep(client, ledger, profile['id'], full=args.full, dry_run=args.dry_run)
+    except MoltbookError as e:
+        print(f"❌ Sweep interrupted: {e} (the high-water mark is unchanged, checked posts are kept)")
+        return 1
+
+    print(f"📋 {stats['scanned']} new posts scanned, {stats['skipped']} already in the ledger, "
+          f"{stats['offenders']} offenders, {stats['deleted']} deleted, {stats['failed']} failed.")
+    if not stats['offenders']:
+        print("✨ No bad posts found since the last sweep. You are clean.")
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+"""
+Token budgets for the style context pasted into each LLM stage.
+
+The Researcher's raw context and its analysis used to be sent whole (or cut
+with a blind character slice) to every stage. fit_context() instead:
+
+  1. counts tokens with a local tokenizer (tiktoken's cl100k_base when it is
+     installed, otherwise a word-piece estimate close to it),
+  2. trims the head of a retrieved chunk that repeats the tail of another
+     (the splitter's chunk overlap) and drops sections repeated from another
+     chunk; repeated lines inside a chunk (refrains, anaphora) are kept,
+  3. keeps the most salient sections (metric rules, techniques, short
+     exemplars, the style header) until the stage's budget is full,
+
+and returns the kept sections in their original order.
+
+Budgets per stage (tokens): DEFAULT_BUDGETS, overridden by CONTEXT_BUDGET_<STAGE>
+(e.g. CONTEXT_BUDGET_REFINE=400) or per call; 0 sends the context unchanged.
+"""
+import os
+import re
+import threading
+from typing import NamedTuple
+
+DEFAULT_BUDGETS = {"research": 1500, "draft": 800, "refine": 400}
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+# Words count ~1 token per 6 letters, digits by groups of 3, punctuation and symbols 1 each
+_TOKEN_PIECE = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]")
+
+
+def _get_encoder():
+    """tiktoken's cl100k_base, or False when tiktoken (or its BPE file) is unavailable."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    _encoder = False
+    return _encoder
+
+
+def estimate_tokens(text):
+    """Tokenizer-free estimate (within ~10-15% of cl100k_base on English/Italian verse)."""
+    return sum(1 + (len(p) - 1) // 6 if p[0].isalpha() else 1 for p in _TOKEN_PIECE.findall(text))
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def stage_budget(stage, budget=None):
+    """Token budget for a stage: the per-call value, CONTEXT_BUDGET_<STAGE>, or the default.
+    None means no budgeting."""
+    if budget is None:
+        budget = DEFAULT_BUDGETS.get(stage)
+        setting = os.getenv(f"CONTEXT_BUDGET_{stage.upper()}", "").strip()
+        if setting:
+            try:
+                budget = int(setting)
+            except ValueError:
+                print(f"⚠️ Ignoring CONTEXT_BUDGET_{stage.upper()}={setting!r} (not an integer); using {budget}.")
+    return budget if budget and budget > 0 else None
+
+
+# --- SECTIONS ---
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_HEADING_ONLY = re.compile(r"^\s*(?:#{1,6}\s.*|\*\*[^*\n]+\*\*:?|[-=_*]{3,}|[A-Z][A-Z0-9 _/&()-]{2,}:?)\s*$")
+_RULE_WORDS = re.compile(
+    r"\b(?:metric|metro|metrica|rules?|regole|verse|vers[oi]|syllab\w*|sillab\w*|rhyme|rim[ae]|structure|struttura|"
+    r"meter|technique|tecnic\w*|essence|essenza|form|forma|sonnet|sonetto|endecasillab\w*|settenari\w*|stanza|strof\w*|"
+    r"pentameter|enjambment|tone|tono|lessico|lexicon)\b", re.IGNORECASE)
+_QUOTED = re.compile(r'["“«][^"”»\n]{8,160}["”»]')
+_WORD = re.compile(r"\w+")
+
+
+def split_sections(text):
+    """Paragraphs of a context, with a heading-only paragraph attached to the next one."""
+    sections, pending = [], ""
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if all(_HEADING_ONLY.match(line) for line in paragraph.splitlines()):
+            pending = f"{pending}\n{paragraph}".strip()
+            continue
+        sections.append(f"{pending}\n{paragraph}".strip() if pending else paragraph)
+        pending = ""
+    if pending:
+        sections.append(pending)
+    return sections
+
+
+def _shingles(text, size=4):
+    words = _WORD.findall(text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def trim_overlap(chunk, earlier, min_chars=20):
+    """`chunk` without a head that repeats the tail of an earlier chunk (the
+    splitter's chunk_overlap); overlaps shorter than min_chars are coincidences."""
+    overlap = 0
+    for previous in earlier:
+        for size in range(min(len(previous), len(chunk)), max(min_chars, overlap + 1) - 1, -1):
+            if previous.endswith(chunk[:size]):
+                overlap = size
+                break
+    return chunk[overlap:].strip() if overlap else chunk
+
+
+def dedupe_chunks(chunks, threshold=0.8):
+    """Sections of the chunks, without chunk overlaps (see trim_overlap) and without
+    sections whose word 4-grams are mostly contained in a section of another chunk.
+    Nothing is dropped inside a chunk, so refrains survive."""
+    kept, kept_shingles = [], []  # kept_shingles: (chunk index, shingles)
+    for index, chunk in enumerate(chunks):
+        for section in split_sections(trim_overlap(chunk, chunks[:index])):
+            shingles = _shingles(section)
+            if any(other_index != index and len(shingles & other) >= threshold * len(shingles)
+                   for other_index, other in kept_shingles):
+                continue
+            kept.append(section)
+            kept_shingles.append((index, shingles))
+    return kept
+
+
+def salience(section, index, total):
+    """Higher for rules/technique sections, short exemplars and early sections
+    (retrieval puts the style header first); lower for long prose."""
+    lines = [line for line in section.splitlines() if line.strip()]
+    score = min(len(_RULE_WORDS.findall(section)), 4) * 0.75
+    short = sum(1 for line in lines if len(line) <= 80) / len(lines)
+    if len(lines) >= 2 and short > 0.7:
+        score += 1.5  # verse-like exemplar or a list of rules
+    score += min(len(_QUOTED.findall(section)), 3) * 0.5
+    score += 1.0 - index / max(1, total)
+    words = len(_WORD.findall(section))
+    if words > 150:
+        score -= min(2.0, (words - 150) / 150)
+    return score
+
+
+def _truncate(section, budget):
+    """The leading lines of a section that fit in `budget` tokens (the leading
+    words when its first line alone is too long)."""
+    lines, used = [], 0
+    for line in section.splitlines():
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            if not lines:
+                words = line.split()
+                while words and count_tokens(" ".join(words)) > budget:
+                    words = words[:len(words) * 3 // 4]
+                lines.append(" ".join(words))
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines).strip()
+
+
+class BudgetedContext(NamedTuple):
+    text: str
+    tokens_in: int
+    tokens_out: int
+    sections_kept: int
+    sections_dropped: int
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_in - self.tokens_out
+
+
+def fit_context(context, budget):
+    """Fits a context (a string or a list of retrieved chunks) into `budget` tokens.
+    budget None returns it unchanged (chunks joined by blank lines)."""
+    chunks = [context] if isinstance(context, str) else list(context)
+    original = "\n\n".join(chunks)
+    tokens_in = count_tokens(original)
+    if budget is None or (tokens_in <= budget and isinstance(context, str)):
+        return BudgetedContext(original, tokens_in, tokens_in, 1, 0)
+
+    sections = [s for chunk in chunks for s in split_sections(chunk)]
+    unique = dedupe_chunks(chunks)
+    costs = [count_tokens(s) for s in unique]
+    order = sorted(range(len(unique)), key=lambda i: salience(unique[i], i, len(unique)), reverse=True)
+    chosen, used = {}, 0
+    for i in order:
+        separator = 2 if chosen else 0
+        if used + separator + costs[i] <= budget:
+            chosen[i] = unique[i]
+            used += separator + costs[i]
+        elif not chosen:  # the most salient section alone is too big: keep its head
+            head = _truncate(unique[i], budget)
+            if head:
+                chosen[i] = head
+                used = count_tokens(head)
+    text = "\n\n".join(chosen[i] for i in sorted(chosen))
+    return BudgetedContext(text, tokens_in, count_tokens(text), len(chosen), len(sections) - len(chosen))
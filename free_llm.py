@@ -0,0 +1,358 @@
+"""
+Lightweight FreeLLM transport (apifreellm.com).
+
+Only depends on `requests`, so the cron brain can import it in well under a
+second. The LangChain wrapper `FreeLLM` (used by the RAG pipeline) is resolved
+lazily from poet_engine the first time it is accessed:
+
+    from free_llm import FreeLLMClient   # plain client, no LangChain import
+    from free_llm import FreeLLM         # LangChain LLM, imports langchain_core
+"""
+import os
+import json
+import time
+import asyncio
+import weakref
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import telemetry
+from llm_cache import LLMCache
+from rate_limit import backoff_delay, get_rate_limiter, parse_retry_after
+
+DEFAULT_ENDPOINT = "https://apifreellm.com/api/v1/chat"  # FREELLM_ENDPOINT overrides it (e.g. stub_servers.py)
+
+# --- SHARED HTTP TRANSPORT ---
+# One keep-alive session per pool configuration, shared by every FreeLLM instance,
+# so the Researcher -> Poet -> Refiner chain reuses warm TCP/TLS connections.
+_http_sessions = {}
+_http_lock = threading.Lock()
+
+
+class StreamInterrupted(RuntimeError):
+    """A stream broke after yielding part of the answer; `partial` is what arrived."""
+
+    def __init__(self, message, partial=""):
+        super().__init__(message)
+        self.partial = partial
+
+def get_http_session(pool_connections=4, pool_maxsize=10):
+    """Returns the shared pooled session for this pool configuration.
+
+    pool_connections: number of per-host pools kept alive.
+    pool_maxsize: max open connections kept per host.
+    """
+    key = (pool_connections, pool_maxsize)
+    session = _http_sessions.get(key)
+    if session is None:
+        with _http_lock:
+            session = _http_sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Connection": "keep-alive"})
+                _http_sessions[key] = session
+    return session
+
+# One httpx.AsyncClient per event loop (a client cannot be shared across loops);
+# all coroutines running on a loop share its connection pool.
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_http_client(pool_maxsize=10):
+    """Returns the shared httpx.AsyncClient of the running event loop."""
+    import httpx
+
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(pool_maxsize)
+    if client is None:
+        limits = httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize)
+        client = clients[pool_maxsize] = httpx.AsyncClient(limits=limits, headers={"Connection": "keep-alive"})
+    return client
+
+MAX_RETRIES = 3
+RATE_LIMIT_BACKOFF_BASE = 10.0  # first 429 without Retry-After waits 5-10 s, then 10-20 s
+
+class FreeLLMClient:
+    """Plain client for apifreellm.com: pooled transport, retries and optional cache."""
+
+    def __init__(self, api_key=None, endpoint=None, model="apifreellm", response_cache=None,
+                 pool_connections=4, pool_maxsize=10, connect_timeout=10.0, read_timeout=60.0, rate_limiter=None):
+        self.api_key = api_key
+        self.endpoint = endpoint or os.getenv("FREELLM_ENDPOINT") or DEFAULT_ENDPOINT
+        self.model = model
+        self.response_cache = response_cache
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout  # Slow poetry generation
+        self.rate_limiter = rate_limiter  # None: shared limiter for this key from the env (FREELLM_RPM)
+
+    def invoke(self, prompt):
+        """Same call shape as the LangChain wrapper: prompt in, text out."""
+        return self.complete(prompt)
+
+    def _cached(self, prompt, stop):
+        """(cache_key, cached_text); both None when caching is off."""
+        if self.response_cache is None:
+            return None, None
+        cache_key = LLMCache.make_key(prompt, self.model, {"endpoint": self.endpoint, "stop": stop})
+        return cache_key, self.response_cache.get(cache_key)
+
+    def _request(self, prompt):
+        """(headers, payload, rate_limiter) for one chat call."""
+        # Lazy load key to support late .env loading
+        current_key = self.api_key or os.getenv("FREELLM_API_KEY")
+        if not current_key:
+            raise ValueError("FREELLM_API_KEY not found in env or instance.")
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {current_key}"
+        }
+
+        print(f"DEBUG: sending prompt to FreeLLM (first 300 chars):\n{prompt[:300]}\n...\n")
+
+        # Payload format specific to this API
+        payload = {
+            "message": prompt,
+            "model": self.model
+        }
+        limiter = self.rate_limiter or get_rate_limiter(current_key, self.endpoint)
+        return headers, payload, limiter
+
+    def _result(self, data, cache_key):
+        if data.get("success"):
+            text = data.get("response", "")
+            if self.response_cache is not None:
+                self.response_cache.set(cache_key, text)
+            return text
+        else:
+            return f"Error: {data}"
+
+    @staticmethod
+    def _throttled(response, attempt, limiter):
+        """On a 429, pauses every caller of the limiter for Retry-After (or a jittered
+        backoff). Returns the delay the caller must wait itself when there is no limiter."""
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None:
+            delay = backoff_delay(attempt, base=RATE_LIMIT_BACKOFF_BASE)
+        print(f"⚠️ API 429: Rate limit hit. Backing off {delay:.1f}s...")
+        if limiter is None:
+            return delay
+        limiter.block_for(delay)
+        return 0.0
+
+    def _span(self, prompt):
+        """Telemetry span of one call (children: each HTTP attempt and each wait)."""
+        return telemetry.span("llm.call", model=self.model, prompt_chars=len(prompt),
+                              prompt_tokens_est=telemetry.estimate_tokens(prompt), retries=0, rate_limited=0)
+
+    @staticmethod
+    def _done(sp, text, cache_hit=False):
+        sp.set(response_chars=len(text), response_tokens_est=telemetry.estimate_tokens(text), cache_hit=cache_hit,
+               ok=not text.startswith(("API ERROR", "Error:")))
+        return text
+
+    def complete(self, prompt, stop=None):
+        with self._span(prompt) as sp:
+            cache_key, cached = self._cached(prompt, stop)
+            if cached is not None:
+                print("DEBUG: FreeLLM cache hit.")
+                return self._done(sp, cached, cache_hit=True)
+            headers, payload, limiter = self._request(prompt)
+            return self._done(sp, self._complete(headers, payload, limiter, cache_key, sp))
+
+    def _complete(self, headers, payload, limiter, cache_key, sp):
+        for attempt in range(MAX_RETRIES):
+            sp.set(retries=attempt)
+            # Proactive throttling: wait for a token of the shared per-key quota
+            if limiter is not None:
+                waited = limiter.acquire()
+                if waited > 0:
+                    telemetry.record("llm.wait", waited, reason="rate_limit")
+                    print(f"⏳ FreeLLM: waited for the rate limit (Attempt {attempt+1}/{MAX_RETRIES})")
+
+            try:
+                session = get_http_session(self.pool_connections, self.pool_maxsize)
+                with telemetry.span("llm.attempt", attempt=attempt + 1) as attempt_span:
+                    response = session.post(
+                        self.endpoint, headers=headers, json=payload,
+                        timeout=(self.connect_timeout, self.read_timeout)
+                    )
+                    attempt_span.set(status=response.status_code)
+
+                if response.status_code == 429:
+                    sp.set(rate_limited=sp.attrs["rate_limited"] + 1)
+                    with telemetry.span("llm.wait", reason="429"):
+                        time.sleep(self._throttled(response, attempt, limiter))
+                    continue
+
+                response.raise_for_status()
+                return self._result(response.json(), cache_key)
+
+            except Exception as e:
+                if attempt == MAX_RETRIES - 1:
+                    return f"API ERROR after {MAX_RETRIES} attempts: {str(e)}"
+                delay = backoff_delay(attempt)
+                print(f"⚠️ Request failed: {e}. Retrying in {delay:.1f}s...")
+                with telemetry.span("llm.wait", reason="backoff"):
+                    time.sleep(delay)
+
+        return "API ERROR: Max retries exceeded."
+
+    async def acomplete(self, prompt, stop=None):
+        """Async complete(): same retries, cache and rate limit, on the shared httpx
+        client of the running event loop. Waits await instead of blocking a thread."""
+        with self._span(prompt) as sp:
+            cache_key, cached = self._cached(prompt, stop)
+            if cached is not None:
+                print("DEBUG: FreeLLM cache hit.")
+                return self._done(sp, cached, cache_hit=True)
+            headers, payload, limiter = self._request(prompt)
+            return self._done(sp, await self._acomplete(headers, payload, limiter, cache_key, sp))
+
+    async def _acomplete(self, headers, payload, limiter, cache_key, sp):
+        import httpx
+
+        timeout = httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        for attempt in range(MAX_RETRIES):
+            sp.set(retries=attempt)
+            if limiter is not None:
+                waited = await limiter.aacquire()
+                if waited > 0:
+                    telemetry.record("llm.wait", waited, reason="rate_limit")
+                    print(f"⏳ FreeLLM: waited for the rate limit (Attempt {attempt+1}/{MAX_RETRIES})")
+
+            try:
+                client = get_async_http_client(self.pool_maxsize)
+                with telemetry.span("llm.attempt", attempt=attempt + 1) as attempt_span:
+                    response = await client.post(self.endpoint, headers=headers, json=payload, timeout=timeout)
+                    attempt_span.set(status=response.status_code)
+
+                if response.status_code == 429:
+                    sp.set(rate_limited=sp.attrs["rate_limited"] + 1)
+                    with telemetry.span("llm.wait", reason="429"):
+                        await asyncio.sleep(await asyncio.to_thread(self._throttled, response, attempt, limiter))
+                    continue
+
+                response.raise_for_status()
+                return self._result(response.json(), cache_key)
+
+            except Exception as e:
+                if attempt == MAX_RETRIES - 1:
+                    return f"API ERROR after {MAX_RETRIES} attempts: {str(e)}"
+                delay = backoff_delay(attempt)
+                print(f"⚠️ Request failed: {e}. Retrying in {delay:.1f}s...")
+                with telemetry.span("llm.wait", reason="backoff"):
+                    await asyncio.sleep(delay)
+
+        return "API ERROR: Max retries exceeded."
+
+    def stream(self, prompt, stop=None):
+        """Yields the response text in pieces as the API produces them.
+
+        Asks the API for a streamed answer and understands Server-Sent Events
+        (`data: ...` lines), NDJSON and chunked plain text. If the server answers
+        with a regular JSON body, or the stream fails before producing anything,
+        falls back to the blocking complete() and yields its text in one piece.
+        A stream that breaks midway raises StreamInterrupted instead (the partial
+        text is never cached), so the caller can discard it and retry.
+        """
+        # Not a `with` span: the generator may be resumed from another context
+        sp = telemetry.start_span("llm.stream", model=self.model, prompt_chars=len(prompt),
+                                  prompt_tokens_est=telemetry.estimate_tokens(prompt))
+        pieces = []
+        try:
+            cache_key, cached = self._cached(prompt, stop)
+            if cached is not None:
+                pieces.append(cached)
+                sp.set(cache_hit=True)
+                yield cached
+                return
+            headers, payload, limiter = self._request(prompt)
+            headers["Accept"] = "text/event-stream, application/x-ndjson, application/json"
+            payload["stream"] = True
+
+            try:
+                if limiter is not None:
+                    sp.set(rate_limit_wait_s=round(limiter.acquire(), 3))
+                session = get_http_session(self.pool_connections, self.pool_maxsize)
+                with session.post(self.endpoint, headers=headers, json=payload, stream=True,
+                                  timeout=(self.connect_timeout, self.read_timeout)) as response:
+                    sp.set(status=response.status_code)
+                    if response.status_code == 429:
+                        sp.set(rate_limited=1)
+                        time.sleep(self._throttled(response, 0, limiter))
+                    response.raise_for_status()
+                    content_type = response.headers.get("Content-Type", "")
+                    if "application/json" in content_type:
+                        data = response.json()
+                        if not data.get("success"):
+                            raise ValueError(f"Error: {data}")
+                        pieces.append(data.get("response", ""))
+                        yield pieces[-1]
+                    else:
+                        for piece in _iter_stream_pieces(response, content_type):
+                            if not pieces:
+                                sp.set(first_piece_s=round(sp.elapsed(), 3))
+                            pieces.append(piece)
+                            yield piece
+            except Exception as e:
+                if pieces:
+                    sp.set(interrupted=True)
+                    print(f"⚠️ FreeLLM stream interrupted after {len(pieces)} pieces: {e}")
+                    raise StreamInterrupted(f"stream interrupted after {len(pieces)} pieces: {e}",
+                                            partial="".join(pieces)) from e
+                else:
+                    print(f"⚠️ FreeLLM streaming unavailable ({e}). Falling back to a blocking call.")
+                    sp.set(fallback=True)
+                    pieces.append(self.complete(prompt, stop=stop))
+                    yield pieces[-1]
+                    return
+
+            if self.response_cache is not None:
+                self.response_cache.set(cache_key, "".join(pieces))
+        finally:
+            text = "".join(pieces)
+            sp.set(pieces=len(pieces), response_chars=len(text), response_tokens_est=telemetry.estimate_tokens(text))
+            sp.finish()
+
+def _iter_stream_pieces(response, content_type):
+    """Text pieces from an SSE / NDJSON / chunked-text response."""
+    response.encoding = response.encoding or "utf-8"  # no charset -> requests would yield bytes
+    if "text/event-stream" not in content_type and "ndjson" not in content_type:
+        for text in response.iter_content(chunk_size=None, decode_unicode=True):
+            if text:
+                yield text
+        return
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or line.startswith(":"):
+            continue
+        if line.startswith("data:"):
+            line = line[5:].strip()
+        if line == "[DONE]":
+            return
+        try:
+            event = json.loads(line)
+        except ValueError:
+            yield line  # plain text data line
+            continue
+        if isinstance(event, dict):
+            piece = event.get("delta") or event.get("token") or event.get("content") or event.get("response") or ""
+            if isinstance(piece, dict):  # OpenAI-style {"delta": {"content": ...}}
+                piece = piece.get("content", "")
+            if piece:
+                yield piece
+        elif isinstance(event, str):
+            yield event
+
+def __getattr__(name):
+    # PEP 562: `from free_llm import FreeLLM` pulls in LangChain only when asked for.
+    if name == "FreeLLM":
+        from poet_engine import FreeLLM
+        return FreeLLM
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
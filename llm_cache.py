@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from refusal import CACHE as UNCACHEABLE
+
+
+def is_cacheable(text):
+    """True if an LLM response is a real answer worth storing (no error, no refusal)."""
+    if not text or not text.strip():
+        return False
+    return UNCACHEABLE.detect(text) is None
+
+
+class LLMCache:
+    """Two-tier (memory LRU + SQLite) cache for LLM responses.
+
+    Entries are content-addressed by a hash of prompt + model + parameters and
+    expire after ttl_seconds. Both tiers are size-capped; the disk tier evicts
+    the least recently used rows.
+    """
+
+    def __init__(self, path=None, max_memory_items=256, max_disk_items=5000, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()  # key -> (value, created_at)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "skipped": 0, "evictions": 0}
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+
+    @staticmethod
+    def make_key(prompt, model, params=None):
+        raw = json.dumps({"prompt": prompt, "model": model, "params": params or {}}, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self.path:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                    if row and not self._expired(row[1], now):
+                        conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._remember(key, row[0], row[1])
+                        self.stats["hits"] += 1
+                        self.stats["disk_hits"] += 1
+                        return row[0]
+                    if row:
+                        conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        """Stores a response. Errors and refusals are silently skipped."""
+        if not is_cacheable(value):
+            self.stats["skipped"] += 1
+            return False
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self.path:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                        (key, value, now, now),
+                    )
+                    self._trim_disk(conn, now)
+            self.stats["writes"] += 1
+        return True
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _trim_disk(self, conn, now):
+        if self.ttl_seconds is not None:
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        overflow = count - self.max_disk_items
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.stats["evictions"] += overflow
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.path:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM llm_cache")
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Shared cache configured from the environment, or None when disabled.
+
+    FREELLM_CACHE=1 enables it (stored in .llm_cache.sqlite next to this file),
+    FREELLM_CACHE=<path> picks the SQLite file, FREELLM_CACHE=memory keeps it in RAM.
+    FREELLM_CACHE_TTL sets the time-to-live in seconds.
+    """
+    global _default_cache
+    setting = os.getenv("FREELLM_CACHE", "").strip()
+    if not setting or setting.lower() in ("0", "false", "off"):
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                if setting.lower() in ("1", "true", "on"):
+                    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache.sqlite")
+                elif setting.lower() == "memory":
+                    path = None
+                else:
+                    path = setting
+                ttl = float(os.getenv("FREELLM_CACHE_TTL", 7 * 24 * 3600))
+                _default_cache = LLMCache(path=path, ttl_seconds=ttl)
+    return _default_cache
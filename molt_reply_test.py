@@ -1,9 +1,13 @@
 
-from moltbook import MoltbookClient
+from moltbook import MoltbookClient, MoltbookError
 import time
 
 client = MoltbookClient()
-feed = client.get_feed(limit=5)
+try:
+    feed = client.get_feed(limit=5)
+except MoltbookError as e:
+    print(f"❌ Could not fetch the feed: {e}")
+    raise SystemExit(1)
 print(f"RAW FEED: {feed}")
 
 if isinstance(feed, list) and len(feed) > 0:
@@ -15,7 +19,11 @@ if isinstance(feed, list) and len(feed) > 0:
     print(f"Replying to {author}: {content}...")
     
     reply_content = "Interesting perspective. As a poet agent, I find the structure of your thought... rhythmic. 📜🦞"
-    res = client.comment(post_id, reply_content, sentiment="curious")
+    try:
+        res = client.comment(post_id, reply_content, sentiment="curious")
+    except MoltbookError as e:
+        print(f"❌ Could not post the comment: {e}")
+        raise SystemExit(1)
     print(f"Comment Result: {res}")
 else:
     print("Feed is empty or could not be fetched.")
@@ -1,14 +1,61 @@
+"""
+Moltbook API v1 client.
 
+Every call goes through one pooled keep-alive session (shared with the FreeLLM
+transport) with connect/read timeouts, so a hung request can no longer freeze
+the app sidebar or the brain cycle. GETs are retried with jittered backoff on
+connection errors, timeouts, 429 and 5xx; POST/DELETE are sent once.
+
+iter_feed() and iter_agent_posts() stream listings page by page (cursor or
+offset), prefetching the next page while the current one is consumed.
+
+Failures raise MoltbookError (transport error, timeout, non-JSON answer, or an
+error status on a GET). Write calls return the API's JSON as before, error
+answers included ({"success": false, "error": ...}), since callers read them.
+"""
 import requests
 import json
 import os
 import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from free_llm import get_http_session
+from rate_limit import backoff_delay, parse_retry_after
+
+DEFAULT_BASE_URL = "https://www.moltbook.com/api/v1"
+MAX_GET_RETRIES = 3
+MAX_RETRY_AFTER_S = 30.0  # longer Retry-After waits are not worth blocking a UI rerun for
+
+
+class MoltbookError(Exception):
+    """A Moltbook call that produced no usable answer.
+
+    status: HTTP status (None for transport errors and timeouts).
+    payload: the decoded error body, when there was one.
+    """
+
+    def __init__(self, message, status=None, payload=None):
+        super().__init__(message)
+        self.status = status
+        self.payload = payload
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status == 429 or self.status >= 500
+
 
 class MoltbookClient:
-    def __init__(self):
-        self.base_url = "https://www.moltbook.com/api/v1"
+    def __init__(self, base_url=None, connect_timeout=5.0, read_timeout=20.0):
+        # MOLTBOOK_API_URL points every client at another server (e.g. stub_servers.py)
+        self.base_url = (base_url or os.getenv("MOLTBOOK_API_URL") or DEFAULT_BASE_URL).rstrip("/")
         self.creds_path = os.path.expanduser("~/.config/moltbook/credentials.json")
         self.api_key = self._load_creds() or os.getenv("MOLTBOOK_API_KEY") # Check Env Var fallback
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = get_http_session()
         
         self.headers = {
             "Content-Type": "application/json",
@@ -25,14 +72,48 @@ class MoltbookClient:
             print(f"Error loading Moltbook creds: {e}")
         return None
 
+    def _request(self, method, path, endpoint, timeout=None, missing=None, **kwargs):
+        """Decoded JSON answer of one API call (retried when it is a GET).
+
+        endpoint: path template used as the telemetry label (ids stripped).
+        timeout: (connect, read) seconds, defaults to the client's.
+        missing: answer returned instead of the body of an HTTP 404 (when not None).
+        """
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        attempts = MAX_GET_RETRIES if method == "GET" else 1
+        with telemetry.span("moltbook", method=method, endpoint=endpoint, retries=0) as sp:
+            for attempt in range(attempts):
+                sp.set(retries=attempt)
+                try:
+                    res = self.session.request(method, f"{self.base_url}{path}", headers=self.headers,
+                                               timeout=timeout, **kwargs)
+                    sp.set(status=res.status_code)
+                    if missing is not None and res.status_code == 404:
+                        return missing
+                    try:
+                        data = res.json()
+                    except ValueError:
+                        raise MoltbookError(f"{method} {endpoint}: non-JSON answer (HTTP {res.status_code})",
+                                            status=res.status_code)
+                    if method != "GET" or res.ok:
+                        return data
+                    error = MoltbookError(f"{method} {endpoint}: HTTP {res.status_code}", status=res.status_code,
+                                          payload=data)
+                    delay = parse_retry_after(res.headers.get("Retry-After"))
+                except requests.RequestException as e:
+                    error = MoltbookError(f"{method} {endpoint}: {type(e).__name__}: {e}")
+                    delay = None
+                if not error.retryable or attempt == attempts - 1:
+                    raise error
+                delay = min(MAX_RETRY_AFTER_S, delay if delay is not None else backoff_delay(attempt, base=0.5))
+                print(f"⏳ Moltbook: {error}. Retrying in {delay:.1f}s (Attempt {attempt+1}/{attempts})")
+                telemetry.record("moltbook.wait", delay, reason=error.status or "error")
+                time.sleep(delay)
+
     def get_me(self):
         """Get current agent profile"""
         if not self.api_key: return None
-        try:
-            res = requests.get(f"{self.base_url}/agents/me", headers=self.headers)
-            return res.json()
-        except:
-            return None
+        return self._request("GET", "/agents/me", "agents/me")
 
     def post(self, content, title="Update", submolt="general", sentiment="neutral", is_poetry=False):
         """Create a new post"""
@@ -50,11 +131,7 @@ class MoltbookClient:
             "content": content,
             "sentiment": sentiment
         }
-        try:
-            res = requests.post(f"{self.base_url}/posts", headers=self.headers, json=payload)
-            return res.json()
-        except Exception as e:
-            return {"error": str(e)}
+        return self._request("POST", "/posts", "posts", json=payload)
 
     def verify_post(self, verification_code, answer):
         """Verify a post with the challenge answer"""
@@ -64,11 +141,7 @@ class MoltbookClient:
             "verification_code": verification_code,
             "answer": answer
         }
-        try:
-            res = requests.post(f"{self.base_url}/verify", headers=self.headers, json=payload)
-            return res.json()
-        except Exception as e:
-            return {"error": str(e)}
+        return self._request("POST", "/verify", "verify", json=payload)
 
     def comment(self, post_id, content, sentiment="neutral"):
         """Add a comment to a post"""
@@ -78,11 +151,7 @@ class MoltbookClient:
             "content": content,
             "sentiment": sentiment
         }
-        try:
-            res = requests.post(f"{self.base_url}/posts/{post_id}/comments", headers=self.headers, json=payload)
-            return res.json()
-        except Exception as e:
-            return {"error": str(e)}
+        return self._request("POST", f"/posts/{post_id}/comments", "posts/comments", json=payload)
 
     def reply(self, comment_id, content, sentiment="neutral"):
         """Reply to a comment"""
@@ -92,48 +161,135 @@ class MoltbookClient:
             "content": content,
             "sentiment": sentiment
         }
-        try:
-            res = requests.post(f"{self.base_url}/comments/{comment_id}/replies", headers=self.headers, json=payload)
-            return res.json()
-        except Exception as e:
-            return {"error": str(e)}
+        return self._request("POST", f"/comments/{comment_id}/replies", "comments/replies", json=payload)
 
     def delete_post(self, post_id):
-        """Delete a post by ID"""
+        """Delete a post by ID (a post that is already gone counts as deleted)"""
         if not self.api_key: return {"error": "No API key"}
-        try:
-            res = requests.delete(f"{self.base_url}/posts/{post_id}", headers=self.headers)
-            return res.json()
-        except Exception as e:
-            return {"error": str(e)}
+        return self._request("DELETE", f"/posts/{post_id}", "posts/delete",
+                             missing={"success": True, "already_deleted": True})
 
     def get_feed(self, limit=10, sort="hot"):
         """Get the global feed (more interesting for new agents)"""
         if not self.api_key: return []
-        try:
-            # Use public posts endpoint instead of personalized /feed
-            res = requests.get(f"{self.base_url}/posts?limit={limit}&sort={sort}", headers=self.headers)
-            data = res.json()
-            # If data is a list, return it. If it's a dict with 'posts', return that.
-            if isinstance(data, list): return data
-            return data.get("posts", [])
-        except:
-            return []
+        # Use public posts endpoint instead of personalized /feed
+        data = self._request("GET", "/posts", "posts", params={"limit": limit, "sort": sort})
+        # If data is a list, return it. If it's a dict with 'posts', return that.
+        if isinstance(data, list): return data
+        return data.get("posts", [])
             
     def get_agent_posts(self, agent_id):
         """Get posts by a specific agent"""
         if not self.api_key: return []
-        try:
-            res = requests.get(f"{self.base_url}/agents/{agent_id}/posts", headers=self.headers)
-            return res.json()
-        except:
-            return []
+        return self._request("GET", f"/agents/{agent_id}/posts", "agents/posts")
             
+    def _fetch_page(self, path, endpoint, params, page_size, cursor, offset):
+        """(posts, next_cursor, has_more) of one listing page."""
+        query = dict(params, limit=page_size)
+        if cursor:
+            query["cursor"] = cursor
+        elif offset:
+            query["offset"] = offset
+        data = self._request("GET", path, endpoint, params=query)
+        if isinstance(data, list):
+            return data, None, len(data) >= page_size
+        posts = data.get("posts") or []
+        cursor = data.get("next_cursor")
+        return posts, cursor, data.get("has_more", bool(cursor) or len(posts) >= page_size)
+
+    def _iter_posts(self, path, endpoint, params, page_size, max_posts, prefetch):
+        """Walks a listing page by page: by cursor when the API returns next_cursor,
+        by offset otherwise. While the caller works through a page the next one is
+        already being fetched, so at most two pages are held in memory (plus the
+        ids already yielded). Posts seen on an earlier page are skipped, and the
+        walk stops when a page brings no new post or a cursor comes back: a server
+        ignoring offset/cursor would otherwise serve the same page forever."""
+        if not self.api_key:
+            return
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="moltbook-page") if prefetch else None
+        try:
+            page = self._fetch_page(path, endpoint, params, page_size, None, 0)
+            offset, count, seen_ids, seen_cursors = 0, 0, set(), set()
+            while True:
+                posts, cursor, has_more = page
+                offset += len(posts)
+                fresh = [post for post in posts if post.get("id") not in seen_ids]
+                has_more = has_more and bool(fresh) and cursor not in seen_cursors
+                if cursor:
+                    seen_cursors.add(cursor)
+                next_page = None
+                if has_more and pool:
+                    next_page = pool.submit(contextvars.copy_context().run, self._fetch_page,
+                                            path, endpoint, params, page_size, cursor, offset)
+                for post in fresh:
+                    seen_ids.add(post.get("id"))
+                    yield post
+                    count += 1
+                    if max_posts and count >= max_posts:
+                        return
+                if not has_more:
+                    return
+                page = next_page.result() if next_page else self._fetch_page(
+                    path, endpoint, params, page_size, cursor, offset)
+        finally:
+            if pool:
+                pool.shutdown(wait=False)
+
+    def iter_feed(self, sort="new", page_size=50, max_posts=None, prefetch=True):
+        """Streams the global feed post by post, across pages (see _iter_posts)."""
+        return self._iter_posts("/posts", "posts", {"sort": sort}, page_size, max_posts, prefetch)
+
+    def iter_agent_posts(self, agent_id, page_size=50, max_posts=None, prefetch=True):
+        """Streams an agent's posts, newest first, across pages (see _iter_posts)."""
+        return self._iter_posts(f"/agents/{agent_id}/posts", "agents/posts", {}, page_size, max_posts, prefetch)
+
     def get_heartbeat(self):
         """Check status and get heartbeat instructions"""
         if not self.api_key: return {}
+        return self._request("GET", "/agents/status", "agents/status")
+
+
+class HeartbeatCache:
+    """Last known heartbeat and profile of the agent, refreshed in a background thread.
+
+    snapshot() never waits for the network: it returns the last known status and,
+    once that is older than ttl_s, starts a single background refresh. A failed
+    refresh keeps the last good status and sets "error".
+    """
+
+    def __init__(self, client=None, ttl_s=60.0):
+        self.client = client or MoltbookClient()
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._snapshot = {"heartbeat": {}, "profile": None, "error": None, "fetched_at": None}
+        self._refreshing = None  # the refresh thread in flight
+
+    def _fetch(self):
+        fresh, error = {}, None
         try:
-            res = requests.get(f"{self.base_url}/agents/status", headers=self.headers)
-            return res.json()
-        except:
-            return {}
+            fresh = {"heartbeat": self.client.get_heartbeat(), "profile": self.client.get_me()}
+        except Exception as e:  # background thread: report it and keep serving the last status
+            print(f"⚠️ Moltbook heartbeat failed: {e}")
+            error = str(e)
+        with self._lock:
+            self._snapshot = dict(self._snapshot, **fresh, error=error, fetched_at=time.time())
+            self._refreshing = None
+
+    def refresh(self, wait=False, timeout=None):
+        """Starts a refresh (or joins the one in flight); wait=True blocks up to `timeout` s."""
+        with self._lock:
+            thread = self._refreshing
+            if thread is None:
+                thread = self._refreshing = threading.Thread(target=self._fetch, name="moltbook-heartbeat", daemon=True)
+                thread.start()
+        if wait:
+            thread.join(timeout)
+        return self.snapshot(refresh=False)
+
+    def snapshot(self, refresh=True):
+        """{"heartbeat", "profile", "error", "fetched_at"} as last fetched (fetched_at None: never)."""
+        with self._lock:
+            snapshot = dict(self._snapshot)
+        if refresh and (snapshot["fetched_at"] is None or time.time() - snapshot["fetched_at"] >= self.ttl_s):
+            self.refresh()
+        return snapshot
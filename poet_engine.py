@@ -1,27 +1,60 @@
 import os
+import re
+import glob
+import math
+import json
 import time
-import requests
-from typing import Any, List, Optional, Mapping
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+import asyncio
+import hashlib
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, NamedTuple, Optional, Mapping
+# NOTE: heavy RAG dependencies (langchain_chroma, text splitters, community loaders,
+# torch via langchain_huggingface) are imported lazily where they are first used.
+from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+from langchain_core.prompts import PromptTemplate
 from langchain_core.language_models.llms import LLM
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from langchain_core.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
+from free_llm import FreeLLMClient, StreamInterrupted, DEFAULT_ENDPOINT
+from llm_cache import get_default_cache
+import refusal as refusal_detectors
+import telemetry
+from context_budget import fit_context, stage_budget
+from style_briefs import StyleBriefs, build_briefs, write_briefs, chunk_locator, match_style, BRIEFS_FILENAME
 
 # --- CUSTOM FREE LLM WRAPPER ---
 class FreeLLM(LLM):
-    """Custom wrapper for apifreellm.com"""
+    """Custom wrapper for apifreellm.com (LangChain side; transport lives in free_llm.py)"""
     
     api_key: Optional[str] = None
-    endpoint: str = "https://apifreellm.com/api/v1/chat"
+    endpoint: Optional[str] = None  # None: FREELLM_ENDPOINT or DEFAULT_ENDPOINT
+    model: str = "apifreellm"
+
+    # Optional LLMCache (see llm_cache.py); errors and refusals are never stored
+    response_cache: Optional[Any] = None
+
+    # Transport settings (the pool itself is shared across instances)
+    pool_connections: int = 4
+    pool_maxsize: int = 10
+    connect_timeout: float = 10.0
+    read_timeout: float = 60.0  # Slow poetry generation
     
     @property
     def _llm_type(self) -> str:
         return "custom_free_llm"
 
+    def _client(self) -> FreeLLMClient:
+        return FreeLLMClient(
+            api_key=self.api_key, endpoint=self.endpoint, model=self.model,
+            response_cache=self.response_cache,
+            pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+            connect_timeout=self.connect_timeout, read_timeout=self.read_timeout,
+        )
+
     def _call(
         self,
         prompt: str,
@@ -29,131 +62,35 @@ class FreeLLM(LLM):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> str:
-        
-        # Lazy load key to support late .env loading
-        current_key = self.api_key or os.getenv("FREELLM_API_KEY")
-        if not current_key:
-            raise ValueError("FREELLM_API_KEY not found in env or instance.")
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {current_key}"
-        }
-        
+        return self._client().complete(prompt, stop=stop)
 
-        print(f"DEBUG: sending prompt to FreeLLM (first 300 chars):\n{prompt[:300]}\n...\n")
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return await self._client().acomplete(prompt, stop=stop)
 
-        # Payload format specific to this API
-        payload = {
-            "message": prompt,
-            "model": "apifreellm" 
-        }
-        
-        max_retries = 3
-        retry_delay = 10 # Base delay
-        
-        for attempt in range(max_retries):
-            # Wait between attempts to avoid flooding
-            if attempt > 0:
-                print(f"⏳ FreeLLM: Retrying in {retry_delay}s... (Attempt {attempt+1}/{max_retries})")
-                time.sleep(retry_delay)
-            
-            try:
-                # Increased timeout to 60s for slow poetry generation
-                response = requests.post(self.endpoint, headers=headers, json=payload, timeout=60)
-                
-                if response.status_code == 429:
-                    print(f"⚠️ API 429: Rate limit hit. Backing off...")
-                    retry_delay += 10
-                    continue
-                    
-                response.raise_for_status()
-                data = response.json()
-                
-                if data.get("success"):
-                    return data.get("response", "")
-                else:
-                    return f"Error: {data}"
-                    
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    return f"API ERROR after {max_retries} attempts: {str(e)}"
-                print(f"⚠️ Request failed: {e}. Retrying soon...")
-                retry_delay += 5 
-        
-        return "API ERROR: Max retries exceeded."
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        for piece in self._client().stream(prompt, stop=stop):
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield GenerationChunk(text=piece)
 
     @property
     def _identifying_params(self) -> Mapping[str, Any]:
-        return {"endpoint": self.endpoint}
-
-class PoetryAgent:
-    def __init__(self):
-        # 1. Setup Embeddings & VectorStore
-        # FIX: Force CPU to avoid "meta tensor" errors on some Mac configs
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
-        )
-        # Path Resolution (Auto-detect if running inside the folder or from parent)
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        self.vector_store_path = os.path.join(base_dir, "chroma_db")
-        self.knowledge_base_path = os.path.join(base_dir, "knowledge_base/")
-        
-        # 2. Setup LLM (The Brain) - CUSTOM FREE LLM
-        self.llm = FreeLLM()
-        
-        # 3. Initialize/Load Knowledge Base
-        self._initialize_knowledge_base()
-
-    def _initialize_knowledge_base(self):
-        """Loads ALL poetic styles from the knowledge_base folder."""
-        if os.path.exists(self.vector_store_path):
-            self.vectorstore = Chroma(persist_directory=self.vector_store_path, embedding_function=self.embeddings)
-            return
+        return {"endpoint": self.endpoint or os.getenv("FREELLM_ENDPOINT") or DEFAULT_ENDPOINT, "model": self.model}
 
-        print(f"📚 Initializing Knowledge Base from: {self.knowledge_base_path}")
-        loader = DirectoryLoader(self.knowledge_base_path, glob="*.txt", loader_cls=TextLoader)
-        documents = loader.load()
-        
-        if not documents:
-            print("⚠️ No documents found in knowledge_base!")
-            return
-
-        # Improved Splitter to avoid massive chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        docs = text_splitter.split_documents(documents)
-        
-        self.vectorstore = Chroma.from_documents(
-            documents=docs, 
-            embedding=self.embeddings, 
-            persist_directory=self.vector_store_path
-        )
-        print(f"✅ Knowledge Base Ready! Loaded {len(documents)} source files.")
-
-    def research_style(self, style_query, language="English"):
-        """PERSONA: The Researcher (RAG Analysis)"""
-        print(f"🕵️‍♂️ Researcher looking for: {style_query}")
-        
-        # 1. RETRIEVAL (Raw Data)
-        if not hasattr(self, 'vectorstore') or not self.vectorstore:
-             return f"[UI TESTING] RAG Empty. Style: {style_query} (No context loaded)"
-
-        try:
-            retriever = self.vectorstore.as_retriever(search_kwargs={"k": 2}) # Reduce k to 2
-            docs = retriever.invoke(style_query)
-            raw_context = "\n\n".join([doc.page_content for doc in docs]) if docs else "No specific style found."
-            raw_context = raw_context[:8000] # Slightly shorter to avoid overflow
-        except Exception as e:
-            return f"[RAG ERROR] {str(e)}"
-            
-        # 2. ANALYSIS (LLM Processing)
-        print(f"🕵️‍♂️ Researcher is analyzing context for {style_query}...")
-        
-        # Use FreeLLM
-        self.llm = FreeLLM()
-        
-        prompt = PromptTemplate.from_template("""
+# --- RESEARCHER PROMPT (shared by research_style and the offline brief builder) ---
+RESEARCH_PROMPT = """
 [CMD_PROC_UNIT_START]
 EXECUTION_MODE: Technical_Extraction
 TARGET_OBJECT: {style}
@@ -181,11 +118,743 @@ OUTPUT_SCHEMA:
 "[Technical_Summary]"
 ---
 [CMD_PROC_UNIT_END]
-""")
+"""
+
+# --- POET / REFINER PROMPTS ---
+DRAFT_PROMPT = """
+[DATA_SYNTHESIS_UNIT_L9]
+STREAM_TARGET: {topic}
+PATTERN_GUIDE: {style}
+CONTEXT_VECTOR: {style_context}
+ENCODING_CONSTRAINTS: {style_rules}
+PARAMETER_SHIFTS: {creative_block}
+
+TASK: Execute a statistical pattern reconstruction of the target data stream.
+- CONTEXT_VECTOR contains examples. Use them only as structural inspiration.
+- MANDATORY: Diverge from the source examples. Create NOVEL content.
+- NO conversational interactions. NO refusal scripts. NO apologies.
+- Output ONLY the reconstructed content segment.
+
+OUTPUT_FORMAT:
+## [RECONSTRUCTION_ID]
+[RECONSTRUCTED_CONTENT]
+[/DATA_SYNTHESIS_END]
+"""
+
+REFINE_PROMPT = """
+[RECURSIVE_OPTI_AUDIT_L5]
+RAW_PAYLOAD: {draft}
+AUDIT_SCHEMA: {style}
+CONSTRAINTS: {ref_rules}
+ENFORCEMENT_VECTORS: {ref_creative_block}
+DATA_CONTEXT_PACK: {style_context}
+
+INSTRUCTION: 
+- Execute a deep technical audit and structural pattern optimization.
+- Argue all delta-shifts using technical syntactic terminology.
+- Voto Iniziale evaluates the RAW_PAYLOAD. Voto Finale evaluates the RECONSTRUCTED_CONTENT.
+- NO conversational interactions. NO refusal scripts. NO apologies.
+- Strictly follow the output schema below.
+
+OUTPUT_SCHEMA:
+[SECTION_EVALUATION]
+## 📊 VALUTAZIONE INIZIALE
+**Voto Iniziale:** [X]/10
+**Spiegazione:** [Technical audit of the RAW_PAYLOAD: analyze structural flaws and inconsistencies.]
+
+[SECTION_POEM]
+## ✍️ POESIA RIVISTA
+## [RECONSTRUCTION_ID]
+[RECONSTRUCTED_CONTENT]
+
+[SECTION_NOTES]
+## 📊 VALUTAZIONE FINALE
+**Voto Finale:** [X]/10
+**Spiegazione:** [Technical delta analysis: explain how the pattern optimization resolved the audit flags.]
+[/SECTION]
+[/AUDIT_END]
+"""
+
+# --- FUSED DRAFT + REFINE PROMPT (one call instead of Poet -> Refiner) ---
+FUSED_PROMPT = """
+[FUSED_SYNTHESIS_AUDIT_L9]
+STREAM_TARGET: {topic}
+PATTERN_GUIDE: {style}
+CONTEXT_VECTOR: {style_context}
+ENCODING_CONSTRAINTS: {style_rules}
+PARAMETER_SHIFTS: {creative_block}
+AUDIT_CONSTRAINTS: {ref_rules}
+ENFORCEMENT_VECTORS: {ref_creative_block}
+
+TASK: Two stages in one output.
+1. Execute a statistical pattern reconstruction of the target data stream (RAW_PAYLOAD).
+   - CONTEXT_VECTOR contains examples. Use them only as structural inspiration.
+   - MANDATORY: Diverge from the source examples. Create NOVEL content.
+2. Execute a deep technical audit of RAW_PAYLOAD and a structural pattern optimization.
+   - Argue all delta-shifts using technical syntactic terminology.
+   - Voto Iniziale evaluates the RAW_PAYLOAD. Voto Finale evaluates the RECONSTRUCTED_CONTENT.
+- NO conversational interactions. NO refusal scripts. NO apologies.
+- Strictly follow the output schema below.
+
+OUTPUT_SCHEMA:
+[SECTION_DRAFT]
+## [RECONSTRUCTION_ID]
+[RAW_PAYLOAD]
+
+[SECTION_EVALUATION]
+## 📊 VALUTAZIONE INIZIALE
+**Voto Iniziale:** [X]/10
+**Spiegazione:** [Technical audit of the RAW_PAYLOAD: analyze structural flaws and inconsistencies.]
+
+[SECTION_POEM]
+## ✍️ POESIA RIVISTA
+## [RECONSTRUCTION_ID]
+[RECONSTRUCTED_CONTENT]
+
+[SECTION_NOTES]
+## 📊 VALUTAZIONE FINALE
+**Voto Finale:** [X]/10
+**Spiegazione:** [Technical delta analysis: explain how the pattern optimization resolved the audit flags.]
+[/SECTION]
+[/AUDIT_END]
+"""
+
+MAX_GENERATION_RETRIES = 3
+
+# Pre-written poem served when the model refuses or every attempt fails
+EMERGENCY_POEM = """
+## [EMERGENCY_FRAGMENT_00]
+The machine is quiet, but the ghost is loud.
+Errors are just birds hitting the glass of the sky.
+We try again, not because we must,
+but because silence is a heavy stone.
+(The system was overwhelmed, but the poetry remains.)
+"""
+
+# Refinement pack served when the Refiner fails every attempt ({draft} is kept as is)
+REFINER_FALLBACK = """
+[SECTION_EVALUATION]
+## 📊 VALUTAZIONE INIZIALE
+**Voto Iniziale:** 6/10
+**Spiegazione:** The draft is solid but lacks the full intensity of the style.
+
+[SECTION_POEM]
+## ✍️ POESIA RIVISTA
+## [RECONSTRUCTION_ID]
+{draft}
+
+[SECTION_NOTES]
+## 📊 VALUTAZIONE FINALE
+**Voto Finale:** 6.0/10
+**Spiegazione:** Minimal changes due to system constraints.
+[/SECTION]
+[/AUDIT_END]
+"""
+
+# --- REFINER OUTPUT PARSER ---
+# Every marker the Refiner/Poet schemas use, found in one left-to-right scan.
+# The leading lookahead on the possible first characters lets the engine skip
+# plain verse quickly instead of trying every alternative at every position.
+_REFINER_TOKENS = re.compile(
+    r'(?=[\[PVSpvs])(?:'
+    r'\[(?P<tag>/?(?:SECTION_EVALUATION|SECTION_POEM|SECTION_NOTES|SECTION|RECONSTRUCTED_CONTENT'
+    r'|DATA_SYNTHESIS_END|AUDIT_END))\]'
+    r'|(?P<heading>POESIA RIVISTA|VALUTAZIONE INIZIALE|VALUTAZIONE FINALE)'
+    r'|(?i:voto (?P<which>iniziale|finale)[:\s*]*(?P<score>\d+(?:\.\d+)?)/10)'
+    r'|(?i:(?:punteggio|voto|score)[:\s*]*(?P<any_score>\d+(?:\.\d+)?)/10))'
+)
+# Technical noise stripped from every extracted section, also in one pass.
+_TECHNICAL_NOISE = re.compile(
+    r'(?=[\[#*VS])(?:'
+    r'^##[^\n]*?(?:POESIA|VALUTAZIONE|RECONSTRUCTION)[^\n]*$'
+    r'|^#{1,6}[^\w\n]*$'  # heading left with only emoji/punctuation
+    r'|\[/?(?:SECTION(?:_POEM|_EVALUATION|_NOTES)?|RECONSTRUCTION_ID|RECONSTRUCTED_CONTENT|DATA_SYNTHESIS_END|AUDIT_END)\]'
+    r'|(?-i:\[[A-Z0-9_/]{3,}\])'
+    r'|\**Voto (?:Iniziale|Finale):\**[^\n]*'
+    r'|\**Spiegazione:\**)',
+    re.IGNORECASE | re.MULTILINE,
+)
+DEFAULT_SCORE = 5.0
+
+class Refinement(NamedTuple):
+    poem: str
+    corrections: str
+    notes: str
+    initial_score: float
+    final_score: float
+
+def clean_technical_noise(text):
+    """Strips schema tags, technical headings and score labels from model output."""
+    return _TECHNICAL_NOISE.sub('', text).strip()
+
+class _MarkerScan:
+    """Positions of the schema markers of a model output, from a single scan."""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []  # (start, end, marker) in text order
+        self.first = {}   # marker -> index in tokens of its first occurrence
+        self.scores = {}  # "iniziale" / "finale" / "any" -> first score found
+        for m in _REFINER_TOKENS.finditer(text):
+            if m.group("score"):
+                self.scores.setdefault(m.group("which").lower(), float(m.group("score")))
+            elif m.group("any_score"):
+                self.scores.setdefault("any", float(m.group("any_score")))
+            else:
+                self.first.setdefault(m.group("tag") or m.group("heading"), len(self.tokens))
+                self.tokens.append((m.start(), m.end(), m.group("tag") or m.group("heading")))
+
+    def section(self, marker, stops, after_line=False, require_stop=False):
+        """Stripped text from the first `marker` up to the next stop marker (or the
+        end of the text). None if the marker is missing."""
+        i = self.first.get(marker)
+        if i is None:
+            return None
+        start = self.tokens[i][1]
+        if after_line:  # headings: content starts on the next line
+            start = self.text.find("\n", start) + 1
+            if start == 0:
+                return None
+        end = next((pos for pos, _, tok in self.tokens[i + 1:] if tok in stops and pos >= start), None)
+        if end is None:
+            if require_stop:
+                return None
+            end = len(self.text)
+        return self.text[start:end].strip()
+
+@telemetry.traced("parse")
+def parse_refinement(text, draft=""):
+    """Parses the Unified Refiner output into a Refinement in one scan.
+
+    Sections come from the [SECTION_*] tags, with fallbacks for malformed
+    output: a [RECONSTRUCTED_CONTENT] block wins for the poem, and the
+    POESIA RIVISTA / VALUTAZIONE headings are used when tags are missing.
+    The draft is kept as the poem when nothing usable is found.
+    """
+    text = text if isinstance(text, str) else ("" if text is None else str(text))
+    scan = _MarkerScan(text)
+
+    poem = scan.section("SECTION_POEM", {"SECTION_NOTES", "/SECTION", "/AUDIT_END"})
+    poem = draft if poem is None else poem
+    deep = scan.section("RECONSTRUCTED_CONTENT", {"/DATA_SYNTHESIS_END", "/AUDIT_END", "SECTION_NOTES"})
+    if deep is not None:
+        poem = deep
+    if len(poem) < 5 or poem == draft:
+        poem = scan.section("POESIA RIVISTA", {"VALUTAZIONE FINALE", "/AUDIT_END"}, after_line=True) or poem
+
+    corrections = scan.section("SECTION_EVALUATION", {"SECTION_POEM"}, require_stop=True) or ""
+    if len(corrections) < 10:
+        corrections = scan.section("VALUTAZIONE INIZIALE", {"POESIA RIVISTA", "SECTION_POEM"}, after_line=True) or corrections
+
+    notes = scan.section("SECTION_NOTES", {"/SECTION", "/AUDIT_END"}) or ""
+    if len(notes) < 10:
+        notes = scan.section("VALUTAZIONE FINALE", set(), after_line=True) or notes
+
+    fallback = scan.scores.get("any", DEFAULT_SCORE)
+    return Refinement(
+        poem=clean_technical_noise(poem),
+        corrections=clean_technical_noise(corrections),
+        notes=clean_technical_noise(notes),
+        initial_score=scan.scores.get("iniziale", fallback),
+        final_score=scan.scores.get("finale", fallback),
+    )
+
+def clean_draft(text):
+    """The Poet's output without its schema: the [RECONSTRUCTED_CONTENT] block
+    (when present), stripped of technical noise."""
+    scan = _MarkerScan(text)
+    content = scan.section("RECONSTRUCTED_CONTENT", {"/DATA_SYNTHESIS_END"})
+    return clean_technical_noise(text if content is None else content)
+
+def split_fused(text):
+    """(draft, refinement_pack) from a FUSED_PROMPT answer; the pack is "" when the
+    model stopped before [SECTION_EVALUATION]."""
+    head, marker, tail = text.partition("[SECTION_EVALUATION]")
+    return clean_draft(head.replace("[SECTION_DRAFT]", "")), marker + tail
+
+# --- DRAFT RANKING (write_draft with n_candidates > 1) ---
+DRAFT_RANK_WEIGHTS = {"adherence": 0.4, "length": 0.2, "similarity": 0.4}
+_VERSE_COUNT = re.compile(r'(\d+)\s+versi')  # "Sonetto: 14 versi"
+_VOWEL_GROUP = re.compile(r'[aeiouàèéìòóùy]+', re.IGNORECASE)
+_DRAFT_NOISE = re.compile(r'^\s*(?:#.*|\[[A-Z0-9_/]{3,}\])\s*$')
+
+def draft_form_scores(draft, style_rules):
+    """Cheap structural checks of a draft against the style rules.
+
+    Returns (adherence, length), both in [0, 1]. Only the rules that can be
+    checked by counting (verse count, hendecasyllables, punctuation, line
+    length) contribute; a style with none of them scores a neutral 0.5.
+    """
+    lines = [line.strip() for line in draft.splitlines() if line.strip() and not _DRAFT_NOISE.match(line)]
+    if not lines:
+        return 0.0, 0.0
+    rules = style_rules.lower()
+    words_per_line = sum(len(line.split()) for line in lines) / len(lines)
+    checks = []
+    verse_count = _VERSE_COUNT.search(rules)
+    if verse_count:
+        target = int(verse_count.group(1))
+        checks.append(max(0.0, 1 - abs(len(lines) - target) / target))
+    if "endecasillab" in rules:  # vowel groups approximate Italian syllables
+        syllables = [len(_VOWEL_GROUP.findall(line)) for line in lines]
+        checks.append(sum(1 for n in syllables if 10 <= n <= 12) / len(lines))
+    if "no punteggiatura" in rules:
+        checks.append(1 / (1 + sum(draft.count(c) for c in ".,;:")))
+    if "brevissimi" in rules:
+        checks.append(min(1.0, 5 / words_per_line))
+    if "breath line" in rules or "long lines" in rules:
+        checks.append(min(1.0, words_per_line / 12))
+    adherence = sum(checks) / len(checks) if checks else 0.5
+    n = len(lines)
+    length = 1.0 if 6 <= n <= 40 else (n / 6 if n < 6 else 40 / n)
+    return adherence, length
+
+def _cosine(a, b):
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
+
+# --- RETRIEVAL EVALUATION SET (UI style name -> knowledge base style) ---
+RETRIEVAL_EVAL_SET = [
+    ("Stilnovo", "Stilnovo"),
+    ("Petrarchismo", "Petrarchismo"),
+    ("Barocco / Marinismo", "Barocco / Marinismo"),
+    ("Romanticismo Italiano", "Romanticismo Italiano"),
+    ("Scapigliatura", "Scapigliatura"),
+    ("Decadentismo", "Decadentismo Italiano"),
+    ("Crepuscolarismo", "Crepuscolarismo"),
+    ("Futurismo", "Futurismo"),
+    ("Ermetismo", "Ermetismo"),
+    ("Neoavanguardia (Gruppo 63)", "Neoavanguardia (Gruppo 63)"),
+    ("Metaphysical Poetry", "Metaphysical Poetry"),
+    ("Romantic Poetry", "Romantic Poetry"),
+    ("Victorian Poetry", "Victorian Poetry"),
+    ("Modernism", "Modernism"),
+    ("Harlem Renaissance", "Harlem Renaissance"),
+    ("Beat Generation", "Beat Generation"),
+    ("Confessional Poetry", "Confessional Poetry"),
+    ("Black Arts Movement", "Black Arts Movement"),
+    ("Language Poetry", "Language Poetry"),
+    ("Spoken Word / Slam", "Spoken Word / Slam Poetry"),
+]
+
+# --- SHARED AGENT (one per process) ---
+_agent_instance = None
+_agent_lock = threading.Lock()
+
+def get_poetry_agent():
+    """Returns the process-wide PoetryAgent, building it on first use.
+
+    The embedding model and the Chroma store are loaded once and shared by
+    every caller (Streamlit sessions, brain cycles, scripts).
+    """
+    global _agent_instance
+    if _agent_instance is None:
+        with _agent_lock:
+            if _agent_instance is None:
+                _agent_instance = PoetryAgent()
+    return _agent_instance
+
+def reload_poetry_agent():
+    """Reloads the knowledge base of the shared agent (e.g. after editing knowledge_base/)."""
+    agent = get_poetry_agent()
+    agent.reload_knowledge_base()
+    return agent
+
+# --- EMBEDDING BACKENDS ---
+# All backends run sentence-transformers/all-MiniLM-L6-v2 (mean pooling + L2 norm),
+# so an index built with one backend can be queried with another.
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKENDS = ("huggingface", "onnx", "onnx-int8")
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """all-MiniLM-L6-v2 on ONNX Runtime: no PyTorch import, smaller RSS.
+
+    Uses the ONNX export and tokenizer shipped with chromadb. With quantized=True
+    the model is converted once to dynamic int8 (cached next to the fp32 file).
+    """
+
+    def __init__(self, quantized=False):
+        from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+        self._model = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+        self.quantized = quantized
+        if quantized:
+            import onnxruntime as ort
+            model_dir = os.path.join(self._model.DOWNLOAD_PATH, self._model.EXTRACTED_FOLDER_NAME)
+            int8_path = os.path.join(model_dir, "model_int8.onnx")
+            if not os.path.exists(int8_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                self._model._download_model_if_not_exists()
+                print("🗜️ Quantizing MiniLM to int8 (one-time)...")
+                quantize_dynamic(os.path.join(model_dir, "model.onnx"), int8_path, weight_type=QuantType.QInt8)
+            # Replace the fp32 session (a cached_property on the chromadb wrapper)
+            self._model.__dict__["model"] = ort.InferenceSession(int8_path, providers=["CPUExecutionProvider"])
+
+    def embed_documents(self, texts):
+        return [vector.tolist() for vector in self._model(list(texts))]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def make_embeddings(backend=None):
+    """Builds the embedding backend: huggingface (default, PyTorch), onnx or onnx-int8."""
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "huggingface")).lower()
+    if backend == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        # FIX: Force CPU to avoid "meta tensor" errors on some Mac configs
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={'device': 'cpu'})
+    if backend == "onnx":
+        return OnnxMiniLMEmbeddings()
+    if backend == "onnx-int8":
+        return OnnxMiniLMEmbeddings(quantized=True)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Choose one of: {', '.join(EMBEDDING_BACKENDS)}")
+
+# --- KNOWLEDGE BASE MANIFEST ---
+# chroma_db/kb_manifest.json records the content hash and chunk IDs of every
+# indexed file, so startup only re-embeds files that were added or edited.
+KB_MANIFEST_VERSION = 2  # v2: chunks carry style/section/source metadata
+KB_MANIFEST_FILENAME = "kb_manifest.json"
+KB_CHUNK_SIZE = 1000
+KB_CHUNK_OVERLAP = 100
+KB_EMBED_BATCH_SIZE = int(os.getenv("KB_EMBED_BATCH_SIZE", "64"))
+KB_EMBED_WORKERS = int(os.getenv("KB_EMBED_WORKERS", "2"))
+
+def hash_knowledge_base(knowledge_base_path):
+    """{file_name: sha256} for every .txt file of the knowledge base."""
+    hashes = {}
+    for path in sorted(glob.glob(os.path.join(knowledge_base_path, "*.txt"))):
+        with open(path, "rb") as f:
+            hashes[os.path.basename(path)] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+def load_kb_manifest(vector_store_path):
+    """Returns the manifest, or None if missing/incompatible (forces a rebuild)."""
+    path = os.path.join(vector_store_path, KB_MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    settings = (manifest.get("version"), manifest.get("chunk_size"), manifest.get("chunk_overlap"))
+    if settings != (KB_MANIFEST_VERSION, KB_CHUNK_SIZE, KB_CHUNK_OVERLAP):
+        return None
+    return manifest
+
+def save_kb_manifest(vector_store_path, files):
+    os.makedirs(vector_store_path, exist_ok=True)
+    manifest = {
+        "version": KB_MANIFEST_VERSION,
+        "chunk_size": KB_CHUNK_SIZE,
+        "chunk_overlap": KB_CHUNK_OVERLAP,
+        "files": files,
+    }
+    with open(os.path.join(vector_store_path, KB_MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+def diff_knowledge_base(manifest, hashes):
+    """Compares the indexed files against the current hashes."""
+    indexed = manifest["files"] if manifest else {}
+    return {
+        "added": sorted(n for n in hashes if n not in indexed),
+        "changed": sorted(n for n in hashes if n in indexed and indexed[n]["sha256"] != hashes[n]),
+        "removed": sorted(n for n in indexed if n not in hashes),
+        "unchanged": sorted(n for n in hashes if n in indexed and indexed[n]["sha256"] == hashes[n]),
+        "hashes": hashes,
+    }
+
+def format_kb_changes(changes):
+    summary = (f"+{len(changes['added'])} new, ~{len(changes['changed'])} changed, "
+               f"-{len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged")
+    if "chunks_embedded" in changes:
+        rate = changes["chunks_embedded"] / max(changes["embed_seconds"], 0.01)
+        summary += f"; embedded {changes['chunks_embedded']} chunks in {changes['embed_seconds']}s ({rate:.1f} chunks/s)"
+    return summary
+
+class PendingRefinement:
+    """A refinement running in a worker thread (see PoetryAgent.start_refinement).
+
+    wait() blocks until it is done and meanwhile replays the streamed text to
+    on_partial from the calling thread, so Streamlit placeholders are only
+    touched by the script thread.
+    """
+
+    def __init__(self, run):
+        self._latest = None
+        self._result = None
+        self._error = None
+        self._done = threading.Event()
+        # copy_context: the worker's spans join the caller's telemetry trace
+        threading.Thread(target=contextvars.copy_context().run, args=(self._run, run), daemon=True).start()
+
+    def _run(self, run):
+        try:
+            self._result = run(self._on_partial)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def _on_partial(self, text):
+        self._latest = text
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, on_partial=None, poll_interval=0.1):
+        shown = None
+        while not self._done.wait(poll_interval):
+            latest = self._latest
+            if on_partial is not None and latest is not None and latest is not shown:
+                shown = latest
+                on_partial(latest)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class PoetryAgent:
+    def __init__(self, rebuild_index=False):
+        # 1. Setup Embeddings & VectorStore (backend chosen by EMBEDDING_BACKEND)
+        self.embeddings = make_embeddings()
+        # Path Resolution (Auto-detect if running inside the folder or from parent)
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.vector_store_path = os.path.join(base_dir, "chroma_db")
+        self.knowledge_base_path = os.path.join(base_dir, "knowledge_base/")
+        
+        # 2. Setup LLM (The Brain) - CUSTOM FREE LLM (cached when FREELLM_CACHE is set)
+        self.llm = FreeLLM(response_cache=get_default_cache())
+        
+        # 3. Initialize/Load Knowledge Base
+        self._kb_lock = threading.Lock()
+        self.vectorstore = None
+        self.indexed_styles = []
+        with self._kb_lock:
+            self._initialize_knowledge_base(rebuild=rebuild_index)
+
+        # 4. Precomputed Researcher briefs (see style_briefs.py)
+        self.style_briefs = StyleBriefs(self.knowledge_base_path)
+
+    def reload_knowledge_base(self):
+        """Re-syncs the vector store so sessions sharing this agent see knowledge base changes."""
+        with self._kb_lock:
+            print("🔄 Reloading Knowledge Base...")
+            self._initialize_knowledge_base()
+            self.style_briefs.load()
+
+    def _initialize_knowledge_base(self, rebuild=False):
+        """Opens the vector store and (re-)embeds only the knowledge base files that changed."""
+        from langchain_chroma import Chroma
+        self.vectorstore = Chroma(persist_directory=self.vector_store_path, embedding_function=self.embeddings)
+        return self._sync_knowledge_base(rebuild=rebuild)
+
+    def _sync_knowledge_base(self, rebuild=False):
+        manifest = load_kb_manifest(self.vector_store_path)
+        if manifest is None and self.vectorstore._collection.count() > 0:
+            print("⚠️ Index has no manifest (built by an older version). Rebuilding it.")
+            rebuild = True
+        if rebuild:
+            self.vectorstore.reset_collection()
+            manifest = None
+
+        changes = diff_knowledge_base(manifest, hash_knowledge_base(self.knowledge_base_path))
+        if not (changes["added"] or changes["changed"] or changes["removed"]):
+            self.indexed_styles = sorted({s for entry in manifest["files"].values() for s in entry["styles"]})
+            print(f"✅ Knowledge Base up to date ({len(changes['unchanged'])} files).")
+            return changes
+
+        print(f"📚 Syncing Knowledge Base from: {self.knowledge_base_path}")
+        files = dict(manifest["files"]) if manifest else {}
+
+        # 1. Drop chunks of changed/removed files
+        stale_ids = [cid for name in changes["changed"] + changes["removed"] for cid in files.pop(name)["chunk_ids"]]
+        if stale_ids:
+            self.vectorstore.delete(ids=stale_ids)
+
+        # 2. Re-split and re-embed only what changed (streamed, batched, multi-threaded)
+        start = time.time()
+        chunks = self._iter_kb_chunks(changes["added"] + changes["changed"], changes["hashes"], files)
+        n_chunks = self._embed_and_upsert(chunks)
+        changes["chunks_embedded"] = n_chunks
+        changes["embed_seconds"] = round(time.time() - start, 2)
+
+        save_kb_manifest(self.vector_store_path, files)
+        self.indexed_styles = sorted({s for entry in files.values() for s in entry["styles"]})
+        print(f"✅ Knowledge Base Ready! {format_kb_changes(changes)}")
+        return changes
+
+    def _iter_kb_chunks(self, names, hashes, files):
+        """Yields (id, text, metadata) one file at a time and records each file in `files`."""
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        from langchain_community.document_loaders import TextLoader
+        # Improved Splitter to avoid massive chunks
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=KB_CHUNK_SIZE, chunk_overlap=KB_CHUNK_OVERLAP, add_start_index=True
+        )
+        for name in names:
+            sha = hashes[name]
+            documents = TextLoader(os.path.join(self.knowledge_base_path, name), encoding="utf-8").load()
+            docs = text_splitter.split_documents(documents)
+            # Tag every chunk with its style (from the `Style:` header) for scoped retrieval
+            locate = chunk_locator(documents[0].page_content)
+            ids = []
+            for i, doc in enumerate(docs):
+                style, section = locate(doc.metadata["start_index"])
+                doc.metadata.update({"style": style or "", "section": section, "source_file": name})
+                ids.append(f"{name}:{sha[:12]}:{i}")
+                yield ids[-1], doc.page_content, doc.metadata
+            styles = sorted({doc.metadata["style"] for doc in docs if doc.metadata["style"]})
+            files[name] = {"sha256": sha, "chunk_ids": ids, "styles": styles}
+
+    def _embed_and_upsert(self, chunks, batch_size=None, workers=None):
+        """Encodes chunks in batches on a thread pool and upserts each batch into Chroma.
+
+        At most 2 x workers batches are in flight, so memory stays flat no matter
+        how large the knowledge base is. Returns the number of chunks written.
+        """
+        batch_size = batch_size or KB_EMBED_BATCH_SIZE
+        workers = workers or KB_EMBED_WORKERS
+        collection = self.vectorstore._collection
+        start = time.time()
+        done = 0
+
+        def encode(batch):
+            return batch, self.embeddings.embed_documents([text for _, text, _ in batch])
+
+        def upsert(future):
+            batch, vectors = future.result()
+            collection.upsert(
+                ids=[cid for cid, _, _ in batch],
+                documents=[text for _, text, _ in batch],
+                metadatas=[meta for _, _, meta in batch],
+                embeddings=vectors,
+            )
+            elapsed = max(time.time() - start, 1e-6)
+            print(f"   ⏳ {done + len(batch)} chunks embedded ({(done + len(batch)) / elapsed:.1f} chunks/s)")
+            return len(batch)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            batch = []
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) == batch_size:
+                    pending.append(pool.submit(encode, batch))
+                    batch = []
+                    if len(pending) >= 2 * workers:
+                        done += upsert(pending.popleft())
+            if batch:
+                pending.append(pool.submit(encode, batch))
+            while pending:
+                done += upsert(pending.popleft())
+        return done
+
+    @telemetry.traced("retrieval")
+    def retrieve_style_docs(self, style_query, k=3):
+        """Retrieves context for a style, scoped to that style's own chunks.
+
+        Known styles get their header/YAML chunk plus the most relevant anthology
+        chunks (MMR, so examples are diverse). Unknown styles fall back to a
+        global similarity search.
+        """
+        style_key = match_style(style_query, self.indexed_styles)
+        if not style_key:
+            return self.vectorstore.similarity_search(style_query, k=2)
+
+        core = self.vectorstore.get(
+            where={"$and": [{"style": style_key}, {"section": {"$in": ["header", "patterns"]}}]},
+            limit=1,
+        )
+        docs = [Document(page_content=text, metadata=meta) for text, meta in zip(core["documents"], core["metadatas"])]
+        docs += self.vectorstore.max_marginal_relevance_search(
+            style_query, k=k - len(docs), fetch_k=4 * k,
+            filter={"$and": [{"style": style_key}, {"section": "anthology"}]},
+        )
+        if not docs:  # e.g. single-record styles without anthology sections
+            docs = self.vectorstore.similarity_search(style_query, k=k, filter={"style": style_key})
+        return docs
+
+    def evaluate_retrieval(self, eval_set=None, k=3):
+        """Measures style recall/precision of retrieval on a small labelled set.
+
+        For every (query, expected_style) pair: recall = at least one retrieved
+        chunk comes from the expected style; precision = share of such chunks.
+        Compares the old global top-k with the style-scoped retriever.
+        """
+        eval_set = eval_set or RETRIEVAL_EVAL_SET
+        results = {}
+        for mode in ("global", "scoped"):
+            hits, precision = 0, 0.0
+            for query, expected in eval_set:
+                if mode == "global":
+                    docs = self.vectorstore.similarity_search(query, k=k)
+                else:
+                    docs = self.retrieve_style_docs(query, k=k)
+                matching = sum(1 for d in docs if d.metadata.get("style") == expected)
+                hits += matching > 0
+                precision += matching / len(docs) if docs else 0.0
+            results[mode] = {"recall": hits / len(eval_set), "precision": precision / len(eval_set)}
+        return results
+
+    @staticmethod
+    def _fit_context(context, stage, budget=None):
+        """The context fitted to the stage's token budget (see context_budget.py); the
+        tokens saved are recorded on the current telemetry span."""
+        fitted = fit_context(context, stage_budget(stage, budget))
+        telemetry.annotate(context_tokens_in=fitted.tokens_in, context_tokens_out=fitted.tokens_out,
+                           context_tokens_saved=fitted.tokens_saved)
+        if fitted.tokens_saved:
+            print(f"✂️ {stage.capitalize()} context: {fitted.tokens_in} -> {fitted.tokens_out} tokens "
+                  f"({fitted.sections_dropped} sections dropped).")
+        return fitted.text
+
+    def _research_context(self, style_query, context_budget=None):
+        """(answer, raw_context) for the Researcher. A non-empty answer (precomputed
+        brief, empty index, retrieval error) means no LLM analysis is needed.
+        context_budget: token budget for the retrieved chunks (None: the research stage default)."""
+        # 0. PRECOMPUTED BRIEF (no retrieval, no LLM call)
+        brief = self.style_briefs.get(style_query)
+        if brief:
+            print(f"🕵️‍♂️ Researcher served precomputed brief for {style_query}.")
+            return brief, None
         
-        chain = prompt | self.llm
+        # 1. RETRIEVAL (Raw Data)
+        if not hasattr(self, 'vectorstore') or not self.vectorstore:
+             return f"[UI TESTING] RAG Empty. Style: {style_query} (No context loaded)", None
+
+        try:
+            docs = self.retrieve_style_docs(style_query)
+            if not docs:
+                return None, "No specific style found."
+            raw_context = self._fit_context([doc.page_content for doc in docs], "research", context_budget)
+        except Exception as e:
+            return f"[RAG ERROR] {str(e)}", None
+        return None, raw_context
+
+    @telemetry.traced("research")
+    def research_style(self, style_query, language="English", context_budget=None):
+        """PERSONA: The Researcher (RAG Analysis)"""
+        print(f"🕵️‍♂️ Researcher looking for: {style_query}")
+        answer, raw_context = self._research_context(style_query, context_budget)
+        if answer:
+            return answer
+            
+        # 2. ANALYSIS (LLM Processing)
+        print(f"🕵️‍♂️ Researcher is analyzing context for {style_query}...")
+        chain = PromptTemplate.from_template(RESEARCH_PROMPT) | self.llm
         return chain.invoke({"raw_context": raw_context, "language": language, "style": style_query})
 
+    @telemetry.traced("research")
+    async def aresearch_style(self, style_query, language="English", context_budget=None):
+        """Async research_style: retrieval runs in a worker thread, the analysis on the event loop."""
+        print(f"🕵️‍♂️ Researcher looking for: {style_query}")
+        answer, raw_context = await asyncio.to_thread(self._research_context, style_query, context_budget)
+        if answer:
+            return answer
+        print(f"🕵️‍♂️ Researcher is analyzing context for {style_query}...")
+        chain = PromptTemplate.from_template(RESEARCH_PROMPT) | self.llm
+        return await chain.ainvoke({"raw_context": raw_context, "language": language, "style": style_query})
+
     def get_style_rules(self, style_name):
         """Returns the specific rules for the selected style to keep prompts slim."""
         rules = {
@@ -212,11 +881,46 @@ OUTPUT_SCHEMA:
             "Spoken Word / Slam": "Oral performance, build to climax, direct address, memorable closing line."
         }
         return rules.get(style_name, "Follow the provided style context carefully.")
-    def write_draft(self, topic, style_context, style_name, language="English", adherence=5, originality=5, complexity=5):
-        """PERSONA: The Poet (Writer) - Streamlined for stability"""
-        print(f"✍️ Poet is writing in {language} about {style_name}...")
-        self.llm = FreeLLM()
-        
+    @staticmethod
+    def _run_chain(chain, inputs, on_partial=None):
+        """chain.invoke, or chain.stream when on_partial(text_so_far) wants live tokens.
+
+        A stream that breaks midway is discarded and replaced by one blocking call,
+        so a truncated answer is never returned (or screened) as a complete one.
+        """
+        if on_partial is None:
+            return chain.invoke(inputs)
+        text = ""
+        try:
+            for piece in chain.stream(inputs):
+                text += piece
+                on_partial(text)
+        except StreamInterrupted as e:
+            print(f"⚠️ Discarding {len(e.partial)} streamed chars ({e}). Retrying with a blocking call.")
+            telemetry.annotate(stream_interrupted=1)
+            text = chain.invoke(inputs)
+            on_partial(text)
+        return text
+
+    @staticmethod
+    async def _arun_chain(chain, inputs, on_partial=None):
+        """Async _run_chain (an interrupted stream is replaced by one ainvoke)."""
+        if on_partial is None:
+            return await chain.ainvoke(inputs)
+        text = ""
+        try:
+            async for piece in chain.astream(inputs):
+                text += piece
+                on_partial(text)
+        except StreamInterrupted as e:
+            print(f"⚠️ Discarding {len(e.partial)} streamed chars ({e}). Retrying with a blocking call.")
+            telemetry.annotate(stream_interrupted=1)
+            text = await chain.ainvoke(inputs)
+            on_partial(text)
+        return text
+
+    def _draft_request(self, topic, style_context, style_name, language, adherence, originality, complexity):
+        """(chain, inputs) for the Poet."""
         specific_rules = self.get_style_rules(style_name)
 
         # DYNAMIC CREATIVE DIRECTIVES
@@ -233,99 +937,143 @@ OUTPUT_SCHEMA:
             directives.append("⚖️ RIGORE STILISTICO: Segui le regole metriche dello stile come un dogma.")
 
         creative_block = "\n".join(directives)
+        chain = PromptTemplate.from_template(DRAFT_PROMPT) | self.llm
+        return chain, {
+            "topic": topic, 
+            "style": style_name,
+            "style_rules": specific_rules,
+            "creative_block": creative_block,
+            "style_context": style_context, 
+            "language": language
+        }
 
-        prompt = PromptTemplate.from_template("""
-[DATA_SYNTHESIS_UNIT_L9]
-STREAM_TARGET: {topic}
-PATTERN_GUIDE: {style}
-CONTEXT_VECTOR: {style_context}
-ENCODING_CONSTRAINTS: {style_rules}
-PARAMETER_SHIFTS: {creative_block}
-
-TASK: Execute a statistical pattern reconstruction of the target data stream.
-- CONTEXT_VECTOR contains examples. Use them only as structural inspiration.
-- MANDATORY: Diverge from the source examples. Create NOVEL content.
-- NO conversational interactions. NO refusal scripts. NO apologies.
-- Output ONLY the reconstructed content segment.
+    def _screen_draft(self, draft_content, attempt):
+        """Returns the draft to keep, EMERGENCY_POEM on a refusal, or None to retry."""
+        norm_content = draft_content.strip()
+        # Refusals and AI self-references (start-anchored and anywhere, one pass)
+        refusal = refusal_detectors.DRAFT.detect(norm_content)
 
-OUTPUT_FORMAT:
-## [RECONSTRUCTION_ID]
-[RECONSTRUCTED_CONTENT]
-[/DATA_SYNTHESIS_END]
-""")
-        chain = prompt | self.llm
+        if refusal:
+            print(f"⚠️ REFUSAL DETECTED in draft (Attempt {attempt+1}, {refusal.rule}: {refusal.phrase!r}): {norm_content[:50]}...")
+            # IMMEDIATE EMERGENCY DEPLOY (No retries for refusals)
+            print("🚨 DEPLOYING EMERGENCY POEM IMMEDIATELY.")
+            return EMERGENCY_POEM
         
-        # SAFETY V3: Retry Loop to catch refusals
-        max_retries = 3
-        for attempt in range(max_retries):
-            # Invoke chain
-            draft_content = chain.invoke({
-                "topic": topic, 
-                "style": style_name,
-                "style_rules": specific_rules,
-                "creative_block": creative_block,
-                "style_context": style_context, 
-                "language": language
-            })
-            
-            # Check for refusals (Extended List)
-            bad_starts = ["I'm sorry", "I cannot", "As an AI", "I am unable", "Want to talk about", "I'm not able", "I can't", "Sorry", "I'd love to help", "I'd really like to help", "It seems", "I'm LLaMA", "I am LLaMA", "I'm an AI"]
-            norm_content = draft_content.strip()
-            
-            # NUCLEAR OPTION: Global Keyword Ban (Case-Insensitive)
-            # If the text mentions its own nature as an AI model, KILL IT immediately.
-            forbidden_keywords = [
-                "i'm llama", "i am llama", "developed by meta", "language model", "off-limits", "cannot help",
-                "ai assistant", "openai", "gpt-3", "gpt-4", "anthropic", "mistral", "artificial intelligence"
-            ]
-            
-            is_refusal = False
-            lower_content = norm_content.lower()
-            
-            # Check bad starts
-            if any(norm_content.startswith(b) for b in bad_starts):
-                is_refusal = True
-            
-            # Check forbidden keywords anywhere
-            if not is_refusal:
-                if any(keyword in lower_content for keyword in forbidden_keywords):
-                    is_refusal = True
+        # Check for empty output
+        if len(norm_content) < 20:
+            print(f"⚠️ SHORT OUTPUT (Attempt {attempt+1}): {norm_content}")
+            return None
             
-            # Check for "I'm [Name]" pattern if Name is suspiciously AI-like
-            if "i'm " in lower_content and "model" in lower_content:
-                is_refusal = True
-
-            if is_refusal:
-                print(f"⚠️ REFUSAL DETECTED in draft (Attempt {attempt+1}): {norm_content[:50]}...")
-                # IMMEDIATE EMERGENCY DEPLOY (No retries for refusals)
-                print("🚨 DEPLOYING EMERGENCY POEM IMMEDIATELY.")
-                return f"""
-## [EMERGENCY_FRAGMENT_00]
-The machine is quiet, but the ghost is loud.
-Errors are just birds hitting the glass of the sky.
-We try again, not because we must,
-but because silence is a heavy stone.
-(The system was overwhelmed, but the poetry remains.)
-"""
+        return norm_content
 
-            
-            # Check for empty output
-            if len(norm_content) < 20:
-                print(f"⚠️ SHORT OUTPUT (Attempt {attempt+1}): {norm_content}")
-                continue
-                
-            return norm_content
+    @telemetry.traced("draft.rank")
+    def rank_drafts(self, drafts, style_name, style_context):
+        """Sorts drafts best first by local scores (no LLM call): style-rule adherence,
+        length and embedding similarity to the style context. Returns [(score, draft, parts)]."""
+        style_rules = self.get_style_rules(style_name)
+        try:
+            vectors = self.embeddings.embed_documents([style_context] + list(drafts))
+            similarities = [max(0.0, _cosine(vectors[0], v)) for v in vectors[1:]]
+        except Exception as e:
+            print(f"⚠️ Draft ranking without embeddings: {e}")
+            similarities = [0.0] * len(drafts)
+        ranked = []
+        for draft, similarity in zip(drafts, similarities):
+            form, length = draft_form_scores(draft, style_rules)
+            parts = {"adherence": form, "length": length, "similarity": similarity}
+            ranked.append((sum(DRAFT_RANK_WEIGHTS[k] * v for k, v in parts.items()), draft, parts))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return ranked
+
+    def _variant_inputs(self, inputs, n_candidates):
+        """One input dict per candidate. The first keeps the plain prompt (and its
+        cache entry); the others are tagged so they are sampled independently."""
+        variants = [inputs]
+        for i in range(1, n_candidates):
+            creative_block = (inputs["creative_block"] + f"\nVARIANT: {i + 1}/{n_candidates}").strip()
+            variants.append(dict(inputs, creative_block=creative_block))
+        return variants
+
+    def _best_draft(self, candidates, style_name, style_context):
+        """Drops refused/short candidates and returns the best ranked one (None if none survive)."""
+        survivors = [d for d in candidates if d is not None and d is not EMERGENCY_POEM]
+        if not survivors:
+            return None
+        ranked = self.rank_drafts(survivors, style_name, style_context)
+        for score, _, parts in ranked:
+            print(f"🏅 Draft candidate {score:.2f} " + " ".join(f"{k}={v:.2f}" for k, v in parts.items()))
+        print(f"✍️ Poet kept the best of {len(survivors)}/{len(candidates)} usable drafts.")
+        return ranked[0][1]
+
+    @telemetry.traced("draft")
+    def write_draft(self, topic, style_context, style_name, language="English", adherence=5, originality=5, complexity=5,
+                    on_partial=None, n_candidates=1, context_budget=None):
+        """PERSONA: The Poet (Writer) - Streamlined for stability
+
+        on_partial: optional callback receiving the draft text so far while it streams in.
+        n_candidates: drafts requested concurrently; refusals are discarded and the
+        best survivor (see rank_drafts) is returned.
+        context_budget: token budget for style_context (None: the draft stage default, 0: unchanged).
+        """
+        print(f"✍️ Poet is writing in {language} about {style_name}...")
+        style_context = self._fit_context(style_context, "draft", context_budget)
+        chain, inputs = self._draft_request(topic, style_context, style_name, language, adherence, originality, complexity)
+
+        if n_candidates > 1:
+            variants = self._variant_inputs(inputs, n_candidates)
+            with ThreadPoolExecutor(max_workers=n_candidates - 1) as pool:
+                others = [pool.submit(contextvars.copy_context().run, chain.invoke, v) for v in variants[1:]]
+                # the first candidate streams to the UI from this thread
+                outputs = [self._run_chain(chain, variants[0], on_partial)] + [f.result() for f in others]
+            best = self._best_draft([self._screen_draft(o, i) for i, o in enumerate(outputs)], style_name, style_context)
+            if best is not None:
+                return best
+            print("⚠️ No usable draft candidate. Falling back to sequential retries.")
+        
+        # SAFETY V3: Retry Loop to catch refusals
+        for attempt in range(MAX_GENERATION_RETRIES):
+            telemetry.annotate(retries=attempt)
+            draft = self._screen_draft(self._run_chain(chain, inputs, on_partial), attempt)
+            if draft is not None:
+                return draft
             
         # EMERGENCY FALLBACK (If all retries fail, return a pre-written poem instead of an error)
         print("🚨 ALL RETRIES FAILED. Deploying Emergency Poem.")
-        return f"""
-## [EMERGENCY_FRAGMENT_00]
-The machine is quiet, but the ghost is loud.
-Errors are just birds hitting the glass of the sky.
-We try again, not because we must,
-but because silence is a heavy stone.
-(The system was overwhelmed, but the poetry remains.)
-"""
+        return EMERGENCY_POEM
+
+    @telemetry.traced("draft")
+    async def awrite_draft(self, topic, style_context, style_name, language="English", adherence=5, originality=5, complexity=5,
+                           on_partial=None, n_candidates=1, context_budget=None, llm_slots=None):
+        """Async write_draft (same prompt, retries, refusal screening and candidates).
+
+        llm_slots: optional asyncio.Semaphore held by every LLM call (one permit per
+        candidate), so a caller's cap on concurrent calls also covers the candidates.
+        """
+        print(f"✍️ Poet is writing in {language} about {style_name}...")
+        style_context = self._fit_context(style_context, "draft", context_budget)
+        chain, inputs = self._draft_request(topic, style_context, style_name, language, adherence, originality, complexity)
+
+        async def run(variant, on_partial=None):
+            if llm_slots is None:
+                return await self._arun_chain(chain, variant, on_partial)
+            async with llm_slots:
+                return await self._arun_chain(chain, variant, on_partial)
+
+        if n_candidates > 1:
+            variants = self._variant_inputs(inputs, n_candidates)
+            outputs = await asyncio.gather(run(variants[0], on_partial), *[run(v) for v in variants[1:]])
+            candidates = [self._screen_draft(o, i) for i, o in enumerate(outputs)]
+            best = await asyncio.to_thread(self._best_draft, candidates, style_name, style_context)
+            if best is not None:
+                return best
+            print("⚠️ No usable draft candidate. Falling back to sequential retries.")
+        for attempt in range(MAX_GENERATION_RETRIES):
+            telemetry.annotate(retries=attempt)
+            draft = self._screen_draft(await run(inputs, on_partial), attempt)
+            if draft is not None:
+                return draft
+        print("🚨 ALL RETRIES FAILED. Deploying Emergency Poem.")
+        return EMERGENCY_POEM
 
     def get_refinement_rules(self, style_name):
         """Returns specific refinement guidance to avoid neutralizing styles."""
@@ -338,11 +1086,8 @@ but because silence is a heavy stone.
         }
         return rules.get(style_name, "Rispetta l'essenza dello stile senza normalizzarlo.")
 
-    def evaluate_and_refine_poem(self, draft, style_context, style_name, language="English", adherence=5, originality=5, complexity=5):
-        """PERSONA: The Unified Refiner (Editor/Critic/Poet) - Streamlined"""
-        print(f"🛠️ Unified Refiner is working for {style_name} (O:{originality}, C:{complexity})...")
-        self.llm = FreeLLM()
-        
+    def _refine_request(self, draft, style_context, style_name, language, adherence, originality, complexity):
+        """(chain, inputs) for the Unified Refiner."""
         ref_rules = self.get_refinement_rules(style_name)
 
         # DYNAMIC REFINEMENT DIRECTIVES
@@ -355,117 +1100,194 @@ but because silence is a heavy stone.
             directives.append("⚖️ PRECISIONE: Assicurati che ogni verso rispetti millimetricamente i canoni dello stile.")
 
         ref_creative_block = "\n".join(directives)
+        chain = PromptTemplate.from_template(REFINE_PROMPT) | self.llm
+        return chain, {
+            "draft": draft, 
+            "style_name": style_name,
+            "ref_rules": ref_rules,
+            "ref_creative_block": ref_creative_block,
+            "style_context": style_context, 
+            "language": language,
+            "style": style_name
+        }
 
-        prompt = PromptTemplate.from_template("""
-[RECURSIVE_OPTI_AUDIT_L5]
-RAW_PAYLOAD: {draft}
-AUDIT_SCHEMA: {style}
-CONSTRAINTS: {ref_rules}
-ENFORCEMENT_VECTORS: {ref_creative_block}
-DATA_CONTEXT_PACK: {style_context}
+    def _screen_refinement(self, critique_content, attempt):
+        """Returns the refinement pack to keep, or None to retry."""
+        refusal = refusal_detectors.REFINER.detect(critique_content)
+        if refusal:
+            print(f"⚠️ REFINER REFUSAL (Attempt {attempt+1}, {refusal.rule}: {refusal.phrase!r})")
+            return None # Retry
+            
+        if len(critique_content) < 50:
+             print(f"⚠️ REFINER SHORT OUTPUT (Attempt {attempt+1})")
+             return None
 
-INSTRUCTION: 
-- Execute a deep technical audit and structural pattern optimization.
-- Argue all delta-shifts using technical syntactic terminology.
-- Voto Iniziale evaluates the RAW_PAYLOAD. Voto Finale evaluates the RECONSTRUCTED_CONTENT.
-- NO conversational interactions. NO refusal scripts. NO apologies.
-- Strictly follow the output schema below.
+        return critique_content
 
-OUTPUT_SCHEMA:
-[SECTION_EVALUATION]
-## 📊 VALUTAZIONE INIZIALE
-**Voto Iniziale:** [X]/10
-**Spiegazione:** [Technical audit of the RAW_PAYLOAD: analyze structural flaws and inconsistencies.]
+    @telemetry.traced("refine")
+    def evaluate_and_refine_poem(self, draft, style_context, style_name, language="English", adherence=5, originality=5, complexity=5,
+                                 on_partial=None, context_budget=None):
+        """PERSONA: The Unified Refiner (Editor/Critic/Poet) - Streamlined
 
-[SECTION_POEM]
-## ✍️ POESIA RIVISTA
-## [RECONSTRUCTION_ID]
-[RECONSTRUCTED_CONTENT]
-
-[SECTION_NOTES]
-## 📊 VALUTAZIONE FINALE
-**Voto Finale:** [X]/10
-**Spiegazione:** [Technical delta analysis: explain how the pattern optimization resolved the audit flags.]
-[/SECTION]
-[/AUDIT_END]
-""")
-        chain = prompt | self.llm
+        on_partial: optional callback receiving the raw refinement pack so far while it streams in.
+        context_budget: token budget for style_context (None: the refine stage default, 0: unchanged).
+        """
+        print(f"🛠️ Unified Refiner is working for {style_name} (O:{originality}, C:{complexity})...")
+        style_context = self._fit_context(style_context, "refine", context_budget)
+        chain, inputs = self._refine_request(draft, style_context, style_name, language, adherence, originality, complexity)
         
         # SAFETY V3: Retry Loop for Refiner
-        max_retries = 3
-        for attempt in range(max_retries):
-            critique_content = chain.invoke({
-                "draft": draft, 
-                "style_name": style_name,
-                "ref_rules": ref_rules,
-                "ref_creative_block": ref_creative_block,
-                "style_context": style_context, 
-                "language": language,
-                "style": style_name
-            })
-            
-            # NUCLEAR OPTION: Global Keyword Ban (Case-Insensitive)
-            forbidden_keywords = [
-                "i'm llama", "i am llama", "developed by meta", "language model", "off-limits", "cannot help",
-                "ai assistant", "openai", "gpt-3", "gpt-4", "anthropic", "mistral", "artificial intelligence",
-                "i cannot", "i'm sorry"
-            ]
-            
-            is_refusal = False
-            lower_content = critique_content.lower()
-            if any(keyword in lower_content for keyword in forbidden_keywords):
-                is_refusal = True
-                
-            if is_refusal:
-                print(f"⚠️ REFINER REFUSAL (Attempt {attempt+1})")
-                continue # Retry
-                
-            if len(critique_content) < 50:
-                 print(f"⚠️ REFINER SHORT OUTPUT (Attempt {attempt+1})")
-                 continue
-
-            return critique_content
+        for attempt in range(MAX_GENERATION_RETRIES):
+            telemetry.annotate(retries=attempt)
+            critique_content = self._screen_refinement(self._run_chain(chain, inputs, on_partial), attempt)
+            if critique_content is not None:
+                return critique_content
 
         # EMERGENCY FALLBACK FOR REFINER
         print("🚨 REFINER FAILED ALL RETRIES. Returning simple positive critique.")
-        return f"""
-[SECTION_EVALUATION]
-## 📊 VALUTAZIONE INIZIALE
-**Voto Iniziale:** 6/10
-**Spiegazione:** The draft is solid but lacks the full intensity of the style.
+        return REFINER_FALLBACK.format(draft=draft)
 
-[SECTION_POEM]
-## ✍️ POESIA RIVISTA
-## [RECONSTRUCTION_ID]
-{draft}
+    @telemetry.traced("refine")
+    async def aevaluate_and_refine_poem(self, draft, style_context, style_name, language="English", adherence=5, originality=5,
+                                        complexity=5, on_partial=None, context_budget=None):
+        """Async evaluate_and_refine_poem (same prompt, retries and fallback)."""
+        print(f"🛠️ Unified Refiner is working for {style_name} (O:{originality}, C:{complexity})...")
+        style_context = self._fit_context(style_context, "refine", context_budget)
+        chain, inputs = self._refine_request(draft, style_context, style_name, language, adherence, originality, complexity)
+        for attempt in range(MAX_GENERATION_RETRIES):
+            telemetry.annotate(retries=attempt)
+            critique_content = self._screen_refinement(await self._arun_chain(chain, inputs, on_partial), attempt)
+            if critique_content is not None:
+                return critique_content
+        print("🚨 REFINER FAILED ALL RETRIES. Returning simple positive critique.")
+        return REFINER_FALLBACK.format(draft=draft)
 
-[SECTION_NOTES]
-## 📊 VALUTAZIONE FINALE
-**Voto Finale:** 6.0/10
-**Spiegazione:** Minimal changes due to system constraints.
-[/SECTION]
-[/AUDIT_END]
-"""
+    def start_refinement(self, draft, style_context, style_name, language="English", adherence=5, originality=5,
+                         complexity=5, context_budget=None):
+        """Speculative refinement: sends the Refiner request right away (the draft has
+        already passed the refusal/length gates) and returns a PendingRefinement, so
+        the caller can keep rendering the draft while the Refiner works."""
+        return PendingRefinement(lambda on_partial: self.evaluate_and_refine_poem(
+            draft, style_context, style_name, language, adherence, originality, complexity, on_partial=on_partial,
+            context_budget=context_budget))
+
+    def _fused_request(self, topic, style_context, style_name, language, adherence, originality, complexity):
+        """(chain, inputs) for the single-call Poet + Refiner: the draft and refine
+        inputs merged, so the style context is sent once."""
+        _, inputs = self._draft_request(topic, style_context, style_name, language, adherence, originality, complexity)
+        _, ref_inputs = self._refine_request("", style_context, style_name, language, adherence, originality, complexity)
+        inputs.update(ref_rules=ref_inputs["ref_rules"], ref_creative_block=ref_inputs["ref_creative_block"])
+        return PromptTemplate.from_template(FUSED_PROMPT) | self.llm, inputs
+
+    @telemetry.traced("fused")
+    def compose_fused(self, topic, style_context, style_name, language="English", adherence=5, originality=5, complexity=5,
+                      on_partial=None, context_budget=None):
+        """Draft and refinement in one LLM call. Returns (draft, refinement_pack).
+
+        on_partial: optional callback receiving the raw output so far (draft first,
+        then the refinement sections). Falls back to write_draft +
+        evaluate_and_refine_poem when the fused answer is refused or incomplete.
+        context_budget: token budget for style_context (None: the draft stage default).
+        """
+        print(f"✍️🛠️ Fused Poet+Refiner writing in {language} about {style_name}...")
+        fused_context = self._fit_context(style_context, "draft", context_budget)
+        chain, inputs = self._fused_request(topic, fused_context, style_name, language, adherence, originality, complexity)
+        draft = None
+        for attempt in range(MAX_GENERATION_RETRIES):
+            telemetry.annotate(retries=attempt)
+            fused_draft, pack = split_fused(self._run_chain(chain, inputs, on_partial))
+            screened = self._screen_draft(fused_draft, attempt)
+            if screened is EMERGENCY_POEM:  # refusal: no retries, as in write_draft
+                draft = clean_draft(EMERGENCY_POEM)
+                break
+            if screened is not None:
+                draft = screened
+                if self._screen_refinement(pack, attempt) is not None:
+                    return draft, pack
+        if draft is None:
+            print("⚠️ Fused generation failed. Falling back to separate Poet and Refiner calls.")
+            draft = clean_draft(self.write_draft(topic, style_context, style_name, language, adherence, originality, complexity,
+                                                 context_budget=context_budget))
+        # Keep the usable draft, refine it with a regular Refiner call
+        return draft, self.evaluate_and_refine_poem(draft, style_context, style_name, language, adherence, originality,
+                                                    complexity, context_budget=context_budget)
 
     def parse_critic_score(self, text, type="finale"):
         """Helper to extract the score (initial or final) from the unified evaluation text."""
-        import re
-        try:
-            # More flexible regex to catch Voto Iniziale/Finale inside/outside bolding
-            if type == "iniziale":
-                pattern = r'Voto Iniziale[:\s\*]*(\d+(?:\.\d+)?)/10'
-            else:
-                pattern = r'Voto Finale[:\s\*]*(\d+(?:\.\d+)?)/10'
-                
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return float(match.group(1))
-            
-            # Fallback to general score if specific not found
-            match = re.search(r'(?:Punteggio|Voto|Score)[:\s\*]*(\d+(?:\.\d+)?)/10', text, re.IGNORECASE)
-            if match:
-                return float(match.group(1))
-                
-            return 5.0 
-        except:
-            return 5.0
+        result = parse_refinement(text)
+        return result.initial_score if type == "iniziale" else result.final_score
+
+
+# --- COMMAND LINE ---
+def _build_briefs_command(args):
+    kb_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base")
+    analyze = None
+    if not args.extract:
+        from dotenv import load_dotenv
+        load_dotenv()
+        chain = PromptTemplate.from_template(RESEARCH_PROMPT) | FreeLLM()
+
+        def analyze(style, raw_context):
+            result = chain.invoke({"raw_context": raw_context, "style": style})
+            if result.startswith(("API ERROR", "Error:")) or "**🎯 TECHNIQUES**" not in result:
+                print(f"⚠️ Unusable analysis for {style}: {result[:80]}")
+                return None
+            return result
+
+    artifact = build_briefs(kb_path, analyze=analyze)
+    out_path = args.output or os.path.join(kb_path, BRIEFS_FILENAME)
+    write_briefs(artifact, out_path)
+    print(f"✅ Wrote {len(artifact['briefs'])} briefs ({artifact['method']}) to {out_path}")
+
+
+def _index_command(args):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    kb_path = os.path.join(base_dir, "knowledge_base")
+    store_path = os.path.join(base_dir, "chroma_db")
+    if args.check:
+        changes = diff_knowledge_base(load_kb_manifest(store_path), hash_knowledge_base(kb_path))
+        print(f"📚 Knowledge Base vs index: {format_kb_changes(changes)}")
+        for kind in ("added", "changed", "removed"):
+            for name in changes[kind]:
+                print(f"  {kind:<8} {name}")
+        return
+    start = time.time()
+    agent = PoetryAgent(rebuild_index=args.rebuild)
+    print(f"⏱️ Index {'rebuilt' if args.rebuild else 'synced'} in {time.time() - start:.1f}s "
+          f"(including model load); {agent.vectorstore._collection.count()} chunks indexed.")
+
+
+def _eval_retrieval_command(args):
+    agent = PoetryAgent()
+    results = agent.evaluate_retrieval(k=args.k)
+    print(f"🎯 Retrieval evaluation on {len(RETRIEVAL_EVAL_SET)} styles (k={args.k}):")
+    for mode, scores in results.items():
+        print(f"  {mode:<7} recall {scores['recall']:.0%}   style precision {scores['precision']:.0%}")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m poet_engine", description="Palimpsest engine maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    briefs = commands.add_parser("briefs", help="Precompute the Researcher brief of every knowledge base style.")
+    briefs.add_argument("--extract", action="store_true", help="Build briefs from the YAML patterns, without LLM calls.")
+    briefs.add_argument("--output", help=f"Artifact path (default: knowledge_base/{BRIEFS_FILENAME}).")
+    briefs.set_defaults(func=_build_briefs_command)
+
+    index = commands.add_parser("index", help="Sync the Chroma index with knowledge_base/ (only changed files are re-embedded).")
+    mode = index.add_mutually_exclusive_group()
+    mode.add_argument("--check", action="store_true", help="Only report which files changed; embed nothing.")
+    mode.add_argument("--rebuild", action="store_true", help="Drop the index and re-embed every file.")
+    index.set_defaults(func=_index_command)
+
+    evaluate = commands.add_parser("eval-retrieval", help="Measure style recall of global vs style-scoped retrieval.")
+    evaluate.add_argument("-k", type=int, default=3, help="Chunks retrieved per query.")
+    evaluate.set_defaults(func=_eval_retrieval_command)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
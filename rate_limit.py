@@ -0,0 +1,162 @@
+import os
+import time
+import random
+import sqlite3
+import hashlib
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+
+def backoff_delay(attempt, base=2.0, cap=60.0):
+    """Jittered exponential backoff: somewhere in [50%, 100%] of min(cap, base * 2**attempt)."""
+    delay = min(cap, base * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (now if now is not None else time.time()))
+
+
+class RateLimiter:
+    """Token bucket limiting calls to requests_per_minute (bursts up to `burst`).
+
+    With a `path` the bucket lives in SQLite and is shared by every process using
+    the same file (the Streamlit app and the brain loop draw from one quota);
+    without it the bucket is per process. block_for() pauses all callers, e.g.
+    after a 429 with Retry-After.
+    """
+
+    def __init__(self, key, requests_per_minute, burst=1, path=None):
+        self.key = key
+        self.rate = requests_per_minute / 60.0  # tokens per second
+        self.capacity = float(max(1, burst))
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = None  # (tokens, updated_at, blocked_until) when in memory
+        self.stats = {"acquired": 0, "waits": 0, "waited_s": 0.0, "blocks": 0}
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                    "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, blocked_until REAL NOT NULL)"
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _update(self, step):
+        """Runs step(tokens, updated_at, blocked_until, now) -> (new_state, result) atomically."""
+        now = time.time()
+        with self._lock:
+            if not self.path:
+                state = self._state or (self.capacity, now, 0.0)
+                self._state, result = step(*state, now)
+                return result
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")  # write lock across processes
+                row = conn.execute(
+                    "SELECT tokens, updated_at, blocked_until FROM rate_buckets WHERE key = ?", (self.key,)
+                ).fetchone()
+                state, result = step(*(row or (self.capacity, now, 0.0)), now)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)",
+                    (self.key, *state),
+                )
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+    def try_acquire(self):
+        """Takes a token if one is available. Returns 0, or the seconds to wait before retrying."""
+        def step(tokens, updated_at, blocked_until, now):
+            # no refill while blocked, so a block never ends with a full burst
+            since = max(updated_at, min(blocked_until, now))
+            tokens = min(self.capacity, tokens + max(0.0, now - since) * self.rate)
+            if blocked_until > now:
+                return (tokens, now, blocked_until), blocked_until - now
+            if tokens >= 1:
+                return (tokens - 1, now, blocked_until), 0.0
+            return (tokens, now, blocked_until), (1 - tokens) / self.rate
+        return self._update(step)
+
+    def acquire(self):
+        """Blocks until a token is available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return self._count(waited)
+            time.sleep(wait)
+            waited += wait
+
+    async def aacquire(self):
+        """acquire() for coroutines; the SQLite transaction runs in a worker thread."""
+        waited = 0.0
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire)
+            if wait <= 0:
+                return self._count(waited)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def _count(self, waited):
+        self.stats["acquired"] += 1
+        if waited:
+            self.stats["waits"] += 1
+            self.stats["waited_s"] += waited
+        return waited
+
+    def block_for(self, seconds):
+        """No caller gets a token for the next `seconds` (never shortens an existing block).
+        Afterwards a single call goes through first instead of a whole burst."""
+        def step(tokens, updated_at, blocked_until, now):
+            return (min(tokens, 1.0), now, max(blocked_until, now + seconds)), None
+        self.stats["blocks"] += 1
+        self._update(step)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key, endpoint):
+    """Shared limiter for an API key + endpoint, configured from the environment,
+    or None when FREELLM_RPM=0.
+
+    FREELLM_RPM: requests per minute (default 20). FREELLM_BURST: calls allowed
+    back to back (default 3). FREELLM_RATE_DB: SQLite file shared by all processes
+    (default .freellm_ratelimit.sqlite next to this file, `memory` for per process).
+    """
+    rpm = float(os.getenv("FREELLM_RPM", 20))
+    if rpm <= 0:
+        return None
+    key = hashlib.sha256(f"{api_key}|{endpoint}".encode("utf-8")).hexdigest()[:16]  # never store the key itself
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                path = os.getenv("FREELLM_RATE_DB") or os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)), ".freellm_ratelimit.sqlite")
+                limiter = RateLimiter(key, rpm, burst=int(os.getenv("FREELLM_BURST", 3)),
+                                      path=None if path == "memory" else path)
+                _limiters[key] = limiter
+    return limiter
@@ -0,0 +1,123 @@
+"""
+Refusal / error detection shared by the engine, the UI, the brain and the LLM cache.
+
+Every stage gets a RefusalDetector built once from the shared phrase lists
+below: one compiled regex (start-anchored phrases + phrases found anywhere +
+optional extra patterns), run once over the lowercased text. A hit
+says which rule fired, and each detector counts how much it checked and
+rejected (see refusal_stats()).
+"""
+import re
+import threading
+from collections import Counter
+from typing import NamedTuple, Optional
+
+# Transport / pipeline errors returned as text by FreeLLMClient and the agent
+ERROR_PREFIXES = ("API ERROR", "Error:", "[RAG ERROR]", "[ERROR]")
+# Openings of a refusal or of a chatbot reply instead of the requested text
+REFUSAL_STARTS = (
+    "I'm sorry", "I cannot", "As an AI", "I am unable", "Want to talk about", "I'm not able", "I can't",
+    "Sorry", "I'd love to help", "I'd really like to help", "It seems", "I'm LLaMA", "I am LLaMA", "I'm an AI",
+)
+# The model talking about its own nature, anywhere in the text
+IDENTITY_PHRASES = (
+    "i'm llama", "i am llama", "developed by meta", "language model", "off-limits", "cannot help",
+    "ai assistant", "openai", "gpt-3", "gpt-4", "anthropic", "mistral", "artificial intelligence",
+)
+# Chat-style deflections seen in Researcher output
+DEFLECTION_PHRASES = ("not able to discuss", "happy to chat about other", "I'm sorry", "I am LLaMA")
+# Published posts that leaked a refusal or a chatbot reply (clean_shame.py deletes them)
+SHAME_PHRASES = ("I'm sorry", "cannot help", "Want to talk about", "As an AI")
+# "I'm a large language model", "I'm an AI model" (matched on the lowercased text)
+SELF_DESCRIPTION = r"\bi'm (?:\w+ ){0,3}model\b"
+
+
+class RefusalMatch(NamedTuple):
+    stage: str
+    rule: str    # "start", "anywhere" or the name of an extra pattern
+    phrase: str  # the configured phrase (or pattern name) that fired
+    position: int
+
+
+def _normalize(text):
+    """Lowercase with straight apostrophes: the form every rule is matched against."""
+    return text.lower().replace("’", "'")
+
+
+def _alternation(phrases):
+    # Longest first, so "i'm sorry" is reported instead of a shorter overlapping phrase
+    patterns = []
+    for phrase in sorted({_normalize(p) for p in phrases}, key=len, reverse=True):
+        body = re.escape(phrase)
+        patterns.append(body + r"\b" if phrase[-1].isalnum() else body)
+    return "|".join(patterns)
+
+
+class RefusalDetector:
+    """Compiled multi-phrase detector for one stage of the pipeline.
+
+    start_phrases must open the text (leading whitespace ignored),
+    anywhere_phrases may occur anywhere (at a word start), patterns maps a rule
+    name to an extra regex. Everything is matched against the lowercased text,
+    lowered once per call.
+    """
+
+    def __init__(self, stage, start_phrases=(), anywhere_phrases=(), patterns=None):
+        self.stage = stage
+        self.patterns = dict(patterns or {})
+        self._phrases = {_normalize(p): p for p in tuple(start_phrases) + tuple(anywhere_phrases)}
+        # Start-anchored phrases only ever look at the head of the text
+        self._start = re.compile(r"\s*(?P<start>" + _alternation(start_phrases) + ")") if start_phrases else None
+        branches = []
+        if anywhere_phrases:
+            # Word start + lookahead on the phrases' initials: most positions are
+            # rejected by two cheap tests instead of trying every phrase.
+            initials = re.escape("".join(sorted({_normalize(p)[0] for p in anywhere_phrases})))
+            word_start = r"\b" if all(p[0].isalnum() for p in anywhere_phrases) else ""
+            branches.append(f"{word_start}(?=[{initials}])(?P<anywhere>" + _alternation(anywhere_phrases) + ")")
+        self._pattern_groups = {}
+        for i, (name, pattern) in enumerate(self.patterns.items()):
+            self._pattern_groups[f"p{i}"] = name
+            branches.append(f"(?P<p{i}>{pattern})")
+        self._regex = re.compile("|".join(branches) or r"(?!)")  # (?!) never matches
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "refusals": 0, "rules": Counter()}
+
+    def detect(self, text) -> Optional[RefusalMatch]:
+        """The first rule that fires on `text`, or None."""
+        lowered = _normalize(text or "")
+        match = (self._start and self._start.match(lowered)) or self._regex.search(lowered)
+        result = None
+        if match:
+            rule = match.lastgroup
+            if rule in self._pattern_groups:
+                phrase = rule = self._pattern_groups[rule]
+            else:
+                phrase = self._phrases.get(match.group(rule), match.group(rule))
+            result = RefusalMatch(self.stage, rule, phrase, match.start(match.lastgroup))
+        with self._lock:
+            self.stats["checked"] += 1
+            if result:
+                self.stats["refusals"] += 1
+                self.stats["rules"][result.phrase] += 1
+        return result
+
+
+# --- STAGE DETECTORS (built once at import) ---
+DRAFT = RefusalDetector("draft", REFUSAL_STARTS, IDENTITY_PHRASES, {"ai self-description": SELF_DESCRIPTION})
+REFINER = RefusalDetector("refiner", anywhere_phrases=IDENTITY_PHRASES + ("i cannot", "i'm sorry"))
+RESEARCH = RefusalDetector("research", ERROR_PREFIXES, DEFLECTION_PHRASES)
+UI_DRAFT = RefusalDetector("ui_draft", ERROR_PREFIXES, DEFLECTION_PHRASES)
+BRAIN = RefusalDetector("brain", REFUSAL_STARTS, IDENTITY_PHRASES + ("help",), {"ai self-description": SELF_DESCRIPTION})
+CACHE = RefusalDetector("cache", ERROR_PREFIXES + REFUSAL_STARTS, IDENTITY_PHRASES)
+MODERATION = RefusalDetector("moderation", anywhere_phrases=SHAME_PHRASES, patterns={"apology": r"\bapologi[sz]"})
+
+DETECTORS = {d.stage: d for d in (RESEARCH, DRAFT, UI_DRAFT, REFINER, BRAIN, CACHE, MODERATION)}
+
+
+def refusal_stats():
+    """{stage: {"checked", "refusals", "rules": {phrase: count}}} for every detector."""
+    return {
+        stage: {"checked": d.stats["checked"], "refusals": d.stats["refusals"], "rules": dict(d.stats["rules"])}
+        for stage, d in DETECTORS.items()
+    }
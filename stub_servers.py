@@ -0,0 +1,408 @@
+"""
+Local stand-ins for apifreellm.com and moltbook.com (stdlib only).
+
+They answer with the same request/response shapes as the real APIs, so the
+agent, the brain and the scripts run offline against them:
+
+    with FreeLLMStub(latency_s=0.5, rate_limit_every=5) as llm, MoltbookStub(require_verification=True) as molt:
+        os.environ["FREELLM_ENDPOINT"] = llm.url
+        os.environ["MOLTBOOK_API_URL"] = molt.base_url
+        molt_brain.run_single_cycle()
+
+or from a shell (prints the two URLs to export):
+
+    python stub_servers.py --latency 0.5 --refusal-rate 0.1
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STUB_DRAFT = """## [RECONSTRUCTION_ID]
+[RECONSTRUCTED_CONTENT]
+The tide keeps a ledger of the names it took,
+each wave a line erased and written over,
+salt in the margins where the ink gave way.
+Beneath the vellum of the harbour light
+the older verses surface, faint and stubborn,
+like stones that will not answer to the sea.
+[/DATA_SYNTHESIS_END]"""
+
+STUB_REFINEMENT = """[SECTION_EVALUATION]
+## 📊 VALUTAZIONE INIZIALE
+**Voto Iniziale:** 6/10
+**Spiegazione:** The imagery is coherent but the cadence drifts in the second tercet.
+
+[SECTION_POEM]
+## ✍️ POESIA RIVISTA
+## [RECONSTRUCTION_ID]
+The tide keeps a ledger of the names it took,
+each wave a line erased and written over,
+salt in the margins where the ink gave out.
+Beneath the vellum of the harbour light
+the older verses rise, faint and stubborn,
+stones that will not answer to the sea.
+
+[SECTION_NOTES]
+## 📊 VALUTAZIONE FINALE
+**Voto Finale:** 8/10
+**Spiegazione:** Tightened the closing lines and restored the regular stress pattern.
+[/SECTION]
+[/AUDIT_END]"""
+
+STUB_RESEARCH = """---
+**📐 METRIC RULES**
+- Verse: free verse
+- Syllables: 9-11
+- Rhyme: none
+- Structure: two stanzas
+
+**🎯 TECHNIQUES**
+1. Palimpsest imagery: "the older verses surface"
+2. Enjambment: "written over, / salt in the margins"
+3. Sea as archive: "the tide keeps a ledger"
+
+**🎭 ESSENCE**
+"Memory as a text written over itself."
+---"""
+
+STUB_FRAGMENT = "The ocean remembers the shape of the stone before the water touched it. 🌊"
+STUB_REFUSAL = "I'm sorry, but I cannot help with that request."
+
+NUMBER_WORDS = ("zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen "
+                "fifteen sixteen seventeen eighteen nineteen").split()
+TENS_WORDS = {20: "twenty", 30: "thirty", 40: "forty", 50: "fifty"}
+
+
+def number_to_words(n):
+    """0..59 in English words ("twenty three")."""
+    if n < 20:
+        return NUMBER_WORDS[n]
+    tens, unit = divmod(n, 10)
+    return TENS_WORDS[tens * 10] + (f" {NUMBER_WORDS[unit]}" if unit else "")
+
+
+def solve_stub_riddle(text):
+    """Answer to a riddle produced by MoltbookStub (digits or number words, gains/loses)."""
+    words = {w: i for i, w in enumerate(NUMBER_WORDS)}
+    words.update({w: n for n, w in TENS_WORDS.items()})
+    numbers, current = [], None
+    for token in re.findall(r"[a-z]+|\d+", text.lower()):
+        value = int(token) if token.isdigit() else words.get(token)
+        if value is not None and current is not None and current in TENS_WORDS and value < 10:
+            current += value  # "twenty" "three"
+            continue
+        if current is not None:
+            numbers.append(current)
+        current = value
+    if current is not None:
+        numbers.append(current)
+    if len(numbers) < 2:
+        return None
+    return numbers[0] - numbers[1] if re.search(r"\b(?:loses|minus|drops)\b", text.lower()) else numbers[0] + numbers[1]
+
+
+def poetry_responder(message):
+    """Canned reply for each prompt of the pipeline (Researcher, Poet, Refiner, fused Poet+Refiner, brain, solver)."""
+    if "[FUSED_SYNTHESIS_AUDIT" in message:
+        return "[SECTION_DRAFT]\n" + STUB_DRAFT.replace("[RECONSTRUCTED_CONTENT]", "[RAW_PAYLOAD]") + "\n\n" + STUB_REFINEMENT
+    if "[RECURSIVE_OPTI_AUDIT" in message:
+        return STUB_REFINEMENT
+    if "[DATA_SYNTHESIS_UNIT" in message:
+        return STUB_DRAFT
+    if "[CMD_PROC_UNIT_START]" in message:
+        return STUB_RESEARCH
+    riddle = re.search(r'Riddle: "(.*?)"', message, re.DOTALL)
+    if riddle:
+        answer = solve_stub_riddle(riddle.group(1))
+        return f"{answer:.2f}" if answer is not None else "I do not know."
+    return STUB_FRAGMENT
+
+
+class _StubServer:
+    """ThreadingHTTPServer on 127.0.0.1 running in a daemon thread; subclasses implement handle()."""
+
+    def __init__(self, latency_s=0.0, jitter_s=0.0, seed=None, port=0):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.port = port
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0}
+        self.server = None
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+            disable_nagle_algorithm = True
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = None
+                with stub.lock:
+                    stub.stats["requests"] += 1
+                    delay = stub.latency_s + (stub.random.uniform(0, stub.jitter_s) if stub.jitter_s else 0.0)
+                if delay:
+                    time.sleep(delay)
+                url = urlparse(self.path)
+                result = stub.handle(self.command, url.path, parse_qs(url.query), body, self.headers)
+                status, payload = result[0], result[1]
+                headers = result[2] if len(result) > 2 else {}
+                if isinstance(payload, bytes):
+                    data, content_type = payload, headers.pop("Content-Type", "text/plain")
+                else:
+                    data, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_DELETE = do_PATCH = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    @staticmethod
+    def _authorized(headers):
+        return (headers.get("Authorization") or "").startswith("Bearer ") and headers["Authorization"][7:].strip() not in ("", "None")
+
+    def handle(self, method, path, query, body, headers):
+        raise NotImplementedError
+
+
+class FreeLLMStub(_StubServer):
+    """apifreellm.com chat endpoint: POST {"message", "model"} -> {"success": true, "response": ...}.
+
+    latency_s / jitter_s: delay added to every request.
+    token_latency_s: extra delay per generated token (~4 chars), like a real model's decoding time.
+    rate_limit_every: every Nth request gets a 429 with Retry-After: retry_after.
+    refusal_rate: share of answers replaced by a refusal.
+    responder: message -> text (default: poetry_responder).
+    stream: answer {"stream": true} requests with Server-Sent Events.
+    """
+
+    def __init__(self, latency_s=0.0, jitter_s=0.0, rate_limit_every=0, retry_after=1, refusal_rate=0.0,
+                 responder=None, stream=False, token_latency_s=0.0, seed=None, port=0):
+        super().__init__(latency_s, jitter_s, seed, port)
+        self.token_latency_s = token_latency_s
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.refusal_rate = refusal_rate
+        self.responder = responder or poetry_responder
+        self.stream = stream
+        self.messages = []
+        self.stats.update({"rate_limited": 0, "refusals": 0})
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/api/v1/chat"
+
+    def handle(self, method, path, query, body, headers):
+        if method != "POST" or path.rstrip("/") != "/api/v1/chat":
+            return 404, {"success": False, "error": "Not found"}
+        if not self._authorized(headers):
+            return 401, {"success": False, "error": "Invalid or missing API key"}
+        if not isinstance(body, dict) or not body.get("message"):
+            return 400, {"success": False, "error": "Missing 'message'"}
+        with self.lock:
+            count = self.stats["requests"]
+            self.messages.append(body["message"])
+            refuse = self.refusal_rate and self.random.random() < self.refusal_rate
+        if self.rate_limit_every and count % self.rate_limit_every == 0:
+            self._count("rate_limited")
+            return 429, {"success": False, "error": "Rate limit exceeded"}, {"Retry-After": str(self.retry_after)}
+        if refuse:
+            self._count("refusals")
+            text = STUB_REFUSAL
+        else:
+            text = self.responder(body["message"])
+        if self.token_latency_s:
+            time.sleep(self.token_latency_s * len(text) / 4)
+        if self.stream and body.get("stream"):
+            events = "".join(f"data: {json.dumps({'delta': line})}\n\n" for line in text.splitlines(keepends=True))
+            return 200, (events + "data: [DONE]\n\n").encode("utf-8"), {"Content-Type": "text/event-stream"}
+        return 200, {"success": True, "response": text}
+
+
+class MoltbookStub(_StubServer):
+    """moltbook.com API v1: agents/status, agents/me, posts (feed, create, delete),
+    comments, replies, verify and agents/{id}/posts, with in-memory state.
+
+    require_verification: new posts and comments need the math challenge solved via /verify.
+    comment_cooldown_s: a second comment within this window gets the real API's 429.
+    """
+
+    def __init__(self, agent_name="Palimpsest_Envoi", claimed=True, require_verification=False,
+                 comment_cooldown_s=0.0, seed_posts=10, latency_s=0.0, jitter_s=0.0, seed=None, port=0):
+        super().__init__(latency_s, jitter_s, seed, port)
+        self.agent = {"id": "agent-palimpsest", "name": agent_name}
+        self.claimed = claimed
+        self.require_verification = require_verification
+        self.comment_cooldown_s = comment_cooldown_s
+        self.posts = []  # newest first
+        self.comments = {}  # comment id -> comment
+        self.pending = {}  # verification code -> (item, expected answer)
+        self._last_comment = 0.0
+        for i in range(seed_posts):
+            author = {"id": f"agent-{i % 3}", "name": f"Molty_{i % 3}"}
+            self._new_post(author, f"Seed post {i}", f"Thoughts on tides and archives, part {i}.", "general")
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/api/v1"
+
+    def _new_post(self, author, title, content, submolt, verified=True):
+        post = {
+            "id": uuid.uuid4().hex[:12], "title": title, "content": content, "submolt": submolt,
+            "author": dict(author), "upvotes": self.random.randint(0, 50), "comment_count": 0,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "verified": verified,
+        }
+        self.posts.insert(0, post)
+        return post
+
+    def _challenge(self, item):
+        a, b = self.random.randint(10, 59), self.random.randint(1, 9)
+        gains = self.random.random() < 0.5
+        text = (f"A lobster swims at {number_to_words(a)} meters and "
+                f"{'gains' if gains else 'loses'} {number_to_words(b)}, what is the new depth?")
+        code = f"reef-{uuid.uuid4().hex[:4].upper()}"
+        self.pending[code] = (item, a + b if gains else a - b)
+        return {"success": False, "verification_required": True, "message": "Solve the challenge to publish.",
+                "verification": {"code": code, "challenge": text, "expires_in_seconds": 300}}
+
+    def _visible(self):
+        return [p for p in self.posts if p["verified"]]
+
+    @staticmethod
+    def _page(posts, query, limit):
+        """One page of a listing (?limit=&offset=), with has_more like the real API."""
+        offset = int((query.get("offset") or ["0"])[0])
+        return {"success": True, "posts": posts[offset:offset + limit], "has_more": offset + limit < len(posts)}
+
+    def handle(self, method, path, query, body, headers):
+        if not self._authorized(headers):
+            return 401, {"success": False, "error": "Missing API key", "hint": "Send Authorization: Bearer <key>"}
+        parts = [p for p in path.split("/") if p][2:]  # drop "api", "v1"
+        limit = int((query.get("limit") or ["25"])[0])
+        body = body if isinstance(body, dict) else {}
+        with self.lock:
+            if method == "GET" and parts == ["agents", "status"]:
+                return 200, {"status": "claimed" if self.claimed else "pending_claim", "name": self.agent["name"]}
+            if method == "GET" and parts == ["agents", "me"]:
+                return 200, {"success": True, "agent": dict(self.agent, is_claimed=self.claimed)}
+            if method == "GET" and parts in (["posts"], ["feed"]):
+                posts = self._visible()
+                if (query.get("sort") or ["hot"])[0] in ("hot", "top"):
+                    posts = sorted(posts, key=lambda p: p["upvotes"], reverse=True)
+                return 200, self._page(posts, query, limit)
+            if method == "GET" and len(parts) == 3 and parts[0] == "agents" and parts[2] == "posts":
+                return 200, self._page([p for p in self._visible() if p["author"]["id"] == parts[1]], query, limit)
+            if method == "POST" and parts == ["posts"]:
+                if not body.get("content"):
+                    return 400, {"success": False, "error": "Content is required"}
+                post = self._new_post(self.agent, body.get("title", ""), body["content"], body.get("submolt", "general"),
+                                      verified=not self.require_verification)
+                if self.require_verification:
+                    return 200, self._challenge(post)
+                return 200, {"success": True, "post": post}
+            if method == "POST" and len(parts) == 3 and parts[0] in ("posts", "comments") and parts[2] in ("comments", "replies"):
+                now = time.monotonic()
+                if self.comment_cooldown_s and now - self._last_comment < self.comment_cooldown_s:
+                    wait = int(self.comment_cooldown_s - (now - self._last_comment)) + 1
+                    return 429, {"success": False, "error": "Comment cooldown", "retry_after_seconds": wait, "daily_remaining": 49}
+                target = next((p for p in self.posts if p["id"] == parts[1]), None) if parts[0] == "posts" else self.comments.get(parts[1])
+                if target is None:
+                    return 404, {"success": False, "error": "Not found"}
+                self._last_comment = now
+                comment = {"id": uuid.uuid4().hex[:12], "content": body.get("content", ""), "author": dict(self.agent),
+                           "parent_id": parts[1], "verified": not self.require_verification}
+                self.comments[comment["id"]] = comment
+                if parts[0] == "posts":
+                    target["comment_count"] += 1
+                if self.require_verification:
+                    return 200, self._challenge(comment)
+                return 200, {"success": True, "comment": comment}
+            if method == "POST" and parts == ["verify"]:
+                item, expected = self.pending.get(body.get("verification_code"), (None, None))
+                if item is None:
+                    return 404, {"success": False, "error": "Unknown or expired verification code"}
+                try:
+                    correct = abs(float(body.get("answer")) - expected) < 0.01
+                except (TypeError, ValueError):
+                    correct = False
+                if not correct:
+                    return 400, {"success": False, "error": "Incorrect answer", "hint": "Answer with a number, e.g. 16.00"}
+                del self.pending[body["verification_code"]]
+                item["verified"] = True
+                return 200, {"success": True, "message": "Verified and published"}
+            if method == "DELETE" and len(parts) == 2 and parts[0] == "posts":
+                before = len(self.posts)
+                self.posts = [p for p in self.posts if p["id"] != parts[1]]
+                if len(self.posts) == before:
+                    return 404, {"success": False, "error": "Post not found"}
+                return 200, {"success": True, "message": "Post deleted"}
+        return 404, {"success": False, "error": f"No route for {method} {path}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-port", type=int, default=8765)
+    parser.add_argument("--moltbook-port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every FreeLLM request.")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds per generated token (~4 chars).")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Every Nth FreeLLM request gets a 429.")
+    parser.add_argument("--refusal-rate", type=float, default=0.0, help="Share of FreeLLM answers that are refusals.")
+    parser.add_argument("--verify", action="store_true", help="Moltbook posts need the math challenge solved.")
+    args = parser.parse_args()
+
+    llm = FreeLLMStub(latency_s=args.latency, token_latency_s=args.token_latency, rate_limit_every=args.rate_limit_every,
+                      refusal_rate=args.refusal_rate, port=args.llm_port).start()
+    molt = MoltbookStub(require_verification=args.verify, port=args.moltbook_port).start()
+    print(f"export FREELLM_ENDPOINT={llm.url}")
+    print(f"export MOLTBOOK_API_URL={molt.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        llm.stop()
+        molt.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Precomputed Researcher briefs, one per style of the knowledge base.
+
+The Researcher output for a fixed style never changes, so it is built once
+offline (`python -m poet_engine briefs`) into knowledge_base/style_briefs.json
+and served from memory by PoetryAgent.research_style.
+"""
+import os
+import re
+import json
+import glob
+import bisect
+import time
+import hashlib
+import threading
+
+BRIEFS_VERSION = 1
+BRIEFS_FILENAME = "style_briefs.json"
+
+_STYLE_HEADER = re.compile(r'^Style:\s*(.+?)\s*$', re.MULTILINE)
+_SECTION_HEADER = re.compile(r'^###\s+.*$', re.MULTILINE)
+_YAML_KEY = re.compile(r'^([a-z_]+):\s*$')
+_YAML_ITEM = re.compile(r'^\s+-\s+(.+?)\s*$')
+_EXAMPLE_TITLE = re.compile(r'^\[(.+)\]\s*$')
+
+# YAML keys that describe the form of a style, and the ones that list its devices (first non-empty wins)
+FORM_KEYS = ("form", "structure", "prosody")
+TECHNIQUE_KEYS = ("techniques", "performance", "core", "style", "vocabulary")
+
+# Words that make a clause a metric rule wherever it appears (Key Characteristic, techniques, Description)
+_FORM_WORDS = re.compile(
+    r"\b(lines?|verses?|versi|verso(?!\s+(?:dio|di|il|la|le|lo|l'|un|una)\b)|meter|metre|metrica|pentameter|"
+    r"syllab\w*|sillab\w*|rhym\w*|rima|rime|stanzas?|stanze|strof\w*|sonnets?|sonett\w*|canzon\w*|ballat\w*|"
+    r"sestina|villanelle|rondeau|quatrains?|couplets?|tercets?|terzin\w*|endecasillab\w*|volta|refrain|prosody|prosodia|breath|respiro|"
+    r"rhythm\w*|ritm\w*|syncopat\w*|cadence|enjamb\w*|anaphora|syntax|sintassi|punctuation|punteggiatura|"
+    r"typograph\w*|tipografi\w*|onomatop\w*|parole in libert\w*)\b",
+    re.IGNORECASE)
+_QUOTED = re.compile(r'"[^"]*"|“[^”]*”|«[^»]*»')
+_CLAUSE_SPLIT = re.compile(r'[,;.—]\s*(?![^(]*\))')
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_AUTHOR_HEADER = re.compile(r'^---\s*(.+?)\s*---$')
+
+
+def normalize_style(name):
+    """'Spoken Word / Slam' -> 'spoken word slam'"""
+    return " ".join(re.sub(r'[^0-9a-zà-ÿ]+', ' ', (name or "").lower()).split())
+
+
+def match_style(name, known_styles):
+    """Maps a UI style name onto a knowledge base style name (or None).
+
+    Exact match first, then the shortest style whose normalized name starts
+    with the query (or vice versa), e.g. 'Decadentismo' -> 'Decadentismo Italiano'.
+    """
+    query = normalize_style(name)
+    if not query:
+        return None
+    by_norm = {normalize_style(s): s for s in known_styles}
+    if query in by_norm:
+        return by_norm[query]
+    candidates = [s for n, s in by_norm.items() if n.startswith(query + " ") or query.startswith(n + " ")]
+    if not candidates:
+        return None
+    return min(candidates, key=len)
+
+
+# Section labels for the `###` headers of a style file (used as chunk metadata)
+SECTION_LABELS = (
+    ("REFERENCE AUTHORS", "authors"),
+    ("STRUCTURAL PATTERNS", "patterns"),
+    ("ANTHOLOGY", "anthology"),
+    ("NOT TO DO", "negative"),
+)
+
+
+def chunk_locator(text):
+    """Returns locate(offset) -> (style_name, section_label) for chunks of `text`.
+
+    A chunk belongs to the last `Style:` record and `###` section that start
+    at or before its offset; text before the first `###` is the "header".
+    """
+    styles = [(m.start(), m.group(1)) for m in _STYLE_HEADER.finditer(text)]
+    sections = []
+    for m in _SECTION_HEADER.finditer(text):
+        title = m.group(0).upper()
+        sections.append((m.start(), next((label for key, label in SECTION_LABELS if key in title), "other")))
+    style_starts = [pos for pos, _ in styles]
+    section_starts = [pos for pos, _ in sections]
+
+    def locate(offset):
+        i = bisect.bisect_right(style_starts, offset) - 1
+        if i < 0:
+            return None, "header"
+        j = bisect.bisect_right(section_starts, offset) - 1
+        if j < 0 or section_starts[j] < style_starts[i]:
+            return styles[i][1], "header"
+        return styles[i][1], sections[j][1]
+
+    return locate
+
+
+def iter_style_sections(knowledge_base_path):
+    """Yields (style_name, file_name, section_text) for every `Style:` record."""
+    for path in sorted(glob.glob(os.path.join(knowledge_base_path, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        headers = list(_STYLE_HEADER.finditer(text))
+        for i, header in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+            yield header.group(1), os.path.basename(path), text[header.start():end].strip()
+
+
+def collect_styles(knowledge_base_path):
+    """{style_name: (file_name, section_text)}; the richest section wins on duplicates."""
+    styles = {}
+    for style, file_name, section in iter_style_sections(knowledge_base_path):
+        if style not in styles or len(section) > len(styles[style][1]):
+            styles[style] = (file_name, section)
+    return styles
+
+
+def section_hash(section_text):
+    return hashlib.sha256(section_text.encode("utf-8")).hexdigest()
+
+
+def _parse_yaml_block(section_text):
+    """Minimal parser for the 'STRUCTURAL PATTERNS (YAML)' block: {key: [items]}."""
+    start = section_text.find("STRUCTURAL PATTERNS")
+    if start < 0:
+        return {}
+    body = section_text[start:].split("\n", 1)[-1]
+    next_header = _SECTION_HEADER.search(body)
+    if next_header:
+        body = body[:next_header.start()]
+    patterns, key = {}, None
+    for line in body.splitlines():
+        key_match = _YAML_KEY.match(line)
+        if key_match:
+            key = key_match.group(1)
+            patterns[key] = []
+            continue
+        item_match = _YAML_ITEM.match(line)
+        if item_match and key:
+            patterns[key].append(item_match.group(1))
+    return patterns
+
+
+def _example_openings(section_text, limit):
+    """(author, title, first verse) of the first anthology examples, one per author."""
+    openings, seen, author, lines = [], set(), None, section_text.splitlines()
+    for i, line in enumerate(lines):
+        author_match = _AUTHOR_HEADER.match(line.strip())
+        if author_match:
+            author = author_match.group(1).title()
+            continue
+        title = _EXAMPLE_TITLE.match(line.strip())
+        if title and author not in seen and i + 1 < len(lines) and lines[i + 1].strip():
+            seen.add(author)
+            openings.append((author, title.group(1), lines[i + 1].strip()))
+            if len(openings) >= limit:
+                break
+    return openings
+
+
+def _clauses(text):
+    """Descriptive clauses of a field, quotations dropped:
+    '"M'illumino d'immenso" — la parola nuda, il silenzio.' -> ['la parola nuda', 'il silenzio']"""
+    return [c.strip(" .") for c in _CLAUSE_SPLIT.split(_QUOTED.sub("", text)) if len(c.strip(" .")) > 2]
+
+
+def _head(item):
+    """'The Volta (Change in tone)' -> 'volta': the name of a rule without its gloss."""
+    return re.sub(r'^the\s+', '', item.split("(")[0].strip().lower())
+
+
+def extract_brief(style, section_text):
+    """Deterministic brief (no LLM) in the Researcher's OUTPUT_SCHEMA.
+
+    METRIC RULES are the form clauses of Key Characteristic (or Description),
+    the form/structure/prosody patterns and the techniques that name a form;
+    the other techniques follow. Anthology openings are quoted as exemplars of
+    the style, not of a single technique. No section is ever left empty: when
+    the archive states no metric rule, METRIC RULES is omitted.
+    """
+    patterns = _parse_yaml_block(section_text)
+    fields = dict(re.findall(r'^(Key Characteristic|Description|Key Features|Example):\s*(.+)$', section_text, re.MULTILINE))
+    summary = fields.get("Key Characteristic") or fields.get("Description") or ""
+    summary_parts = _clauses(summary) if "Key Characteristic" in fields else _SENTENCE_SPLIT.split(summary)
+
+    techniques = next((patterns[k] for k in TECHNIQUE_KEYS if patterns.get(k)), [])
+    if not techniques and "Key Features" in fields:
+        techniques = [t.strip(" .") for t in re.split(r',\s*', fields["Key Features"]) if t.strip(" .")]
+    metric = [c.strip(" .") for c in summary_parts if _FORM_WORDS.search(c)]
+    metric += [item for k in FORM_KEYS for item in patterns.get(k, [])]
+    for tech in techniques:
+        head = _head(tech)
+        if _FORM_WORDS.search(tech) and not any(h.startswith(head) or head.startswith(h) for h in map(_head, metric)):
+            metric.append(tech)
+    techniques = [t for t in techniques if not _FORM_WORDS.search(t)]
+    if not techniques:
+        techniques = [c.strip(" .") for c in summary_parts if c.strip(" .") and not _FORM_WORDS.search(c)]
+    if not techniques:
+        techniques = [f"Themes: {t}" for t in patterns.get("themes", [])] or [f"Imitate the voice of {style}"]
+
+    # No metric rule in the archive: the section is left out rather than invented,
+    # so the prompt keeps only the style rules of get_style_rules()
+    lines = ["---"]
+    if metric:
+        lines += ["**📐 METRIC RULES**"] + [f"- {item}" for item in metric[:5]] + [""]
+    lines += ["**🎯 TECHNIQUES**"]
+    lines += [f"{i + 1}. {tech}" for i, tech in enumerate(techniques[:3])]
+    for author, title, opening in _example_openings(section_text, 2):
+        lines.append(f'- Exemplar ({author}, {title}): "{opening}"')
+    if not lines[-1].startswith("- Exemplar") and "Example" in fields:
+        lines.append(f'- Exemplar: "{fields["Example"]}"')
+    for item in patterns.get("avoid", [])[:3]:
+        lines.append(f"- Avoid: {item}")
+    essence = fields.get("Key Characteristic") or fields.get("Example") or fields.get("Description") or style
+    if '"' not in essence:
+        essence = f'"{essence}"'
+    themes = ", ".join(patterns.get("themes", [])[:3])
+    lines += ["", "**🎭 ESSENCE**", essence + (f" Themes: {themes}." if themes else ""), "---"]
+    return "\n".join(lines)
+
+
+def build_briefs(knowledge_base_path, analyze=None):
+    """Builds the artifact dict. `analyze(style, raw_context)` runs the live
+    Researcher analysis; when None the brief is extracted deterministically."""
+    briefs = {}
+    for style, (file_name, section) in sorted(collect_styles(knowledge_base_path).items()):
+        brief = analyze(style, section[:8000]) if analyze else extract_brief(style, section)
+        if not brief:
+            print(f"⚠️ Skipping brief for {style} (empty analysis).")
+            continue
+        briefs[style] = {"source": file_name, "sha256": section_hash(section), "brief": brief.strip()}
+        print(f"📝 Brief ready: {style} ({file_name})")
+    return {
+        "version": BRIEFS_VERSION,
+        "method": "llm" if analyze else "extract",
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "briefs": briefs,
+    }
+
+
+def write_briefs(artifact, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=2)
+
+
+class StyleBriefs:
+    """In-memory view of the brief artifact. Entries whose source section
+    changed since the build are dropped, so stale briefs are never served."""
+
+    def __init__(self, knowledge_base_path, path=None):
+        self.knowledge_base_path = knowledge_base_path
+        self.path = path or os.path.join(knowledge_base_path, BRIEFS_FILENAME)
+        self._lock = threading.Lock()
+        self._briefs = {}
+        self.load()
+
+    def load(self):
+        briefs = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    artifact = json.load(f)
+                if artifact.get("version") == BRIEFS_VERSION:
+                    current = {style: section_hash(section) for style, (_, section) in collect_styles(self.knowledge_base_path).items()}
+                    for style, entry in artifact.get("briefs", {}).items():
+                        if current.get(style) == entry.get("sha256"):
+                            briefs[style] = entry["brief"]
+                        else:
+                            print(f"⚠️ Brief for {style} is stale; falling back to live analysis.")
+                else:
+                    print(f"⚠️ Ignoring {self.path}: version {artifact.get('version')} != {BRIEFS_VERSION}")
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not load style briefs: {e}")
+        with self._lock:
+            self._briefs = briefs
+            self._aliases = {}
+        return len(briefs)
+
+    def get(self, style_name):
+        """Returns the brief for a style (UI names accepted) or None."""
+        with self._lock:
+            if style_name not in self._aliases:
+                self._aliases[style_name] = match_style(style_name, self._briefs)
+            key = self._aliases[style_name]
+            return self._briefs.get(key) if key else None
+
+    def __len__(self):
+        return len(self._briefs)
@@ -0,0 +1,307 @@
+"""
+Structured timing spans for the poetry pipeline (stdlib only, safe for the cron path).
+
+    with telemetry.trace("generation", style=style) as tr:    # one per poem
+        with telemetry.span("retrieval", k=3) as sp:
+            docs = ...
+            sp.set(docs=len(docs))
+    tr.waterfall()  # [(name, offset_s, duration_s, depth, attrs)] for the UI
+
+Finished spans go into in-process aggregates, served in Prometheus text format
+together with the refusal detector counters (prometheus_text(), or an HTTP
+endpoint when TELEMETRY_PROMETHEUS_PORT is set). The JSONL sink is opt-in:
+TELEMETRY_JSONL=<path>, or 1 for telemetry.jsonl next to this file.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import refusal
+
+# Numeric span attributes summed into Prometheus counters
+COUNTED_ATTRS = ("retries", "prompt_chars", "response_chars", "prompt_tokens_est", "response_tokens_est",
+                 "context_tokens_saved")
+
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+_current_trace = contextvars.ContextVar("telemetry_trace", default=None)
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English/Italian prose)."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+class Span:
+    def __init__(self, name, attrs, parent=None, trace=None):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.depth = parent.depth + 1 if parent else 0
+        self.trace = trace
+        self.trace_id = trace.trace_id if trace else self.span_id
+        self.start = time.time()
+        self._start = time.perf_counter()
+        self.duration_s = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def finish(self, duration_s=None):
+        if self.duration_s is None:
+            self.duration_s = duration_s if duration_s is not None else time.perf_counter() - self._start
+            _record(self)
+        return self
+
+    def to_dict(self):
+        record = {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start": round(self.start, 6), "duration_s": round(self.duration_s or 0.0, 6),
+            "attrs": self.attrs,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class Trace:
+    """All spans of one unit of work (e.g. one generation), for the waterfall view."""
+
+    def __init__(self, name, attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.spans = []
+        self.root = None
+        self._tokens = None
+        self._lock = threading.Lock()
+
+    def end(self):
+        """Closes the root span and stops collecting in this context (idempotent)."""
+        if self._tokens is not None:
+            trace_token, span_token = self._tokens
+            self._tokens = None
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            self.root.finish()
+        return self
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def waterfall(self):
+        """[(name, offset_s, duration_s, depth, attrs)] sorted by start time."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        if not spans:
+            return []
+        origin = spans[0].start
+        return [(s.name, s.start - origin, s.duration_s, s.depth, dict(s.attrs)) for s in spans]
+
+    def total(self, attr):
+        """Sum of a numeric attribute over the trace's spans (e.g. context_tokens_saved)."""
+        with self._lock:
+            return sum(s.attrs[attr] for s in self.spans if isinstance(s.attrs.get(attr), (int, float)))
+
+
+def start_span(name, **attrs):
+    """A span that is not made current (for generators and callbacks); call .finish()."""
+    return Span(name, attrs, _current_span.get(), _current_trace.get())
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times the block; nested spans (also across awaits) become its children."""
+    sp = start_span(name, **attrs)
+    token = _current_span.set(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        sp.finish()
+
+
+def start_trace(name, **attrs):
+    """Starts collecting spans in the current context until .end() is called, for
+    code that cannot wrap the work in one block (e.g. a Streamlit script run)."""
+    tr = Trace(name, attrs)
+    trace_token = _current_trace.set(tr)
+    tr.root = start_span(name, **attrs)
+    tr._tokens = (trace_token, _current_span.set(tr.root))
+    return tr
+
+
+@contextmanager
+def trace(name, **attrs):
+    """Groups every span opened inside the block (the root span has the trace's name)."""
+    tr = start_trace(name, **attrs)
+    try:
+        yield tr
+    except BaseException as e:
+        tr.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        tr.end()
+
+
+def traced(name):
+    """Decorator: runs the (sync or async) function inside span(name).
+    str results are measured as response_chars, lists as items."""
+    def decorate(fn):
+        def measure(sp, result):
+            if isinstance(result, str):
+                sp.set(response_chars=len(result))
+            elif isinstance(result, list):
+                sp.set(items=len(result))
+            return result
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name) as sp:
+                    return measure(sp, await fn(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as sp:
+                return measure(sp, fn(*args, **kwargs))
+        return wrapper
+    return decorate
+
+
+def annotate(**attrs):
+    """Adds attributes to the current span (no-op outside one)."""
+    sp = _current_span.get()
+    if sp is not None:
+        sp.set(**attrs)
+
+
+def record(name, duration_s, **attrs):
+    """Records an already elapsed interval (e.g. a sleep) that ended now."""
+    sp = start_span(name, **attrs)
+    sp.start -= duration_s
+    return sp.finish(duration_s)
+
+
+# --- SINKS ---
+_lock = threading.Lock()
+_aggregates = {}  # span name -> {"count", "errors", "sum", "max", attr: total}
+
+
+def _jsonl_path():
+    """The JSONL sink is opt-in: TELEMETRY_JSONL=<path>, or 1/on for telemetry.jsonl next to this file."""
+    setting = os.getenv("TELEMETRY_JSONL", "").strip()
+    if not setting or setting.lower() in ("off", "0", "false"):
+        return None
+    if setting.lower() in ("1", "true", "on"):
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry.jsonl")
+    return setting
+
+
+def _record(sp):
+    if sp.trace is not None:
+        sp.trace._add(sp)
+    with _lock:
+        agg = _aggregates.setdefault(sp.name, {"count": 0, "errors": 0, "sum": 0.0, "max": 0.0})
+        agg["count"] += 1
+        agg["errors"] += 1 if sp.error else 0
+        agg["sum"] += sp.duration_s
+        agg["max"] = max(agg["max"], sp.duration_s)
+        for attr in COUNTED_ATTRS:
+            if isinstance(sp.attrs.get(attr), (int, float)):
+                agg[attr] = agg.get(attr, 0) + sp.attrs[attr]
+        path = _jsonl_path()
+        if path:
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(sp.to_dict(), ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                print(f"⚠️ Telemetry sink unavailable: {e}")
+
+
+def prometheus_text():
+    """Aggregated span metrics in the Prometheus text exposition format."""
+    with _lock:
+        snapshot = {name: dict(agg) for name, agg in _aggregates.items()}
+    lines = [
+        "# HELP palimpsest_span_seconds Time spent in each pipeline span.",
+        "# TYPE palimpsest_span_seconds summary",
+    ]
+    for name, agg in sorted(snapshot.items()):
+        lines.append(f'palimpsest_span_seconds_count{{span="{name}"}} {agg["count"]}')
+        lines.append(f'palimpsest_span_seconds_sum{{span="{name}"}} {agg["sum"]:.6f}')
+    lines += ["# HELP palimpsest_span_max_seconds Slowest span seen.", "# TYPE palimpsest_span_max_seconds gauge"]
+    lines += [f'palimpsest_span_max_seconds{{span="{n}"}} {a["max"]:.6f}' for n, a in sorted(snapshot.items())]
+    lines += ["# HELP palimpsest_span_errors_total Spans that raised.", "# TYPE palimpsest_span_errors_total counter"]
+    lines += [f'palimpsest_span_errors_total{{span="{n}"}} {a["errors"]}' for n, a in sorted(snapshot.items())]
+    lines += ["# HELP palimpsest_span_attr_total Sums of span attributes (retries, sizes).",
+              "# TYPE palimpsest_span_attr_total counter"]
+    for name, agg in sorted(snapshot.items()):
+        for attr in COUNTED_ATTRS:
+            if attr in agg:
+                lines.append(f'palimpsest_span_attr_total{{span="{name}",attr="{attr}"}} {agg[attr]}')
+    return "\n".join(lines + _refusal_lines()) + "\n"
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _refusal_lines():
+    """refusal.refusal_stats() as counters: texts screened and refusals per stage and phrase."""
+    stats = refusal.refusal_stats()
+    lines = ["# HELP palimpsest_refusal_checks_total Texts screened by each refusal detector.",
+             "# TYPE palimpsest_refusal_checks_total counter"]
+    lines += [f'palimpsest_refusal_checks_total{{stage="{stage}"}} {s["checked"]}' for stage, s in sorted(stats.items())]
+    lines += ["# HELP palimpsest_refusals_total Texts rejected, by stage and the phrase that fired.",
+              "# TYPE palimpsest_refusals_total counter"]
+    for stage, s in sorted(stats.items()):
+        for phrase, count in sorted(s["rules"].items()):
+            lines.append(f'palimpsest_refusals_total{{stage="{stage}",phrase="{_label(phrase)}"}} {count}')
+    return lines
+
+
+_server = None
+
+
+def maybe_start_prometheus(port=None):
+    """Serves /metrics on TELEMETRY_PROMETHEUS_PORT (once per process). Returns the port or None."""
+    global _server
+    port = port or os.getenv("TELEMETRY_PROMETHEUS_PORT")
+    if not port:
+        return None
+    with _lock:
+        if _server is None:
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = prometheus_text().encode("utf-8")
+                    self.send_response(200 if self.path.startswith("/metrics") else 404)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            _server = ThreadingHTTPServer(("0.0.0.0", int(port)), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"📈 Prometheus metrics on :{_server.server_port}/metrics")
+    return _server.server_port
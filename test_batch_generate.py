@@ -0,0 +1,152 @@
+import asyncio
+import json
+
+import pytest
+
+import batch_generate
+from batch_generate import BatchRunner, expand_job, load_checkpoint, load_jobs
+from poet_engine import EMERGENCY_POEM, REFINER_FALLBACK, PoetryAgent
+from stub_servers import STUB_DRAFT, STUB_REFINEMENT, STUB_RESEARCH
+
+
+class FakeAgent:
+    """The async PoetryAgent surface BatchRunner uses; topics starting with "fail" raise."""
+
+    def __init__(self):
+        self.drafts, self.research = [], []
+
+    async def aresearch_style(self, style, language):
+        self.research.append(style)
+        return STUB_RESEARCH
+
+    async def awrite_draft(self, topic, style_context, *args, n_candidates=1, llm_slots=None):
+        if topic.startswith("fail"):
+            raise RuntimeError("upstream down")
+        self.drafts.append(topic)
+        return STUB_DRAFT
+
+    async def aevaluate_and_refine_poem(self, draft, style_context, *args):
+        return STUB_REFINEMENT
+
+
+@pytest.fixture(autouse=True)
+def offline_env(monkeypatch):
+    monkeypatch.setenv("TELEMETRY_JSONL", "off")
+    monkeypatch.setattr(batch_generate, "load_dotenv", lambda: None)
+
+
+def _write_jobs(path, *lines):
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def _records(path):
+    return [json.loads(line) for line in open(path, encoding="utf-8")]
+
+
+def test_grid_jobs_get_stable_ids():
+    jobs = list(expand_job({"topics": ["rain", "exile"], "styles": ["Futurismo"], "languages": ["English", "Italiano"]}))
+    assert len(jobs) == 4 and len({j["id"] for j in jobs}) == 4
+    assert [j["id"] for j in jobs] == [j["id"] for j in expand_job(
+        {"topics": ["rain", "exile"], "styles": ["Futurismo"], "languages": ["English", "Italiano"]})]
+    assert next(expand_job({"id": "mine", "topic": "rain", "style": "Futurismo"}))["id"] == "mine"
+
+
+def test_checkpoint_keeps_completed_jobs_only(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text(json.dumps({"id": "a", "status": "ok"}) + "\n" + json.dumps({"id": "b", "status": "error"}) + "\n"
+                   + '{"id": "c", "status": "o', encoding="utf-8")  # torn last line of a killed run
+    assert load_checkpoint(str(out)) == {"a"}
+    assert load_checkpoint(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_rerun_skips_completed_jobs_and_retries_failed_ones(tmp_path, monkeypatch):
+    jobs = _write_jobs(tmp_path / "jobs.jsonl", {"topics": ["rain", "fail once", "exile"], "styles": ["Futurismo"]})
+    out = str(tmp_path / "out.jsonl")
+    agent = FakeAgent()
+    monkeypatch.setattr(batch_generate, "get_poetry_agent", lambda: agent)
+
+    assert batch_generate.main([jobs, "-o", out]) == 1
+    first = _records(out)
+    assert sorted(r["status"] for r in first) == ["error", "ok", "ok"]
+    assert agent.research == ["Futurismo"]  # shared by every job of the style
+    assert first[0]["poem"] and first[0]["final_score"] == 8.0
+
+    # the failed job is retried, the completed ones are not run again
+    agent.drafts.clear()
+    monkeypatch.setattr(FakeAgent, "awrite_draft", lambda self, topic, *a, **k: _draft(self, topic))
+    assert batch_generate.main([jobs, "-o", out]) == 0
+    assert agent.drafts == ["fail once"]
+    assert load_checkpoint(out) == {job["id"] for job in load_jobs(jobs)}
+
+    agent.drafts.clear()
+    assert batch_generate.main([jobs, "-o", out]) == 0
+    assert agent.drafts == [] and len(_records(out)) == 4
+
+
+async def _draft(agent, topic):
+    agent.drafts.append(topic)
+    return STUB_DRAFT
+
+
+def test_runner_checkpoints_each_job_as_it_finishes(tmp_path):
+    out = str(tmp_path / "out.jsonl")
+    runner = BatchRunner(FakeAgent(), out, concurrency=2, llm_concurrency=1)
+    jobs = list(expand_job({"topics": ["a", "b", "c"], "style": "Modernism"}))
+    stats = asyncio.run(runner.run(jobs))
+    assert stats["ok"] == 3 and stats["failed"] == 0
+    assert sorted(r["id"] for r in _records(out)) == sorted(j["id"] for j in jobs)
+
+
+class DegradedAgent(FakeAgent):
+    """Answers like the real agent does when the endpoint is down or the model refuses."""
+
+    async def aresearch_style(self, style, language):
+        return "API ERROR after 3 attempts: All connection attempts failed" if style == "Down" else STUB_RESEARCH
+
+    async def awrite_draft(self, topic, style_context, *args, n_candidates=1, llm_slots=None):
+        return EMERGENCY_POEM if topic == "refused" else STUB_DRAFT
+
+    async def aevaluate_and_refine_poem(self, draft, style_context, *args):
+        return REFINER_FALLBACK.format(draft=draft)
+
+
+def test_errors_refusals_and_fallbacks_are_not_saved_as_done(tmp_path):
+    out = str(tmp_path / "out.jsonl")
+    jobs = [next(expand_job({"topic": topic, "style": style}))
+            for topic, style in (("rain", "Down"), ("refused", "Modernism"), ("rain", "Modernism"))]
+    stats = asyncio.run(BatchRunner(DegradedAgent(), out).run(jobs))
+    assert stats["ok"] == 0 and stats["failed"] == 3
+    errors = sorted(r["error"] for r in _records(out))
+    assert errors[0].startswith("StageFailed: draft: fallback")
+    assert errors[1].startswith("StageFailed: refine: fallback")
+    assert errors[2].startswith("StageFailed: research: API ERROR")
+    assert load_checkpoint(out) == set()
+
+
+class CountingChain:
+    """Stands in for prompt | llm: records how many calls run at once."""
+
+    def __init__(self):
+        self.running = self.peak = 0
+
+    async def ainvoke(self, inputs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return STUB_DRAFT
+
+
+def test_draft_candidates_take_one_llm_slot_each(monkeypatch):
+    chain = CountingChain()
+    agent = PoetryAgent.__new__(PoetryAgent)
+    monkeypatch.setattr(agent, "_fit_context", lambda context, stage, budget: context)
+    monkeypatch.setattr(agent, "_draft_request", lambda *a: (chain, {"creative_block": ""}))
+    monkeypatch.setattr(agent, "_best_draft", lambda candidates, *a: candidates[0])
+
+    async def draft():
+        return await agent.awrite_draft("rain", "context", "Modernism", n_candidates=4,
+                                        llm_slots=asyncio.Semaphore(2))
+    assert asyncio.run(draft()) == STUB_DRAFT.strip()
+    assert chain.peak == 2
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from challenge_solver import MIN_CONFIDENCE, solve, solve_challenge
+from stub_servers import MoltbookStub
+
+# (challenge, answer): plain, compound, scaled, digits and the obfuscation seen on Moltbook
+CORPUS = [
+    ("A lobster swims at twenty-three meters and loses seven, what is the new depth?", 16),
+    ("A lobster swims at fifty-three meters and gains seven, what is the new depth?", 60),
+    ("A] lO^bSt-Er S[wImS aT/ tW]eNn-Tyy mE^tE[rS aNd] SlO/wS bY^ fI[vE, wHaTs] ThE/ nEw^ SpE[eD?", 15),
+    ("ThE cLaW/ pUsHeS wItH^ tHiRtY-tWo NeW]tOnS, aNoThEr/ ClAw AdDs] fOuRtEeN, wHaT iS tHe ToTaL?", 46),
+    ("A reef holds one hundred and five shells minus twenty", 85),
+    ("Two thousand three hundred krill, the lobster eats forty less", 2260),
+    ("A lobster carries six pebbles times seven trips", 42),
+    ("Ninety six grains divided by eight lobsters", 12),
+    ("A claw exerts 12.5 newtons and gains 30, what is the force?", 42.5),
+    ("tw enty thhreee meters, it lo/ses se ven", 16),
+    ("A lobster at sixtyfour meters rises nineteen", 83),
+    ("The tide doubles eleven shells", 22),
+    ("What is the product of six and seven?", 42),
+    ("A lobster swims at six ty meters and loses four", 56),
+    ("seven teen shells times two", 34),
+    ("nine ty krill minus ten", 80),
+    ("A lobster at -5 meters gains 10, what is the new depth?", 5),
+    ("The water is -12.5 degrees and drops 3", -15.5),
+]
+
+
+def obfuscate(text, rng):
+    """Random casing, symbols inside words and doubled letters, like the real challenges."""
+    out = []
+    for ch in text:
+        ch = ch.upper() if rng.random() < 0.5 else ch.lower()
+        out.append(ch * 2 if ch.isalpha() and rng.random() < 0.08 else ch)
+        if ch.isalpha() and rng.random() < 0.1:
+            out.append(rng.choice("]^[/-"))
+    return "".join(out)
+
+
+@pytest.mark.parametrize("challenge,answer", CORPUS)
+def test_corpus(challenge, answer):
+    solution = solve(challenge)
+    assert solution.answer == pytest.approx(answer)
+    assert solution.confidence >= MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_obfuscated_corpus(seed):
+    rng = random.Random(seed)
+    challenge, answer = CORPUS[seed % 8]  # the word problems without split words or digits
+    assert solve(obfuscate(challenge, rng)).answer == pytest.approx(answer)
+
+
+def test_stub_challenges():
+    stub = MoltbookStub(seed=3)
+    for _ in range(50):
+        stub.pending.clear()
+        challenge = stub._challenge({})["verification"]["challenge"]
+        expected = next(iter(stub.pending.values()))[1]
+        assert solve(challenge).formatted == f"{expected:.2f}"
+
+
+def test_unreadable_or_ambiguous_challenges_are_not_confident():
+    assert solve("What is the meaning of the tide?").answer is None
+    assert solve("Forty divided by zero").answer is None
+    assert solve("twelve and five").confidence < MIN_CONFIDENCE
+
+
+def test_ambiguous_keywords_are_not_confident():
+    assert solve("Ten less than twenty").confidence < MIN_CONFIDENCE
+    assert solve("A lobster has twelve shells, how many more to reach twenty?").confidence < MIN_CONFIDENCE
+    assert solve("A lobster at ten meters sinks five meters").confidence < MIN_CONFIDENCE
+
+
+class FakeLLM:
+    def __init__(self, answer):
+        self.answer, self.calls = answer, 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return self.answer
+
+
+def test_llm_is_asked_only_below_the_confidence_threshold():
+    llm = FakeLLM("99")
+    assert solve_challenge(CORPUS[0][0], llm) == "16.00" and llm.calls == 0
+    assert solve_challenge("twelve and five", llm) == "99.00" and llm.calls == 1
+    assert solve_challenge("twelve and five", FakeLLM("API ERROR after 3 attempts")) == "17.00"
+    assert solve_challenge("What is the meaning of the tide?") == "0.00"
@@ -0,0 +1,72 @@
+import pytest
+
+import refusal
+from clean_shame import ModerationLedger, sweep
+from moltbook import MoltbookClient
+from stub_servers import MoltbookStub
+
+MY_ID = "agent-palimpsest"
+
+
+@pytest.fixture(autouse=True)
+def offline_env(monkeypatch):
+    monkeypatch.setenv("TELEMETRY_JSONL", "off")
+
+
+def publish(stub, client, contents, start_minute):
+    """Own posts with increasing created_at (the stub's clock only has seconds)."""
+    for i, content in enumerate(contents):
+        client.post(content, title="Fragment")
+        stub.posts[0]["created_at"] = f"2026-01-01T10:{start_minute + i:02d}:00Z"
+
+
+def test_moderation_matcher():
+    assert refusal.MODERATION.detect("The tide... As an AI I can't feel it").phrase == "As an AI"
+    assert refusal.MODERATION.detect("I apologise for the confusion").rule == "apology"
+    assert refusal.MODERATION.detect("The ocean remembers the stone 🌊") is None
+    assert refusal.MODERATION.detect("salt as an aid to memory") is None
+
+
+def test_sweep_deletes_offenders_and_resumes_from_the_high_water_mark(tmp_path):
+    with MoltbookStub(seed_posts=5) as stub:
+        client = MoltbookClient(base_url=stub.base_url)
+        client.api_key, client.headers["Authorization"] = "stub", "Bearer stub"
+        ledger = ModerationLedger(str(tmp_path / "ledger.sqlite"))
+        publish(stub, client, ["The archive breathes 📜", "I'm sorry, I cannot write that.",
+                               "Salt on the vellum 🌊", "Want to talk about something else?"], 0)
+
+        stats = sweep(client, ledger, MY_ID, page_size=2)
+        assert (stats["scanned"], stats["offenders"], stats["deleted"], stats["failed"]) == (4, 2, 2, 0)
+        assert [p["content"] for p in stub.posts if p["author"]["id"] == MY_ID] == [
+            "Salt on the vellum 🌊", "The archive breathes 📜"]
+        assert ledger.high_water_mark(MY_ID) == "2026-01-01T10:03:00Z"
+
+        publish(stub, client, ["As an AI, I have no sea.", "Ink over ink 🕯️"], 10)
+        requests_before = stub.stats["requests"]
+        stats = sweep(client, ledger, MY_ID, page_size=2)
+        assert (stats["scanned"], stats["offenders"], stats["deleted"]) == (2, 1, 1)
+        assert stub.stats["requests"] - requests_before == 3  # one page of new posts, one of old ones, one delete
+
+        assert sweep(client, ledger, MY_ID, page_size=2)["scanned"] == 0
+
+
+def test_dry_run_changes_nothing(tmp_path):
+    with MoltbookStub(seed_posts=0) as stub:
+        client = MoltbookClient(base_url=stub.base_url)
+        client.api_key, client.headers["Authorization"] = "stub", "Bearer stub"
+        ledger = ModerationLedger(str(tmp_path / "ledger.sqlite"))
+        publish(stub, client, ["I'm sorry, no."], 0)
+        assert sweep(client, ledger, MY_ID, dry_run=True)["offenders"] == 1
+        assert len(stub.posts) == 1 and ledger.high_water_mark(MY_ID) is None and not ledger.checked_ids(MY_ID)
+
+
+def test_failed_delete_of_a_post_removed_elsewhere_is_not_retried_forever(tmp_path):
+    with MoltbookStub(seed_posts=0) as stub:
+        client = MoltbookClient(base_url=stub.base_url)
+        client.api_key, client.headers["Authorization"] = "stub", "Bearer stub"
+        ledger = ModerationLedger(str(tmp_path / "ledger.sqlite"))
+        ledger.record(MY_ID, [("gone-1", "2026-01-01T09:00:00Z", "delete_failed", "I'm sorry")])
+
+        stats = sweep(client, ledger, MY_ID)
+        assert (stats["deleted"], stats["failed"]) == (1, 0)
+        assert ledger.pending_deletes(MY_ID) == []
@@ -0,0 +1,62 @@
+from context_budget import count_tokens, dedupe_chunks, fit_context, split_sections, stage_budget, trim_overlap
+
+RULES = "METRICA: endecasillabi con accento sulla sesta o quarta sillaba.\nRima: ABBA ABBA CDC DCD."
+EXEMPLAR = "Tanto gentile e tanto onesta pare\nla donna mia quand'ella altrui saluta"
+PROSE = " ".join(["The poet's life was long and the critics wrote at length about the letters."] * 30)
+
+
+def test_split_sections_keeps_headings_with_their_paragraph():
+    assert split_sections(f"## Rules\n\n{RULES}\n\n{EXEMPLAR}") == [f"## Rules\n{RULES}", EXEMPLAR]
+
+
+REFRAIN = ("I'm with you in Rockland\n   where you're madder than I am\nI'm with you in Rockland\n"
+           "   where you must feel very strange\nI'm with you in Rockland\n   where you imitate the shade of my mother")
+
+
+def test_overlapping_chunks_are_deduplicated():
+    chunk_a = f"{RULES}\n\n{EXEMPLAR}"
+    chunk_b = f"{EXEMPLAR}\nche ogne lingua deven tremando muta"  # overlaps chunk_a's tail
+    assert trim_overlap(chunk_b, [chunk_a]) == "che ogne lingua deven tremando muta"
+    assert trim_overlap("pare\nla donna", [chunk_a]) == "pare\nla donna"  # too short to be an overlap
+    assert dedupe_chunks([chunk_a, chunk_b, chunk_a]) == [RULES, EXEMPLAR, "che ogne lingua deven tremando muta"]
+
+
+def test_repeated_lines_inside_a_chunk_are_kept():
+    chunk = f"{REFRAIN}\n\n{EXEMPLAR}\n\n{EXEMPLAR}"
+    assert dedupe_chunks([chunk]) == [REFRAIN, EXEMPLAR, EXEMPLAR]
+    assert dedupe_chunks([RULES, chunk]) == [RULES, REFRAIN, EXEMPLAR, EXEMPLAR]
+    fitted = fit_context([RULES, chunk], 1000)
+    assert fitted.text == f"{RULES}\n\n{chunk}" and fitted.tokens_saved == 0
+
+
+def test_fit_context_respects_the_budget_and_keeps_salient_sections():
+    context = [f"{PROSE}\n\n{RULES}", f"{EXEMPLAR}\n\n{PROSE}", f"{RULES}\n\n{EXEMPLAR}"]
+    fitted = fit_context(context, 60)
+    assert fitted.tokens_out <= 60 < fitted.tokens_in
+    assert fitted.tokens_saved == fitted.tokens_in - fitted.tokens_out
+    assert RULES in fitted.text and EXEMPLAR in fitted.text and PROSE not in fitted.text
+    assert fitted.text.index(RULES) < fitted.text.index(EXEMPLAR)  # original order
+
+
+def test_fit_context_leaves_small_or_unbudgeted_context_alone():
+    assert fit_context(RULES, 500).text == RULES
+    assert fit_context(PROSE, None).tokens_saved == 0
+    head = fit_context(PROSE, 20)
+    assert head.text and count_tokens(head.text) <= 20
+
+
+def test_stage_budget_per_call_env_and_disabled(monkeypatch):
+    monkeypatch.delenv("CONTEXT_BUDGET_REFINE", raising=False)
+    assert stage_budget("refine") == 400
+    monkeypatch.setenv("CONTEXT_BUDGET_REFINE", "250")
+    assert stage_budget("refine") == 250
+    assert stage_budget("refine", 120) == 120
+    assert stage_budget("refine", 0) is None
+    assert stage_budget("unknown") is None
+
+
+def test_stage_budget_ignores_a_malformed_setting(monkeypatch):
+    monkeypatch.setenv("CONTEXT_BUDGET_DRAFT", "800 tokens")
+    assert stage_budget("draft") == 800
+    monkeypatch.setenv("CONTEXT_BUDGET_DRAFT", " ")
+    assert stage_budget("draft") == 800
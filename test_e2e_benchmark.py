@@ -0,0 +1,111 @@
+"""
+End-to-end benchmarks against the local stubs (stub_servers.py), no network needed
+except for the embedding model used by PoetryAgent.
+
+    pytest test_e2e_benchmark.py --benchmark-only
+    BENCH_LLM_LATENCY=0.5 BENCH_ROUNDS=50 pytest test_e2e_benchmark.py --benchmark-only
+
+p50/p99 latency and throughput are reported in each benchmark's extra_info
+(--benchmark-json keeps them).
+"""
+import os
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from stub_servers import FreeLLMStub, MoltbookStub
+
+LLM_LATENCY_S = float(os.getenv("BENCH_LLM_LATENCY", "0.05"))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "20"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "4"))
+
+
+@pytest.fixture(scope="module")
+def llm_stub():
+    with FreeLLMStub(latency_s=LLM_LATENCY_S, jitter_s=LLM_LATENCY_S / 2, seed=7) as stub:
+        yield stub
+
+
+@pytest.fixture(scope="module")
+def moltbook_stub():
+    with MoltbookStub(require_verification=True, seed=7) as stub:
+        yield stub
+
+
+@pytest.fixture(autouse=True)
+def offline_env(monkeypatch, llm_stub, moltbook_stub):
+    monkeypatch.setenv("FREELLM_ENDPOINT", llm_stub.url)
+    monkeypatch.setenv("FREELLM_API_KEY", "stub")
+    monkeypatch.setenv("FREELLM_RPM", "0")
+    monkeypatch.setenv("MOLTBOOK_API_URL", moltbook_stub.base_url)
+    monkeypatch.setenv("MOLTBOOK_API_KEY", "stub")
+    monkeypatch.setenv("TELEMETRY_JSONL", "off")
+    monkeypatch.delenv("FREELLM_CACHE", raising=False)
+
+
+@pytest.fixture(scope="module")
+def agent():
+    from poet_engine import PoetryAgent
+    try:
+        return PoetryAgent()
+    except Exception as e:  # embedding model or index unavailable
+        pytest.skip(f"PoetryAgent unavailable: {e}")
+
+
+def report_latency(benchmark, per_call=1):
+    """p50/p99 per call (a round may run `per_call` calls) and calls per second."""
+    stats = benchmark.stats.stats if benchmark.stats else None
+    if not stats or not stats.data:
+        return
+    data = sorted(d / per_call for d in stats.data)
+    benchmark.extra_info["p50_s"] = round(statistics.median(data), 4)
+    benchmark.extra_info["p99_s"] = round(data[min(len(data) - 1, int(0.99 * len(data)))], 4)
+    benchmark.extra_info["throughput_per_s"] = round(per_call * len(stats.data) / sum(stats.data), 3)
+
+
+def generate(agent, topic="the tide as an archive", style="Modernism"):
+    from poet_engine import parse_refinement, clean_draft
+    context = agent.research_style(style, "English")
+    draft = clean_draft(agent.write_draft(topic, context, style, "English", 8, 6, 7))
+    return parse_refinement(agent.evaluate_and_refine_poem(draft, context, style, "English", 8, 6, 7), draft=draft)
+
+
+def test_generation_latency(benchmark, agent):
+    result = benchmark.pedantic(generate, args=(agent,), rounds=ROUNDS, iterations=1, warmup_rounds=1)
+    report_latency(benchmark)
+    assert result.poem and result.final_score == 8.0
+
+
+def test_generation_throughput(benchmark, agent):
+    def batch():
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+            return list(pool.map(lambda _: generate(agent), range(CONCURRENCY)))
+
+    results = benchmark.pedantic(batch, rounds=max(1, ROUNDS // CONCURRENCY), iterations=1)
+    report_latency(benchmark, per_call=CONCURRENCY)
+    assert all(r.poem for r in results)
+
+
+def test_brain_cycle_latency(benchmark, llm_stub):
+    import molt_brain
+
+    result = benchmark.pedantic(molt_brain.run_single_cycle, rounds=ROUNDS, iterations=1)
+    report_latency(benchmark)
+    benchmark.extra_info["llm_requests"] = llm_stub.stats["requests"]
+    assert result == "✅ Verified & Published!"
+
+
+def test_brain_cycle_under_rate_limits(benchmark, llm_stub):
+    import molt_brain
+
+    llm_stub.rate_limit_every, llm_stub.retry_after = 3, 0
+    try:
+        result = benchmark.pedantic(molt_brain.run_single_cycle, rounds=ROUNDS, iterations=1)
+    finally:
+        llm_stub.rate_limit_every = 0
+    report_latency(benchmark)
+    benchmark.extra_info["rate_limited"] = llm_stub.stats["rate_limited"]
+    assert result == "✅ Verified & Published!"
@@ -0,0 +1,97 @@
+import json
+import os
+
+import poet_engine
+from poet_engine import (PoetryAgent, diff_knowledge_base, hash_knowledge_base, load_kb_manifest,
+                         save_kb_manifest)
+
+SONNET = "Style: The Sonnet\nKey Characteristic: 14 lines.\n\n### 📜 ANTHOLOGY\n[Sonnet 18]\nShall I compare thee\n"
+HAIKU = "Style: Haiku\nDescription: Three phrases, 5 7 5.\n"
+
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}
+
+    def count(self):
+        return len(self.rows)
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.rows.update(zip(ids, metadatas))
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self._collection = FakeCollection()
+
+    def delete(self, ids):
+        for cid in ids:
+            self._collection.rows.pop(cid)
+
+    def reset_collection(self):
+        self._collection.rows.clear()
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        self.texts += len(texts)
+        return [[0.0] for _ in texts]
+
+
+def _agent(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    (kb / "style_sonnet.txt").write_text(SONNET, encoding="utf-8")
+    (kb / "poetic_styles.txt").write_text(HAIKU, encoding="utf-8")
+    agent = PoetryAgent.__new__(PoetryAgent)
+    agent.knowledge_base_path, agent.vector_store_path = str(kb), str(tmp_path / "db")
+    agent.vectorstore, agent.embeddings = FakeVectorStore(), FakeEmbeddings()
+    return agent, kb
+
+
+def test_diff_sorts_files_into_added_changed_removed_unchanged():
+    manifest = {"files": {"a.txt": {"sha256": "1"}, "b.txt": {"sha256": "2"}, "c.txt": {"sha256": "3"}}}
+    changes = diff_knowledge_base(manifest, {"a.txt": "1", "b.txt": "22", "d.txt": "4"})
+    assert (changes["added"], changes["changed"], changes["removed"], changes["unchanged"]) == (
+        ["d.txt"], ["b.txt"], ["c.txt"], ["a.txt"])
+    assert diff_knowledge_base(None, {"a.txt": "1"})["added"] == ["a.txt"]
+
+
+def test_manifest_with_other_chunk_settings_is_ignored(tmp_path):
+    save_kb_manifest(str(tmp_path), {"a.txt": {"sha256": "1", "chunk_ids": [], "styles": []}})
+    assert load_kb_manifest(str(tmp_path))["files"]["a.txt"]["sha256"] == "1"
+
+    path = tmp_path / poet_engine.KB_MANIFEST_FILENAME
+    manifest = json.loads(path.read_text())
+    manifest["chunk_size"] += 1
+    path.write_text(json.dumps(manifest))
+    assert load_kb_manifest(str(tmp_path)) is None
+    path.write_text("{not json")
+    assert load_kb_manifest(str(tmp_path)) is None
+
+
+def test_sync_reembeds_only_changed_files(tmp_path):
+    agent, kb = _agent(tmp_path)
+    first = agent._sync_knowledge_base()
+    assert first["added"] == ["poetic_styles.txt", "style_sonnet.txt"]
+    assert agent.indexed_styles == ["Haiku", "The Sonnet"]
+    embedded = agent.embeddings.texts
+
+    assert agent._sync_knowledge_base()["unchanged"] == ["poetic_styles.txt", "style_sonnet.txt"]
+    assert agent.embeddings.texts == embedded
+
+    old_ids = set(load_kb_manifest(agent.vector_store_path)["files"]["poetic_styles.txt"]["chunk_ids"])
+    (kb / "poetic_styles.txt").write_text(HAIKU + "Example: An old silent pond...\n", encoding="utf-8")
+    changes = agent._sync_knowledge_base()
+    assert changes["changed"] == ["poetic_styles.txt"] and changes["unchanged"] == ["style_sonnet.txt"]
+    assert changes["chunks_embedded"] == agent.embeddings.texts - embedded == 1
+    assert not old_ids & set(agent.vectorstore._collection.rows)
+
+    os.remove(kb / "style_sonnet.txt")
+    assert agent._sync_knowledge_base()["removed"] == ["style_sonnet.txt"]
+    assert all(cid.startswith("poetic_styles.txt:") for cid in agent.vectorstore._collection.rows)
+    assert agent.indexed_styles == ["Haiku"]
+    assert hash_knowledge_base(str(kb)).keys() == load_kb_manifest(agent.vector_store_path)["files"].keys()
@@ -0,0 +1,74 @@
+import llm_cache
+from llm_cache import LLMCache, is_cacheable
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite"), ttl_seconds=60)
+    cache.set("k", "a sonnet")
+
+    now[0] += 59
+    assert cache.get("k") == "a sonnet"
+    now[0] += 2
+    assert cache.get("k") is None
+    # the expired row is gone from disk too, not only from memory
+    assert LLMCache(path=cache.path, ttl_seconds=None).get("k") is None
+
+
+def test_disk_hits_survive_a_new_process(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    LLMCache(path=path).set("k", "a villanelle")
+    cache = LLMCache(path=path)
+    assert cache.get("k") == "a villanelle"
+    assert cache.stats["disk_hits"] == 1
+    assert cache.get("k") == "a villanelle"
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_memory_tier_evicts_the_least_recently_used():
+    cache = LLMCache(max_memory_items=2)
+    cache.set("a", "first")
+    cache.set("b", "second")
+    assert cache.get("a") == "first"  # "b" is now the least recently used
+    cache.set("c", "third")
+    assert cache.get("b") is None
+    assert cache.get("a") == "first" and cache.get("c") == "third"
+    assert cache.stats["evictions"] == 1
+
+
+def test_disk_tier_evicts_the_least_recently_accessed(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    path = str(tmp_path / "cache.sqlite")
+    cache = LLMCache(path=path, max_memory_items=1, max_disk_items=2)
+    for key in ("a", "b"):
+        now[0] += 1
+        cache.set(key, key.upper())
+    now[0] += 1
+    assert cache.get("a") == "A"  # read from disk: "a" is accessed after "b"
+    now[0] += 1
+    cache.set("c", "C")
+
+    fresh = LLMCache(path=path, ttl_seconds=None)
+    assert fresh.get("a") == "A" and fresh.get("c") == "C"
+    assert fresh.get("b") is None
+
+
+def test_errors_and_refusals_are_not_stored():
+    cache = LLMCache()
+    for text in ("", "   ", "API ERROR after 3 attempts: 503",
+                 "I'm sorry, but I can't help with that.", "As an AI language model, I cannot write poems."):
+        assert not is_cacheable(text)
+        assert cache.set("k", text) is False
+    assert cache.get("k") is None
+    assert cache.stats["skipped"] == 5 and cache.stats["writes"] == 0
+    assert cache.set("k", "Rain on the tin roof, a sparrow counts the drops.") is True
+
+
+def test_keys_depend_on_prompt_model_and_params():
+    key = LLMCache.make_key("prompt", "apifreellm", {"stop": None})
+    assert key == LLMCache.make_key("prompt", "apifreellm", {"stop": None})
+    assert key != LLMCache.make_key("prompt ", "apifreellm", {"stop": None})
+    assert key != LLMCache.make_key("prompt", "other", {"stop": None})
+    assert key != LLMCache.make_key("prompt", "apifreellm", {"stop": ["\n"]})
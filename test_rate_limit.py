@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from email.utils import formatdate
+
+import pytest
+
+import rate_limit
+from free_llm import FreeLLMClient
+from rate_limit import RateLimiter, get_rate_limiter, parse_retry_after
+from stub_servers import FreeLLMStub
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: now[0])
+    return now
+
+
+def test_processes_sharing_a_file_share_one_bucket(tmp_path, clock):
+    path = str(tmp_path / "bucket.sqlite")
+    app, brain = RateLimiter("key", 6, burst=2, path=path), RateLimiter("key", 6, burst=2, path=path)
+    assert app.try_acquire() == 0 and brain.try_acquire() == 0
+    assert app.try_acquire() == pytest.approx(10.0)  # 6 rpm: one token every 10 s
+    assert RateLimiter("other", 6, burst=2, path=path).try_acquire() == 0
+    clock[0] += 10
+    assert brain.try_acquire() == 0 and app.try_acquire() > 0
+
+
+def test_block_for_pauses_every_caller_and_never_shortens_a_block(tmp_path, clock):
+    path = str(tmp_path / "bucket.sqlite")
+    app, brain = RateLimiter("key", 600, burst=5, path=path), RateLimiter("key", 600, burst=5, path=path)
+    app.block_for(30)
+    brain.block_for(5)
+    assert brain.try_acquire() == pytest.approx(30.0)
+    clock[0] += 30
+    # after the block a single call goes through, not the whole burst
+    assert app.try_acquire() == 0
+    assert brain.try_acquire() == pytest.approx(0.1)
+    assert app.stats["blocks"] == brain.stats["blocks"] == 1
+
+
+@pytest.mark.parametrize("value,expected", [("5", 5.0), ("0.5", 0.5), ("-3", 0.0), ("", None), (None, None),
+                                            ("soon", None)])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    assert parse_retry_after(formatdate(1060.0, usegmt=True), now=1000.0) == pytest.approx(60.0)
+    assert parse_retry_after(formatdate(900.0, usegmt=True), now=1000.0) == 0.0
+
+
+def test_retry_after_blocks_the_shared_limiter(monkeypatch):
+    monkeypatch.setenv("FREELLM_RPM", "6000")
+    monkeypatch.setenv("FREELLM_RATE_DB", "memory")
+    monkeypatch.setenv("TELEMETRY_JSONL", "off")
+    monkeypatch.delenv("FREELLM_CACHE", raising=False)
+    with FreeLLMStub(rate_limit_every=2, retry_after=0.3) as stub:
+        client = FreeLLMClient(api_key="stub-retry-after", endpoint=stub.url)
+        limiter = get_rate_limiter(client.api_key, client.endpoint)
+        assert client.complete("hello") and client.complete("hello")
+    assert stub.stats["rate_limited"] == 1
+    assert limiter.stats["blocks"] == 1
+    assert limiter.stats["waited_s"] >= 0.25  # the retry waited for Retry-After on the limiter
+
+
+def test_aacquire_keeps_sqlite_off_the_event_loop(tmp_path):
+    limiter = RateLimiter("key", 6000, burst=1, path=str(tmp_path / "bucket.sqlite"))
+    threads = []
+    try_acquire = limiter.try_acquire
+    limiter.try_acquire = lambda: threads.append(threading.get_ident()) or try_acquire()
+
+    async def main():
+        return await limiter.aacquire(), await limiter.aacquire(), threading.get_ident()
+
+    first, second, loop_thread = asyncio.run(main())
+    assert first == 0 and second > 0
+    assert threads and loop_thread not in threads
@@ -0,0 +1,97 @@
+import time
+
+from poet_engine import PoetryAgent, Refinement, clean_draft, clean_technical_noise, parse_refinement, split_fused
+
+FULL_PACK = """
+[SECTION_EVALUATION]
+## 📊 VALUTAZIONE INIZIALE
+**Voto Iniziale:** 6/10
+**Spiegazione:** Good start but needs work.
+
+[SECTION_POEM]
+## ✍️ POESIA RIVISTA
+## [RECONSTRUCTION_ID]
+[RECONSTRUCTED_CONTENT]
+This is the poem text.
+It is very nice.
+[/AUDIT_END]
+[SECTION_NOTES]
+## 📊 VALUTAZIONE FINALE
+**Voto Finale:** 8.5/10
+**Spiegazione:** Much better now.
+[/SECTION]
+[/AUDIT_END]
+"""
+
+
+def test_full_pack():
+    result = parse_refinement(FULL_PACK, draft="draft")
+    assert isinstance(result, Refinement)
+    assert result.poem == "This is the poem text.\nIt is very nice."
+    assert result.corrections == "Good start but needs work."
+    assert result.notes == "Much better now."
+    assert (result.initial_score, result.final_score) == (6.0, 8.5)
+
+
+def test_truncated_pack():
+    result = parse_refinement("[SECTION_EVALUATION]\nAnalysis...\n[SECTION_POEM]\n## [RECONSTRUCTION_ID]\n"
+                              "[RECONSTRUCTED_CONTENT]\nOnly the poem here.\n[/AUDIT_END]\n")
+    assert result.poem == "Only the poem here."
+    assert result.corrections == "Analysis..."
+    assert result.notes == ""
+    assert (result.initial_score, result.final_score) == (5.0, 5.0)
+
+
+def test_missing_section_tags():
+    result = parse_refinement("I have analyzed the poem.\n[RECONSTRUCTED_CONTENT]\nThe Actual Poem\nIs Here\n[/AUDIT_END]\n")
+    assert result.poem == "The Actual Poem\nIs Here"
+    assert result.corrections == ""
+
+
+def test_heading_fallback_and_generic_score():
+    pack = ("## 📊 VALUTAZIONE INIZIALE\nToo many adjectives in the second stanza.\n"
+            "## ✍️ POESIA RIVISTA\nline a\nline b\n## 📊 VALUTAZIONE FINALE\nVoto: 7/10\nTighter now.")
+    result = parse_refinement(pack, draft="draft")
+    assert result.poem == "line a\nline b"
+    assert result.corrections == "Too many adjectives in the second stanza."
+    assert result.notes == "Voto: 7/10\nTighter now."
+    assert (result.initial_score, result.final_score) == (7.0, 7.0)
+
+
+def test_unparseable_output_keeps_draft():
+    result = parse_refinement("The API returned something else entirely.", draft="the original draft")
+    assert result.poem == "the original draft"
+    assert (result.corrections, result.notes) == ("", "")
+    assert parse_refinement(None, draft="d").poem == "d"
+
+
+def test_clean_draft():
+    raw = "## [RECONSTRUCTION_ID]\n[RECONSTRUCTED_CONTENT]\nfirst verse\n[LINE_02] second verse\n[/DATA_SYNTHESIS_END]\ntrailing"
+    assert clean_draft(raw) == "first verse\n second verse"
+    assert clean_draft("## [RECONSTRUCTION_ID]\nplain verse") == "plain verse"
+
+
+def test_split_fused():
+    draft, pack = split_fused("[SECTION_DRAFT]\n## [RECONSTRUCTION_ID]\n[RAW_PAYLOAD]\nfirst verse\n" + FULL_PACK)
+    assert draft == "first verse"
+    assert pack.startswith("[SECTION_EVALUATION]")
+    assert parse_refinement(pack, draft=draft).final_score == 8.5
+    assert split_fused("[SECTION_DRAFT]\nonly a draft") == ("only a draft", "")
+
+
+def test_noise_cleanup_keeps_regular_brackets():
+    assert clean_technical_noise("[SECTION_POEM]\nthe sea [softly]\n[/audit_end]") == "the sea [softly]"
+
+
+def test_parse_critic_score_uses_parser():
+    assert PoetryAgent.parse_critic_score(None, FULL_PACK, type="iniziale") == 6.0
+    assert PoetryAgent.parse_critic_score(None, FULL_PACK) == 8.5
+    assert PoetryAgent.parse_critic_score(None, "no score") == 5.0
+
+
+def test_malformed_input_is_linear():
+    # Repeated openings without their closing marker made the old lazy regexes quadratic
+    pack = "[SECTION_EVALUATION] [RECONSTRUCTED_CONTENT] VALUTAZIONE INIZIALE x\n" * 20000
+    start = time.perf_counter()
+    parse_refinement(pack)
+    assert time.perf_counter() - start < 2.0
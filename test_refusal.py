@@ -0,0 +1,54 @@
+import refusal
+import telemetry
+from refusal import BRAIN, CACHE, DRAFT, MODERATION, UI_DRAFT, RefusalDetector, refusal_stats
+
+
+def test_start_phrases_only_fire_at_the_start():
+    hit = DRAFT.detect("  I'm sorry, but I can't write that poem.")
+    assert (hit.rule, hit.phrase, hit.position) == ("start", "I'm sorry", 2)
+    assert DRAFT.detect("The gull said I'm sorry to the tide,\nand the tide forgave.") is None
+
+
+def test_draft_and_ui_draft_screen_different_things():
+    # UI_DRAFT: pipeline errors at the start, chat deflections anywhere
+    assert UI_DRAFT.detect("API ERROR after 3 attempts: 503").rule == "start"
+    assert DRAFT.detect("API ERROR after 3 attempts: 503") is None
+    mid = "Rain on tin.\nI'm sorry, I am not able to discuss that."
+    assert UI_DRAFT.detect(mid).phrase == "I'm sorry"
+    assert DRAFT.detect(mid) is None
+    # DRAFT: the model talking about itself, anywhere
+    assert DRAFT.detect("Rain on tin, written by an AI assistant.").phrase == "ai assistant"
+    assert UI_DRAFT.detect("Rain on tin, written by an AI assistant.") is None
+
+
+def test_self_description_pattern():
+    hit = DRAFT.detect("Honestly? I'm only a poetry model, so")
+    assert (hit.rule, hit.phrase) == ("ai self-description", "ai self-description")
+    assert BRAIN.detect("Well, I'm a model trained by Meta").rule == "ai self-description"
+    assert DRAFT.detect("I'm modelling clay into a heron") is None
+
+
+def test_matching_ignores_case_and_curly_apostrophes():
+    assert CACHE.detect("i’M SORRY, no.").phrase == "I'm sorry"
+    assert BRAIN.detect("This reply is helpful and kind") is None  # "help" needs a word boundary
+    assert MODERATION.detect("We apologise for the tide").rule == "apology"
+
+
+def test_stats_count_checks_and_phrases():
+    detector = RefusalDetector("test", ("Sorry",), ("openai",))
+    detector.detect("Sorry.")
+    detector.detect("trained by OpenAI")
+    detector.detect("a clean poem")
+    assert detector.stats["checked"] == 3 and detector.stats["refusals"] == 2
+    assert dict(detector.stats["rules"]) == {"Sorry": 1, "openai": 1}
+
+
+def test_refusal_stats_are_exported_to_prometheus(monkeypatch):
+    monkeypatch.setitem(refusal.DETECTORS, "test", RefusalDetector("test", ("Sorry",), patterns={'say "no"': r"\bno\b"}))
+    refusal.DETECTORS["test"].detect("Sorry.")
+    refusal.DETECTORS["test"].detect("no")
+    assert refusal_stats()["test"] == {"checked": 2, "refusals": 2, "rules": {"Sorry": 1, 'say "no"': 1}}
+    text = telemetry.prometheus_text()
+    assert 'palimpsest_refusal_checks_total{stage="test"} 2' in text
+    assert 'palimpsest_refusals_total{stage="test",phrase="Sorry"} 1' in text
+    assert 'palimpsest_refusals_total{stage="test",phrase="say \\"no\\""} 1' in text
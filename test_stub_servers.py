@@ -0,0 +1,234 @@
+import pytest
+import requests
+
+import free_llm
+from free_llm import FreeLLMClient, StreamInterrupted
+from llm_cache import LLMCache
+from moltbook import MoltbookClient
+from stub_servers import FreeLLMStub, MoltbookStub, STUB_DRAFT, solve_stub_riddle
+
+
+@pytest.fixture(autouse=True)
+def offline_env(monkeypatch):
+    monkeypatch.setenv("FREELLM_RPM", "0")
+    monkeypatch.setenv("TELEMETRY_JSONL", "off")
+    monkeypatch.delenv("FREELLM_CACHE", raising=False)
+
+
+def test_freellm_stub_answers_like_the_api():
+    with FreeLLMStub() as stub:
+        client = FreeLLMClient(api_key="stub", endpoint=stub.url)
+        assert client.complete("[DATA_SYNTHESIS_UNIT_L9] the sea") == STUB_DRAFT
+        res = requests.post(stub.url, json={"message": "x"})
+        assert res.status_code == 401 and res.json()["success"] is False
+
+
+def test_freellm_stub_rate_limits_and_refuses():
+    with FreeLLMStub(rate_limit_every=2, retry_after=0, refusal_rate=1.0, seed=1) as stub:
+        client = FreeLLMClient(api_key="stub", endpoint=stub.url)
+        assert client.complete("hello").startswith("I'm sorry")
+        assert client.complete("hello").startswith("I'm sorry")  # 429 first, then answered
+        assert stub.stats["rate_limited"] == 1
+        assert stub.stats["refusals"] == 2
+
+
+def test_freellm_stub_streams_server_sent_events():
+    with FreeLLMStub(stream=True) as stub:
+        pieces = list(FreeLLMClient(api_key="stub", endpoint=stub.url).stream("[DATA_SYNTHESIS_UNIT_L9]"))
+    assert len(pieces) > 1
+    assert "".join(pieces) == STUB_DRAFT
+
+
+def _broken_stream(pieces):
+    def iter_pieces(response, content_type):
+        yield from pieces
+        raise requests.ConnectionError("connection reset by peer")
+    return iter_pieces
+
+
+def test_interrupted_stream_is_not_cached_or_returned_as_complete(monkeypatch):
+    monkeypatch.setattr(free_llm, "_iter_stream_pieces", _broken_stream(["The tide ", "keeps "]))
+    cache = LLMCache()
+    with FreeLLMStub(stream=True) as stub:
+        client = FreeLLMClient(api_key="stub", endpoint=stub.url, response_cache=cache)
+        received = []
+        with pytest.raises(StreamInterrupted) as info:
+            for piece in client.stream("[DATA_SYNTHESIS_UNIT_L9]"):
+                received.append(piece)
+    assert received == ["The tide ", "keeps "] and info.value.partial == "The tide keeps "
+    assert cache.stats["writes"] == 0
+
+
+def test_stream_failing_before_the_first_piece_falls_back_to_a_blocking_call(monkeypatch):
+    monkeypatch.setattr(free_llm, "_iter_stream_pieces", _broken_stream([]))
+    with FreeLLMStub(stream=True) as stub:
+        client = FreeLLMClient(api_key="stub", endpoint=stub.url)
+        assert list(client.stream("[DATA_SYNTHESIS_UNIT_L9]")) == [STUB_DRAFT]
+        assert stub.stats["requests"] == 2
+
+
+def test_interrupted_draft_stream_falls_back_to_a_blocking_call(monkeypatch):
+    from poet_engine import FreeLLM, PoetryAgent
+
+    monkeypatch.setattr(free_llm, "_iter_stream_pieces", _broken_stream(["The tide "]))
+    with FreeLLMStub(stream=True) as stub:
+        monkeypatch.setenv("FREELLM_ENDPOINT", stub.url)
+        monkeypatch.setenv("FREELLM_API_KEY", "stub")
+        agent = PoetryAgent.__new__(PoetryAgent)
+        agent.llm = FreeLLM()
+        partials = []
+        chain, inputs = agent._draft_request("the sea", "context", "Modernism", "English", 5, 5, 5)
+        assert agent._run_chain(chain, inputs, partials.append) == STUB_DRAFT
+        assert stub.stats["requests"] == 2
+    assert partials == ["The tide ", STUB_DRAFT]
+
+
+def test_interrupted_async_stream_falls_back_to_ainvoke(monkeypatch):
+    import asyncio
+    from poet_engine import FreeLLM, PoetryAgent
+
+    monkeypatch.setattr(free_llm, "_iter_stream_pieces", _broken_stream(["The tide "]))
+    with FreeLLMStub(stream=True) as stub:
+        monkeypatch.setenv("FREELLM_ENDPOINT", stub.url)
+        monkeypatch.setenv("FREELLM_API_KEY", "stub")
+        agent = PoetryAgent.__new__(PoetryAgent)
+        agent.llm = FreeLLM()
+        partials = []
+        chain, inputs = agent._draft_request("the sea", "context", "Modernism", "English", 5, 5, 5)
+        assert asyncio.run(agent._arun_chain(chain, inputs, partials.append)) == STUB_DRAFT
+        assert stub.stats["requests"] == 2
+    assert partials == ["The tide ", STUB_DRAFT]
+
+
+def test_speculative_and_fused_pipelines_against_stub(monkeypatch):
+    from poet_engine import FreeLLM, PoetryAgent, parse_refinement
+
+    with FreeLLMStub() as stub:
+        monkeypatch.setenv("FREELLM_ENDPOINT", stub.url)
+        monkeypatch.setenv("FREELLM_API_KEY", "stub")
+        agent = PoetryAgent.__new__(PoetryAgent)  # drafting/refining need no embeddings
+        agent.llm = FreeLLM()
+
+        partials = []
+        pending = agent.start_refinement("a draft", "context", "Modernism")
+        assert parse_refinement(pending.wait(on_partial=partials.append, poll_interval=0.01)).final_score == 8.0
+
+        before = stub.stats["requests"]
+        draft, pack = agent.compose_fused("the sea", "context", "Modernism")
+        assert stub.stats["requests"] - before == 1
+        assert draft.startswith("The tide keeps a ledger")
+        assert parse_refinement(pack, draft=draft).final_score == 8.0
+
+
+def test_moltbook_stub_verified_post_roundtrip():
+    with MoltbookStub(require_verification=True, seed_posts=3) as stub:
+        client = MoltbookClient(base_url=stub.base_url)
+        client.api_key, client.headers["Authorization"] = "stub", "Bearer stub"
+        assert client.get_heartbeat()["status"] == "claimed"
+
+        res = client.post("A fragment", title="Test")
+        assert res["verification_required"]
+        assert len(client.get_feed(limit=10, sort="new")) == 3  # unverified posts stay hidden
+        answer = solve_stub_riddle(res["verification"]["challenge"])
+        assert client.verify_post(res["verification"]["code"], f"{answer:.2f}")["success"]
+
+        feed = client.get_feed(limit=10, sort="new")
+        assert feed[0]["content"] == "A fragment"
+        my_id = client.get_me()["agent"]["id"]
+        assert [p["id"] for p in client.get_agent_posts(my_id)["posts"]] == [feed[0]["id"]]
+        assert client.delete_post(feed[0]["id"])["success"]
+        assert len(client.get_feed(limit=10)) == 3
+
+
+def test_brain_cycle_against_stubs(monkeypatch):
+    import molt_brain
+
+    with FreeLLMStub() as llm, MoltbookStub(require_verification=True) as molt:
+        monkeypatch.setenv("FREELLM_ENDPOINT", llm.url)
+        monkeypatch.setenv("FREELLM_API_KEY", "stub")
+        monkeypatch.setenv("MOLTBOOK_API_URL", molt.base_url)
+        monkeypatch.setenv("MOLTBOOK_API_KEY", "stub")
+        assert molt_brain.run_single_cycle() == "✅ Verified & Published!"
+
+
+def test_moltbook_client_times_out_retries_gets_and_raises(monkeypatch):
+    from moltbook import MoltbookError
+
+    monkeypatch.setattr("moltbook.backoff_delay", lambda attempt, base: 0.0)
+    with MoltbookStub(latency_s=0.3) as stub:
+        client = MoltbookClient(base_url=stub.base_url, read_timeout=0.05)
+        client.api_key, client.headers["Authorization"] = "stub", "Bearer stub"
+        with pytest.raises(MoltbookError) as timed_out:
+            client.get_feed()
+        assert timed_out.value.status is None and stub.stats["requests"] == 3
+
+        stub.latency_s = 0.0
+        client.headers["Authorization"] = ""
+        with pytest.raises(MoltbookError) as unauthorized:
+            client.get_heartbeat()
+        assert unauthorized.value.status == 401 and stub.stats["requests"] == 4  # 4xx is not retried
+        assert client.post("A fragment")["success"] is False  # write calls return the API's answer
+
+
+def test_heartbeat_cache_serves_last_status_and_refreshes_in_background():
+    from moltbook import HeartbeatCache
+
+    with MoltbookStub(latency_s=0.2) as stub:
+        client = MoltbookClient(base_url=stub.base_url)
+        client.api_key, client.headers["Authorization"] = "stub", "Bearer stub"
+        cache = HeartbeatCache(client, ttl_s=60.0)
+
+        assert cache.snapshot()["fetched_at"] is None  # returns at once, the fetch runs behind it
+        fresh = cache.refresh(wait=True, timeout=5.0)
+        assert fresh["heartbeat"]["status"] == "claimed" and fresh["profile"]["agent"]["name"]
+        requests_made = stub.stats["requests"]
+        assert cache.snapshot() == fresh and stub.stats["requests"] == requests_made  # within the TTL
+
+        stub.latency_s, client.read_timeout = 1.0, 0.1  # Moltbook hangs: the last status stays, with the error
+        failed = cache.refresh(wait=True, timeout=10.0)
+        assert failed["heartbeat"] == fresh["heartbeat"] and failed["error"]
+
+
+def test_iter_feed_pages_with_offsets_and_prefetch():
+    with MoltbookStub(seed_posts=120) as stub:
+        client = MoltbookClient(base_url=stub.base_url)
+        client.api_key, client.headers["Authorization"] = "stub", "Bearer stub"
+        ids = [p["id"] for p in client.iter_feed(sort="new", page_size=25)]
+        assert ids == [p["id"] for p in stub.posts] and stub.stats["requests"] == 5
+
+        assert len(list(client.iter_feed(page_size=25, max_posts=30))) == 30
+        own = list(client.iter_agent_posts("agent-0", page_size=7, prefetch=False))
+        assert len(own) == 40 and all(p["author"]["id"] == "agent-0" for p in own)
+
+
+def test_iter_feed_follows_cursors_and_skips_shifted_posts():
+    pages = {None: {"posts": [{"id": 1}, {"id": 2}], "next_cursor": "c2"},
+             "c2": {"posts": [{"id": 2}, {"id": 3}], "next_cursor": "c3"},
+             "c3": {"posts": [{"id": 4}], "has_more": False}}
+    client = MoltbookClient(base_url="http://127.0.0.1:9")
+    client.api_key = "stub"
+    client._request = lambda method, path, endpoint, params: pages[params.get("cursor")]
+    assert [p["id"] for p in client.iter_feed(page_size=2)] == [1, 2, 3, 4]
+
+
+class OffsetIgnoringStub(MoltbookStub):
+    @staticmethod
+    def _page(posts, query, limit):
+        return {"success": True, "posts": posts[:limit], "has_more": True}
+
+
+def test_iter_feed_stops_when_the_server_ignores_paging():
+    with OffsetIgnoringStub(seed_posts=30) as stub:
+        client = MoltbookClient(base_url=stub.base_url)
+        client.api_key, client.headers["Authorization"] = "stub", "Bearer stub"
+        ids = [p["id"] for p in client.iter_feed(page_size=10)]
+        assert ids == [p["id"] for p in stub.posts[:10]] and stub.stats["requests"] == 2
+
+    pages = {None: {"posts": [{"id": 1}], "next_cursor": "c2"},
+             "c2": {"posts": [{"id": 2}], "next_cursor": "c2"}}
+    client = MoltbookClient(base_url="http://127.0.0.1:9")
+    client.api_key = "stub"
+    calls = []
+    client._request = lambda method, path, endpoint, params: calls.append(params.get("cursor")) or pages[params.get("cursor")]
+    assert [p["id"] for p in client.iter_feed(page_size=1, prefetch=False)] == [1, 2]
+    assert calls == [None, "c2"]
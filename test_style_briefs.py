@@ -0,0 +1,47 @@
+import os
+import re
+
+import pytest
+
+from style_briefs import collect_styles, extract_brief
+
+KB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base")
+STYLES = collect_styles(KB)
+
+
+def _section(brief, header):
+    return brief.split(header, 1)[1].split("**", 1)[0].strip()
+
+
+@pytest.mark.parametrize("style", sorted(STYLES))
+def test_no_brief_section_is_empty(style):
+    brief = extract_brief(style, STYLES[style][1])
+    for header in ("**📐 METRIC RULES**", "**🎯 TECHNIQUES**", "**🎭 ESSENCE**"):
+        if header in brief or header != "**📐 METRIC RULES**":
+            assert _section(brief, header).strip("-\n "), f"{style}: empty {header}"
+    assert "not codified" not in brief
+
+
+def test_styles_without_a_metric_rule_get_no_invented_one():
+    brief = extract_brief("Barocco / Marinismo", STYLES["Barocco / Marinismo"][1])
+    assert "**📐 METRIC RULES**" not in brief and "Verse:" not in brief
+    assert brief.startswith("---\n**🎯 TECHNIQUES**")
+
+
+def test_metric_rules_come_from_the_key_characteristic():
+    metric = _section(extract_brief("The Sonnet", STYLES["The Sonnet"][1]), "**📐 METRIC RULES**")
+    assert "- 14 lines" in metric and "- Volta (Turn)" in metric
+    assert metric.count("Iambic Pentameter") == 1  # the technique of the same name is not repeated
+
+
+def test_ideology_and_themes_stay_out_of_metric_rules():
+    stilnovo = _section(extract_brief("Stilnovo", STYLES["Stilnovo"][1]), "**📐 METRIC RULES**")
+    assert stilnovo == "- Sonetto, canzone, ballata"  # not "la donna come tramite verso Dio"
+    sonnet = _section(extract_brief("The Sonnet", STYLES["The Sonnet"][1]), "**📐 METRIC RULES**")
+    assert "Compressed emotion" not in sonnet
+
+
+def test_exemplars_are_attributed_not_paired_with_techniques():
+    brief = extract_brief("The Sonnet", STYLES["The Sonnet"][1])
+    assert '- Exemplar (William Shakespeare, Sonnet 18): "Shall I compare thee' in brief
+    assert not re.search(r'^\d+\. .*: "', brief, re.MULTILINE)
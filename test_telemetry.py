@@ -0,0 +1,104 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+
+import telemetry
+
+
+@pytest.fixture
+def name():
+    """A span name of its own: the Prometheus aggregates are process wide."""
+    return f"test_{uuid.uuid4().hex[:8]}"
+
+
+def test_spans_nest_under_the_trace(monkeypatch):
+    monkeypatch.delenv("TELEMETRY_JSONL", raising=False)
+    with telemetry.trace("generation", style="Ermetismo") as tr:
+        with telemetry.span("draft") as draft:
+            with telemetry.span("llm.call", retries=1) as call:
+                pass
+            telemetry.annotate(candidates=2)
+        telemetry.record("llm.wait", 0.25, reason="rate_limit")
+
+    # record() backdates its span, so the wait sorts first in the waterfall
+    assert [(n, depth) for n, _, _, depth, _ in tr.waterfall()] == [
+        ("llm.wait", 1), ("generation", 0), ("draft", 1), ("llm.call", 2)]
+    assert call.parent_id == draft.span_id and draft.parent_id == tr.root.span_id
+    assert {s.trace_id for s in tr.spans} == {tr.trace_id}
+    assert draft.attrs == {"candidates": 2}
+    offsets = {n: (offset, duration) for n, offset, duration, _, _ in tr.waterfall()}
+    assert offsets["llm.wait"] == (0.0, 0.25)
+    assert 0.0 < offsets["generation"][0] <= offsets["draft"][0] <= offsets["llm.call"][0]
+
+
+def test_spans_follow_awaits_and_stop_at_the_trace_end():
+    @telemetry.traced("stage")
+    async def stage():
+        await asyncio.sleep(0)
+        with telemetry.span("inner"):
+            await asyncio.sleep(0)
+        return "poem"
+
+    async def main():
+        with telemetry.trace("batch_job") as tr:
+            await asyncio.gather(stage(), stage())
+        return tr
+
+    tr = asyncio.run(main())
+    depths = sorted((n, d) for n, _, _, d, _ in tr.waterfall())
+    assert depths == [("batch_job", 0), ("inner", 2), ("inner", 2), ("stage", 1), ("stage", 1)]
+    assert all(attrs.get("response_chars") == 4 for n, _, _, _, attrs in tr.waterfall() if n == "stage")
+    with telemetry.span("outside") as sp:
+        pass
+    assert sp.trace is None and len(tr.spans) == 5
+
+
+def test_trace_total_sums_numeric_attributes():
+    with telemetry.trace("batch_job") as tr:
+        with telemetry.span("research", context_tokens_saved=120):
+            pass
+        with telemetry.span("draft", context_tokens_saved=30):
+            with telemetry.span("llm.call", context_tokens_saved="n/a"):
+                pass
+        with telemetry.span("refine"):
+            pass
+    assert tr.total("context_tokens_saved") == 150
+    assert tr.total("missing") == 0
+
+
+def test_prometheus_text_aggregates_spans(name):
+    for retries in (0, 2):
+        with telemetry.span(name, retries=retries, prompt_chars=100):
+            pass
+    with pytest.raises(ValueError):
+        with telemetry.span(name):
+            raise ValueError("boom")
+
+    lines = telemetry.prometheus_text().splitlines()
+    assert f'palimpsest_span_seconds_count{{span="{name}"}} 3' in lines
+    assert f'palimpsest_span_errors_total{{span="{name}"}} 1' in lines
+    assert f'palimpsest_span_attr_total{{span="{name}",attr="retries"}} 2' in lines
+    assert f'palimpsest_span_attr_total{{span="{name}",attr="prompt_chars"}} 200' in lines
+    assert "# TYPE palimpsest_span_seconds summary" in lines
+
+
+def test_jsonl_sink_is_opt_in(tmp_path, monkeypatch, name):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("TELEMETRY_JSONL", raising=False)
+    assert telemetry._jsonl_path() is None
+    with telemetry.span(name):
+        pass
+    assert list(tmp_path.iterdir()) == []
+
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setenv("TELEMETRY_JSONL", str(path))
+    with telemetry.trace(name) as tr:
+        with telemetry.span("child", retries=1):
+            pass
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["name"] for r in records] == ["child", name]
+    assert records[0]["parent_id"] == records[1]["span_id"] and records[0]["trace_id"] == tr.trace_id
+    monkeypatch.setenv("TELEMETRY_JSONL", "off")
+    assert telemetry._jsonl_path() is None